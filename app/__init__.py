@@ -12,13 +12,16 @@ def create_app():
     app.register_blueprint(api, url_prefix='/api')
     from app.routes import main_bp
     app.register_blueprint(main_bp)
+    # 每个请求共用一个数据库会话，请求结束时关闭并归还连接
+    from app.database import remove_session
+    app.teardown_appcontext(remove_session)
     return app
 
 app = create_app()
 logger = logging.getLogger(__name__)
 logger.debug("app/__init__.py loaded, app id: %s", id(app))
 
-from app.engine import engine_instance
+from app.engine import engine_instance, engine_sessions
 
 # 使用Config.UPLOAD_FOLDER
 app.config['UPLOAD_FOLDER'] = Config.UPLOAD_FOLDER
@@ -27,11 +30,14 @@ def cleanup_engine():
     """
     清理引擎资源
     """
-    if hasattr(engine_instance, 'close'):
-        try:
-            engine_instance.close()
-        except Exception as e:
-            logging.getLogger().error(f"Error during engine shutdown: {e}")
+    try:
+        engine_sessions.close()
+    except Exception as e:
+        logging.getLogger().error(f"Error during engine session shutdown: {e}")
+    try:
+        engine_instance.close()
+    except Exception as e:
+        logging.getLogger().error(f"Error during engine shutdown: {e}")
 
 # 注册引擎清理函数（优先级较高，在日志关闭之前执行）
 shutdown_manager.register(cleanup_engine, priority=100)
@@ -1,6 +1,9 @@
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, List, Optional
 import re
 
+from app import fen as fen_codec
+from app.notation import FileIndex, format_move, notation_key, split_record
+
 def is_valid_move_format(move: str) -> bool:
     """
     检查着法格式是否为 'a1a2'
@@ -21,6 +24,9 @@ class ChessPiece:
         return {"name": self.name, "color": self.color, "position": self.position}
 
 class ChessBoard:
+    # 直进直退时末尾写步数的棋子
+    STRAIGHT_PIECES = frozenset(['车', '炮', '兵', '卒', '帅', '将'])
+
     def __init__(self, fen_str: Optional[str] = None):
         self.pieces: Dict[Tuple[int, int], ChessPiece] = {}
         self.player_to_move = 'red'
@@ -78,15 +84,16 @@ class ChessBoard:
     def move_piece(self, from_pos: tuple, to_pos: tuple) -> str:
         if from_pos not in self.pieces:
             raise ValueError(f"起始位置 {from_pos} 没有棋子")
-        piece_to_move = self.pieces[from_pos]
-        notation = self.get_move_notation(piece_to_move, to_pos)
-        if to_pos in self.pieces:
-            del self.pieces[to_pos]
-        del self.pieces[from_pos]
+        notation = self.get_move_notation(self.pieces[from_pos], to_pos)
+        self._apply_move(from_pos, to_pos)
+        return notation
+
+    def _apply_move(self, from_pos: tuple, to_pos: tuple):
+        piece_to_move = self.pieces.pop(from_pos)
+        self.pieces.pop(to_pos, None)
         piece_to_move.position = to_pos
         self.pieces[to_pos] = piece_to_move
         self.player_to_move = 'black' if self.player_to_move == 'red' else 'red'
-        return notation
 
     def get_board_state(self) -> str:
         board = [['┼' for _ in range(9)] for _ in range(10)]
@@ -100,25 +107,13 @@ class ChessBoard:
         return board_str
 
     def to_fen(self) -> str:
-        fen_parts = []
-        y_iterator = range(10) if self.red_at_top else reversed(range(10))
-        for y in y_iterator:
-            empty_count = 0
-            row_fen = ""
-            for x in range(9):
-                pos = (x, y)
-                if pos in self.pieces:
-                    if empty_count > 0:
-                        row_fen += str(empty_count)
-                        empty_count = 0
-                    piece = self.pieces[pos]
-                    row_fen += self.piece_to_char.get((piece.name, piece.color), '?')
-                else:
-                    empty_count += 1
-            if empty_count > 0:
-                row_fen += str(empty_count)
-            fen_parts.append(row_fen)
-        board_fen = "/".join(fen_parts)
+        grid = [[fen_codec.EMPTY] * 9 for _ in range(10)]
+        for (x, y), piece in self.pieces.items():
+            if 0 <= x < 9 and 0 <= y < 10:
+                grid[y][x] = self.piece_to_char.get((piece.name, piece.color), '?')
+        # grid 按 y 从小到大排列；红方在下时 FEN 第一段是 y=9
+        rows = grid if self.red_at_top else grid[::-1]
+        board_fen = fen_codec.board_to_fen(rows)
         player_char = 'w' if self.player_to_move == 'red' else 'b'
         return f"{board_fen} {player_char}"
 
@@ -128,87 +123,73 @@ class ChessBoard:
     def _parse_fen(self, fen_str: str):
         self.pieces.clear()
         parts = fen_str.split()
-        board_layout = parts[0].split('/')
         self.player_to_move = 'red' if parts[1].lower() == 'w' else 'black'
-        for row_idx, fen_row in enumerate(board_layout):
-            row_idx = abs(row_idx - 9)
-            col_idx = 0
-            for char in fen_row:
-                if char.isdigit():
-                    col_idx += int(char)
-                else:
-                    piece_name, color = self.char_to_piece.get(char, ('?', '?'))
-                    if piece_name != '?':
-                        self.pieces[(col_idx, row_idx)] = ChessPiece(piece_name, color, (col_idx, row_idx))
-                    col_idx += 1
+        for row_idx, row in enumerate(fen_codec.parse_board(parts[0])):
+            y = 9 - row_idx
+            for x, char in enumerate(row):
+                if char == fen_codec.EMPTY:
+                    continue
+                piece_name, color = self.char_to_piece.get(char, ('?', '?'))
+                if piece_name != '?':
+                    self.pieces[(x, y)] = ChessPiece(piece_name, color, (x, y))
         self._determine_orientation()
 
     def fen_to_board_array(self, fen: str):
         """
         Converts the board part of a FEN string into a 10x9 2D array.
         """
-        board = []
-        parts = fen.split(' ')
-        fen_board = parts[0]
-        rows = fen_board.split('/')
-        for row_str in rows:
-            row = []
-            for char in row_str:
-                if char.isdigit():
-                    row.extend(['-'] * int(char))
-                else:
-                    row.append(char)
-            # Ensure each row has 9 columns for a valid Xiangqi board
-            if len(row) != 9:
-                raise ValueError("Invalid FEN row length")
-            board.append(row)
-        # Ensure the board has 10 rows
-        if len(board) != 10:
-            raise ValueError("Invalid FEN number of rows")
-        return board
+        return fen_codec.fen_to_board_array(fen)
     def get_move_notation(self, piece: 'ChessPiece', to_pos: tuple) -> str:
-        from_pos = piece.position
-        from_x, from_y = from_pos
+        ranks, by_file = self._file_context(piece)
+        return self._format_notation(piece, to_pos, ranks, by_file)
+
+    def _format_notation(self, piece: 'ChessPiece', to_pos: tuple, ranks: list, by_file: bool) -> str:
+        from_x, from_y = piece.position
         to_x, to_y = to_pos
+        return format_move(piece.name, from_x, from_y, to_x, to_y, piece.color == 'red',
+                           piece.name in self.STRAIGHT_PIECES, ranks, by_file)
 
-        # 红方使用中文数字，从右到左数
-        if piece.color == 'red':
-            from_file = 9 - from_x
-            to_file = 9 - to_x
-            from_file_char = self.chinese_nums[from_file - 1]
-            to_file_char = self.chinese_nums[to_file - 1]
-        else: # 黑方使用阿拉伯数字，从左到右数
-            from_file = from_x + 1
-            to_file = to_x + 1
-            from_file_char = str(from_file)
-            to_file_char = str(to_file)
-        # 判断移动类型
-        if to_x != from_x and to_y != from_y:
-            # 斜向移动（马、相、士等）
-            # 红方：y增大为进，y减小为退
-            # 黑方：y减小为进，y增大为退
-            is_advancing = (to_y > from_y) if piece.color == 'red' else (to_y < from_y)
-            action = "进" if is_advancing else "退"
-            dest_char = to_file_char
-        elif to_x != from_x:
-            # 横向移动
-            action = "平"
-            dest_char = to_file_char
-        else:
-            # 纵向移动
-            is_advancing = (to_y > from_y) if piece.color == 'red' else (to_y < from_y)
-            action = "进" if is_advancing else "退"
-            move_dist = abs(from_y - to_y)
-            if piece.color == 'red':
-                dest_char = self.chinese_nums[move_dist - 1]
-            else:
-                dest_char = str(move_dist)
-        piece_prefix = piece.name
-        same_col_pieces = [p for p in self.pieces.values() if p.name == piece.name and p.color == piece.color and p.position[0] == from_x and p.position != from_pos]
-        if same_col_pieces:
-            is_front = (from_y < same_col_pieces[0].position[1]) if piece.color == 'red' else (from_y > same_col_pieces[0].position[1])
-            piece_prefix = ('前' if is_front else '后') + piece.name
-        return f"{piece_prefix}{from_file_char}{action}{dest_char}"
+    def _file_context(self, piece: 'ChessPiece', index: Optional[FileIndex] = None):
+        """起点所在列上同名同色棋子的行号，以及是否要用列号代替棋子名（多列都有多个兵卒）"""
+        from_x = piece.position[0]
+        # 只查看起点所在的一列
+        ranks = []
+        for y in range(10):
+            other = self.pieces.get((from_x, y))
+            if other is not None and other.name == piece.name and other.color == piece.color:
+                ranks.append(y)
+        by_file = False
+        if len(ranks) > 1 and piece.name in ('兵', '卒'):
+            if index is None:
+                index = self._file_index(piece.color)
+            by_file = index.doubled_files(piece.name) > 1
+        return ranks, by_file
+
+    def _file_index(self, color: str) -> FileIndex:
+        return FileIndex((p.name, x, y) for (x, y), p in self.pieces.items() if p.color == color)
+
+    def notation_table(self, color: Optional[str] = None) -> Dict[str, tuple]:
+        """
+        当前局面下一方全部着法的记谱表：notation_key(中文记谱) -> (起点, 终点)
+
+        着法由 _get_piece_moves 生成，不排除走后己方被将军的着法。
+
+        Args:
+            color: 'red' 或 'black'，默认当前走子方
+        """
+        color = color or self.player_to_move
+        index = self._file_index(color)
+        table = {}
+        for pos, piece in list(self.pieces.items()):
+            if piece.color != color:
+                continue
+            targets = self._get_piece_moves(pos)
+            if not targets:
+                continue
+            ranks, by_file = self._file_context(piece, index)
+            for to_pos in targets:
+                table[notation_key(self._format_notation(piece, to_pos, ranks, by_file))] = (pos, to_pos)
+        return table
 
     def move_to_coords(self,move):
         """
@@ -306,176 +287,20 @@ class ChessBoard:
             print(f"An error occurred while handling UCCI move '{ucci_move}': {e}")
             traceback.print_exc()
 
-    def parse_chinese_notation(self, notation: str) -> tuple:
-        """解析中文记谱法，返回起始和目标坐标"""
-        # 棋子名称映射
-        piece_names = {
-            '车': '车', '马': '马', '相': '相', '象': '象', '仕': '仕', '士': '士', 
-            '帅': '帅', '将': '将', '炮': '炮', '兵': '兵', '卒': '卒'
-        }
-        # 中文数字映射
-        chinese_to_arabic = {
-            '一': 1, '二': 2, '三': 3, '四': 4, '五': 5,
-            '六': 6, '七': 7, '八': 8, '九': 9
-        }
-        # 阿拉伯数字映射
-        arabic_to_arabic = {str(i): i for i in range(1, 10)}
-        try:
-            # 确定是哪一方的棋子
-            is_red = False
-            for piece_name in ['相', '仕', '帅', '兵']:
-                if piece_name in notation:
-                    is_red = True
-                    break
-            # 提取棋子名称
-            piece_name = None
-            for name in piece_names:
-                if name in notation:
-                    piece_name = name
-                    break
-            if not piece_name:
-                raise ValueError("无法识别棋子名称")
-            # 提取起始位置
-            start_pos = None
-            for char in notation:
-                if char in chinese_to_arabic:
-                    if is_red:
-                        start_col = 9 - chinese_to_arabic[char]
-                    else:
-                        start_col = chinese_to_arabic[char] - 1
-                    start_pos = char
-                    break
-                elif char in arabic_to_arabic:
-                    if not is_red:
-                        start_col = arabic_to_arabic[char] - 1
-                        start_pos = char
-                        break
-            if not start_pos:
-                raise ValueError("无法识别起始位置")
-            # 确定起始行
-            if is_red:
-                if piece_name in ['车', '马', '相', '仕', '帅']:
-                    start_row = 0
-                elif piece_name == '炮':
-                    start_row = 2
-                elif piece_name == '兵':
-                    start_row = 3
-            else:
-                if piece_name in ['车', '马', '象', '士', '将']:
-                    start_row = 9
-                elif piece_name == '炮':
-                    start_row = 7
-                elif piece_name == '卒':
-                    start_row = 6
-            # 提取动作和目标位置
-            action = None
-            target_pos = None
-            if '进' in notation:
-                action = '进'
-                for char in notation[notation.index('进')+1:]:
-                    if char in chinese_to_arabic:
-                        if is_red:
-                            target_col = 9 - chinese_to_arabic[char]
-                        else:
-                            target_col = chinese_to_arabic[char] - 1
-                        target_pos = char
-                        break
-                    elif char in arabic_to_arabic:
-                        if not is_red:
-                            target_col = arabic_to_arabic[char] - 1
-                            target_pos = char
-                            break
-            elif '退' in notation:
-                action = '退'
-                for char in notation[notation.index('退')+1:]:
-                    if char in chinese_to_arabic:
-                        if is_red:
-                            target_col = 9 - chinese_to_arabic[char]
-                        else:
-                            target_col = chinese_to_arabic[char] - 1
-                        target_pos = char
-                        break
-                    elif char in arabic_to_arabic:
-                        if not is_red:
-                            target_col = arabic_to_arabic[char] - 1
-                            target_pos = char
-                            break
-            elif '平' in notation:
-                action = '平'
-                for char in notation[notation.index('平')+1:]:
-                    if char in chinese_to_arabic:
-                        if is_red:
-                            target_col = 9 - chinese_to_arabic[char]
-                        else:
-                            target_col = chinese_to_arabic[char] - 1
-                        target_pos = char
-                        break
-                    elif char in arabic_to_arabic:
-                        if not is_red:
-                            target_col = arabic_to_arabic[char] - 1
-                            target_pos = char
-                            break
-            if not action or not target_pos:
-                raise ValueError("无法识别动作或目标位置")
-            # 确定目标行和列
-            if action == '平':
-                target_row = start_row
-            else:
-                if action == '进':
-                    if piece_name in ['车', '炮', '兵', '卒']:
-                        target_col = start_col
-                        target_row_char = None
-                        for char in notation[notation.index('进')+1:]:
-                            if char in chinese_to_arabic:
-                                target_row_char = char
-                                break
-                            elif char in arabic_to_arabic:
-                                target_row_char = char
-                                break
-                        if target_row_char:
-                            if target_row_char in chinese_to_arabic:
-                                target_row = start_row + chinese_to_arabic[target_row_char]
-                            else:
-                                target_row = start_row + arabic_to_arabic[target_row_char]
-                        else:
-                            if is_red:
-                                target_row = start_row + 1
-                            else:
-                                target_row = start_row - 1
-                    else:
-                        if is_red:
-                            target_row = start_row + 1
-                        else:
-                            target_row = start_row - 1
-                else:  # action == '退'
-                    if piece_name in ['车', '炮', '兵', '卒']:
-                        target_col = start_col
-                        target_row_char = None
-                        for char in notation[notation.index('退')+1:]:
-                            if char in chinese_to_arabic:
-                                target_row_char = char
-                                break
-                            elif char in arabic_to_arabic:
-                                target_row_char = char
-                                break
-                        if target_row_char:
-                            if target_row_char in chinese_to_arabic:
-                                target_row = start_row - chinese_to_arabic[target_row_char]
-                            else:
-                                target_row = start_row - arabic_to_arabic[target_row_char]
-                        else:
-                            if is_red:
-                                target_row = start_row - 1
-                            else:
-                                target_row = start_row + 1
-                    else:
-                        if is_red:
-                            target_row = start_row - 1
-                        else:
-                            target_row = start_row + 1
-            return ((start_col, start_row), (target_col, target_row))
-        except Exception as e:
-            raise ValueError(f"解析记谱法失败: {e}")
+    def parse_chinese_notation(self, notation: str, color: Optional[str] = None) -> tuple:
+        """
+        解析中文记谱法，返回起始和目标坐标
+
+        在当前局面一方的全部着法中按记谱查表，红黑方棋子名、中文/阿拉伯/全角数字的写法都能识别。
+
+        Args:
+            notation: 中文记谱，如 "炮二平五"、"马8进7"、"前车进一"
+            color: 走子方，默认当前走子方
+        """
+        move = self.notation_table(color).get(notation_key(notation))
+        if move is None:
+            raise ValueError(f"解析记谱法失败: 当前局面没有着法 {notation}")
+        return move
 
     def engine_move_to_chinese_notation(self, engine_move: str) -> str:
         """
@@ -545,35 +370,32 @@ class ChessBoard:
         if piece.name in ['车', '炮']:
             # 车和炮的直线移动
             for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                path_clear = True
+                screened = False  # 炮是否已经越过炮架
                 for i in range(1, 10):
                     nx, ny = pos[0] + dx * i, pos[1] + dy * i
                     if not (0 <= nx < 9 and 0 <= ny < 10):
                         break
-                    
-                    if (nx, ny) not in self.pieces:
-                        if piece.name == '车':
+                    target = self.pieces.get((nx, ny))
+                    if target is None:
+                        if not screened:
                             moves.append((nx, ny))
-                    else:
-                        if piece.name == '车' and self.pieces[(nx, ny)].color != piece.color:
-                            moves.append((nx, ny)) # 车可以吃子
-                        
-                        if path_clear: # 炮的炮架
-                            path_clear = False
-                            continue
-
-                        if piece.name == '炮' and self.pieces[(nx, ny)].color != piece.color:
-                            moves.append((nx, ny)) # 炮翻山吃子
+                        continue
+                    if piece.name == '车' or screened:
+                        if target.color != piece.color:
+                            moves.append((nx, ny))  # 车直接吃子，炮翻山吃子
                         break
+                    screened = True
 
         elif piece.name == '马':
             # 马走日
             for dx, dy in [(1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1)]:
                 nx, ny = pos[0] + dx, pos[1] + dy
-                leg_x, leg_y = pos[0] + (1 if dx > 0 else -1 if dx < 0 else 0), pos[1] + (1 if dy > 0 else -1 if dy < 0 else 0)
-                if abs(dx) == 2: leg_x = pos[0] + (1 if dx>0 else -1)
-                else: leg_y = pos[1] + (1 if dy>0 else -1)
-                
+                # 马腿在长边方向上紧挨着马
+                if abs(dx) == 2:
+                    leg_x, leg_y = pos[0] + dx // 2, pos[1]
+                else:
+                    leg_x, leg_y = pos[0], pos[1] + dy // 2
+
                 if (leg_x, leg_y) in self.pieces: # 蹩马腿
                     continue
                 if 0 <= nx < 9 and 0 <= ny < 10:
@@ -656,4 +478,29 @@ class ChessBoard:
                          moves.append((pos[0] + 1, pos[1]))
 
         return moves
-    
\ No newline at end of file
+    
+
+def notation_record_to_ucci(record, fen_str: Optional[str] = None) -> List[str]:
+    """
+    把中文棋谱批量转换为 UCCI 着法（导入棋谱用）
+
+    Args:
+        record: 中文记谱列表，或 "1. 炮二平五 马8进7 2. ..." 这样的棋谱文本
+        fen_str: 起始局面，默认标准开局
+
+    Returns:
+        list: 依次对应每一步的 UCCI 着法（如 'h2e2'）
+
+    Raises:
+        ValueError: 某一步在当时的局面下找不到对应着法
+    """
+    board = ChessBoard(fen_str)
+    moves = []
+    for ply, text in enumerate(split_record(record), 1):
+        try:
+            (x1, y1), (x2, y2) = board.parse_chinese_notation(text)
+        except ValueError as e:
+            raise ValueError(f"第 {ply} 步 {text}: {e}") from e
+        moves.append(board.coords_to_move(x1, y1, x2, y2))
+        board._apply_move((x1, y1), (x2, y2))
+    return moves
@@ -10,6 +10,8 @@ import logging
 from .board import ChessBoard, ChessPiece
 from app.database import get_db_session
 from sqlalchemy import text
+from app.metrics import DB_COMMIT_SECONDS, DB_ERRORS
+from app.services import position_stats
 
 logger = logging.getLogger(__name__)
 
@@ -194,6 +196,8 @@ class ChessGame:
         self.start_time = None
         self.end_time = None
         self.result = GameResult.UNKNOWN
+        # 对局结果是否已计入局面统计（结束消息可能重复到达）
+        self.result_recorded = False
         
         # 棋盘和移动记录
         self.board = ChessBoard()
@@ -265,6 +269,7 @@ class ChessGame:
         
         # 修正：必须在棋盘状态改变前判断是否吃子
         is_capture = to_pos in self.board.pieces
+        fen_before = self.board.to_fen()
         
         # 执行移动
         try:
@@ -297,7 +302,7 @@ class ChessGame:
         self.moves.append(move_record)
         
         # 保存到数据库
-        self._save_move_to_database(move_record)
+        self._save_move_to_database(move_record, fen_before)
         
         # 检查游戏是否结束
         game_over = self.is_game_over()
@@ -356,7 +361,7 @@ class ChessGame:
                 self.result = GameResult.DRAW
         
         # 更新数据库
-        self._update_game_in_database()
+        self._update_game_in_database(record_result=not self.result_recorded)
         
         logger.info(f"游戏结束: {self.game_id}, 结果: {self.result.value}")
     
@@ -409,24 +414,33 @@ class ChessGame:
                 db_extra_info['current_user_id'] = self.current_user_id
                 db_extra_info['current_user_start'] = self.current_user_start
 
-                session.execute(text(insert_game_sql), {
-                    "chess_id": self.game_id,
-                    "match_id": self.match_id,
-                    "start_time": self.start_time,
-                    "red_user_id": self.red_player.user_id,
-                    "black_user_id": self.black_player.user_id,
-                    "extra_info": json.dumps(db_extra_info, ensure_ascii=False)
-                })
+                with DB_COMMIT_SECONDS.labels(operation='insert_game').time():
+                    session.execute(text(insert_game_sql), {
+                        "chess_id": self.game_id,
+                        "match_id": self.match_id,
+                        "start_time": self.start_time,
+                        "red_user_id": self.red_player.user_id,
+                        "black_user_id": self.black_player.user_id,
+                        "extra_info": json.dumps(db_extra_info, ensure_ascii=False)
+                    })
                 
-                session.commit()
+                    session.commit()
                 logger.info(f"游戏保存到数据库: {self.game_id}")
                 
         except Exception as e:
             logger.error(f"保存游戏到数据库失败: {e}")
+            DB_ERRORS.labels(operation='insert_game').inc()
             raise
     
-    def _update_game_in_database(self):
-        """更新游戏状态到数据库"""
+    def _update_game_in_database(self, record_result: bool = False):
+        """
+        更新游戏状态到数据库
+
+        Args:
+            record_result: 对局结束时为 True，同一事务内把结果计入每步着法的局面统计（结果未知时不计；
+                统计写入失败只回滚其保存点，不影响对局更新）
+        """
+        record_result = record_result and self.result != GameResult.UNKNOWN
         try:
             with get_db_session() as session:
                 update_sql = """
@@ -440,22 +454,35 @@ class ChessGame:
                 db_extra_info['current_user_id'] = self.current_user_id
                 db_extra_info['current_user_start'] = self.current_user_start
 
-                session.execute(text(update_sql), {
-                    "start_time": self.start_time,
-                    "end_time": self.end_time,
-                    "result": self.result.value,
-                    "chess_id": self.game_id,
-                    "extra_info": json.dumps(db_extra_info, ensure_ascii=False)
-                })
+                with DB_COMMIT_SECONDS.labels(operation='update_game').time():
+                    session.execute(text(update_sql), {
+                        "start_time": self.start_time,
+                        "end_time": self.end_time,
+                        "result": self.result.value,
+                        "chess_id": self.game_id,
+                        "extra_info": json.dumps(db_extra_info, ensure_ascii=False)
+                    })
+                    if record_result:
+                        with position_stats.best_effort(session, 'record_result'):
+                            position_stats.record_result(
+                                session, position_stats.replay_positions(self.moves), self.result.value)
                 
-                session.commit()
+                    session.commit()
+                self.result_recorded = self.result_recorded or record_result
                 
         except Exception as e:
             logger.error(f"更新游戏状态失败: {e}")
+            DB_ERRORS.labels(operation='update_game').inc()
             raise
     
-    def _save_move_to_database(self, move: GameMove):
-        """保存移动记录到数据库"""
+    def _save_move_to_database(self, move: GameMove, fen_before: str):
+        """
+        保存移动记录到数据库，同一事务内累计局面统计（统计写入失败不影响着法记录）
+
+        Args:
+            move: 移动记录
+            fen_before: 走子前的局面FEN（move.fen 是走子后的局面）
+        """
         try:
             with get_db_session() as session:
                 insert_move_sql = """
@@ -468,26 +495,30 @@ class ChessGame:
                  :move_type, :move_time, :ctm, :cc, :fen, :fen_side, :chess_id)
                 """
                 
-                session.execute(text(insert_move_sql), {
-                    "chess_id": self.game_id,
-                    "move_number": move.move_number,
-                    "side": move.side,
-                    "seat": move.seat,
-                    "piece": move.piece,
-                    "from_pos": move.from_pos,
-                    "to_pos": move.to_pos,
-                    "move_type": move.move_type,
-                    "move_time": move.move_time,
-                    "ctm": move.ctm,
-                    "cc": move.cc,
-                    "fen": move.fen,
-                    "fen_side": move.fen_side
-                })
+                with DB_COMMIT_SECONDS.labels(operation='insert_move').time():
+                    session.execute(text(insert_move_sql), {
+                        "chess_id": self.game_id,
+                        "move_number": move.move_number,
+                        "side": move.side,
+                        "seat": move.seat,
+                        "piece": move.piece,
+                        "from_pos": move.from_pos,
+                        "to_pos": move.to_pos,
+                        "move_type": move.move_type,
+                        "move_time": move.move_time,
+                        "ctm": move.ctm,
+                        "cc": move.cc,
+                        "fen": move.fen,
+                        "fen_side": move.fen_side
+                    })
+                    with position_stats.best_effort(session, 'record_move'):
+                        position_stats.record_move(session, fen_before, move.side, move.ctm, move.cc)
                 
-                session.commit()
+                    session.commit()
                 
         except Exception as e:
             logger.error(f"保存移动记录失败: {e}")
+            DB_ERRORS.labels(operation='insert_move').inc()
             raise
 
 
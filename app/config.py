@@ -3,11 +3,27 @@ import os
 class Config:
     DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1'
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'public', 'uploads')))
+    # 是否在后台把上传的图片另存到 UPLOAD_FOLDER（识别本身直接在内存中解码）
+    UPLOAD_ARCHIVE = os.environ.get('UPLOAD_ARCHIVE', '0') == '1'
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FORMAT = os.environ.get('LOG_FORMAT', '[%(asctime)s] %(levelname)s %(name)s: %(message)s')
+    # 日志在后台线程中写出（QueueHandler/QueueListener），请求线程只做一次入队
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', '1') == '1'
+    # 每行输出一个 JSON 对象，便于日志采集系统解析
+    LOG_JSON = os.environ.get('LOG_JSON', '0') == '1'
+    # 逐个棋子/逐行的调试日志在每个调用位置只保留 1/LOG_SAMPLE_RATE
+    LOG_SAMPLE_RATE = int(os.environ.get('LOG_SAMPLE_RATE', '10'))
+    # 异步日志队列容量，队列满时丢弃新记录而不阻塞
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+    # 识别流程分阶段计时（结果中返回 timings 并汇总到直方图），关闭后几乎没有额外开销
+    RECOGNITION_TIMING = os.environ.get('RECOGNITION_TIMING', '1') == '1'
+    # 批量识别接口 /api/recognize/batch 的并行识别线程数
+    BATCH_RECOGNITION_WORKERS = int(os.environ.get('BATCH_RECOGNITION_WORKERS', '4'))
+    # 对局分析最多使用的引擎进程数，每个进程有独立的置换表 (Hash)
+    ENGINE_MAX_SESSIONS = int(os.environ.get('ENGINE_MAX_SESSIONS', '1'))
 
     # --- Database Configuration ---
-    # Fallback database type: 'mysql' or 'sqlite'
+    # Fallback database type: 'mysql', 'postgresql' or 'sqlite'
     DATABASE_TYPE_FALLBACK = 'sqlite'
 
     # MySQL default configuration
@@ -18,12 +34,31 @@ class Config:
         'password': '',
         'database': 'chess_ai',
         'pool_size': 10,
-        'max_overflow': 20
+        'max_overflow': 20,
+        'pool_timeout': 10,
+        # Recycle well below MySQL's wait_timeout so idle connections are never reused stale
+        'pool_recycle': 1800
+    }
+
+    # PostgreSQL default configuration
+    POSTGRESQL_CONFIG_FALLBACK = {
+        'host': 'localhost',
+        'port': 5432,
+        'user': 'postgres',
+        'password': '',
+        'database': 'chess_ai',
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 10,
+        'pool_recycle': 1800
     }
 
     # SQLite default configuration
     SQLITE_CONFIG_FALLBACK = {
         'path': os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'db.sqlite3')),
-        'pool_size': 5,
-        'max_overflow': 10
+        # 'queue' (SQLAlchemy default for files), 'null' (connect per checkout) or 'static'
+        'pool': 'queue',
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000
     } 
\ No newline at end of file
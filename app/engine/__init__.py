@@ -1,3 +1,9 @@
 # engine package init 
+from app.config import Config
 from .core import Engine
-engine_instance = Engine() 
\ No newline at end of file
+from .lazy import LazyEngine
+from .session import EngineSession, EngineSessionPool
+# 引擎在第一次使用时才启动 Pikafish，导入 app 不再产生子进程与握手等待
+engine_instance = LazyEngine()
+# 对局分析按 game_id 绑定引擎，首个引擎与 engine_instance 共用
+engine_sessions = EngineSessionPool(shared_engine=engine_instance, max_engines=Config.ENGINE_MAX_SESSIONS)
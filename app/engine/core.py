@@ -5,6 +5,7 @@ import os
 from app.logging_config import logger
 import logging
 from app.logging_handlers import ShutdownHandler
+from app.metrics import ENGINE_NPS, ENGINE_SEARCHES, ENGINE_SEARCH_SECONDS
 import threading
 
 class Engine:
@@ -17,6 +18,15 @@ class Engine:
         self.params = self._load_parameters()
         self._shutdown_handler = None
         self.last_analysis_lines = []
+        # 最近一次搜索的局面与PV中预测的对方应着，只在 _lock 内读写
+        self._last_search_fen = None
+        self.last_ponder_move = None
+        # 正在后台思考 (go ponder) 的预测局面，格式同 get_best_move 的 fen_string
+        self._ponder_fen = None
+        # 引擎当前置换表所属的对局，None表示未绑定对局的单次分析
+        self.current_game_id = None
+        # 引擎是单个子进程，多线程并发调用时需串行化命令与输出读取
+        self._lock = threading.RLock()
         self._init_engine()
 
     def _load_parameters(self):
@@ -55,7 +65,7 @@ class Engine:
                 bufsize=1,
                 universal_newlines=True
             )
-            time.sleep(1)
+            # uci 会阻塞读取到 uciok，setoption 之后的 isready 保证选项已生效，无需固定等待
             self.uci()
             self.set_option('Threads', '2')
             self.set_option('Hash', '256')
@@ -71,17 +81,29 @@ class Engine:
                 self.pikafish.terminate()
                 self.pikafish = None
 
-    def get_best_move(self, fen, side):
-        logger.info(f"[Engine] get_best_move: FEN={fen}, side={side}, params={self.params}")
+    def get_best_move(self, fen, side, moves=None, game_id=None):
+        """
+        获取最佳走法。
+
+        Args:
+            fen: 棋盘FEN（不含走棋方）
+            side: 走棋方 'w'/'b'
+            moves: 对局从初始局面开始的完整走法列表；提供时以 position startpos moves 发送，
+                   同一对局的连续分析保留引擎置换表
+            game_id: 走法所属对局，切换对局时发送 ucinewgame 清空置换表
+        """
+        logger.info("[Engine] get_best_move: FEN=%s, side=%s, params=%s", fen, side, self.params)
         if not self.engine_available:
             logger.warning("AI引擎不可用，返回模拟结果")
+            with self._lock:
+                self._last_search_fen, self.last_ponder_move = fen + ' ' + side, None
             return "a1a2", '',fen + ' ' + side
         try:
             fen_string = fen + ' ' + side
             param = self.params.get('goParam', 'depth')
             value = self.params.get(param, '15')
-            lines, best_move = self.go(fen_string, param, str(value))
-            logger.info(f"[Engine] lines: {lines},best_move:{best_move}")
+            lines, best_move = self.go(fen_string, param, str(value), moves=moves, game_id=game_id)
+            logger.debug("[Engine] lines: %s,best_move:%s", lines, best_move)
             line = ''
             if not lines:
                 logger.warning("[Engine] No lines received from engine (timeout).")
@@ -101,7 +123,7 @@ class Engine:
                 elif len(lines)==1:
                     line = lines[0]
 
-            logger.info(f"[Engine] Final best move: {best_move_code}")
+            logger.info("[Engine] Final best move: %s", best_move_code)
             return best_move_code,line, fen_string
         except Exception as e:
             logger.error(f"获取最佳走法时出错: {e}")
@@ -152,6 +174,10 @@ class Engine:
     def isready(self):
         if self.pikafish is None:
             return ""
+        with self._lock:
+            return self._isready()
+
+    def _isready(self):
         try:
             self.pikafish.stdin.write('isready\n')
             self.pikafish.stdin.flush()
@@ -174,13 +200,13 @@ class Engine:
             cmd = f'setoption name {name} value {value}'
             self.pikafish.stdin.write(f'{cmd}\n')
             self.pikafish.stdin.flush()
-            time.sleep(0.1)
         except Exception as e:
             logger.error(f"setoption命令出错: {e}")
 
     def ucinewgame(self):
         if self.pikafish is None:
             return ""
+        self.current_game_id = None
         try:
             self.pikafish.stdin.write('ucinewgame\n')
             self.pikafish.stdin.flush()
@@ -189,22 +215,175 @@ class Engine:
             logger.error(f"ucinewgame命令出错: {e}")
             return ""
 
-    def go(self, fen_string, param, value):
+    def go(self, fen_string, param, value, moves=None, game_id=None):
+        with self._lock:
+            mode = 'go'
+            start = time.perf_counter()
+            if self._ponder_fen is not None:
+                if self._ponder_fen == fen_string:
+                    mode = 'ponderhit'
+                else:
+                    self._stop_ponder()
+            if mode == 'ponderhit':
+                lines, best_move = self._ponderhit()
+            else:
+                lines, best_move = self._go(fen_string, param, value, moves=moves, game_id=game_id)
+            self._last_search_fen = fen_string
+            self.last_ponder_move = self._parse_ponder_move(best_move, lines)
+            if self.pikafish is not None:
+                self._record_search(mode, time.perf_counter() - start, lines)
+            return lines, best_move
+
+    def ponder_move(self, fen_string):
+        """
+        最近一次在 fen_string 上搜索时PV预测的对方应着。
+
+        引擎此后已经搜索了其他局面（其他线程或对局的分析）时返回 None，
+        不会把别的局面的预测当作本局面的。
+        """
+        with self._lock:
+            return self.last_ponder_move if self._last_search_fen == fen_string else None
+
+    @staticmethod
+    def _record_search(mode, elapsed, lines):
+        """记录搜索耗时与最后一条 info 中报告的 nps"""
+        ENGINE_SEARCHES.labels(mode=mode).inc()
+        ENGINE_SEARCH_SECONDS.labels(mode=mode).observe(elapsed)
+        for line in reversed(lines or []):
+            parts = line.split()
+            if 'nps' in parts and parts.index('nps') + 1 < len(parts):
+                try:
+                    ENGINE_NPS.set(int(parts[parts.index('nps') + 1]))
+                except ValueError:
+                    pass
+                break
+
+    def start_ponder(self, fen_string, moves, expected_fen, history=None):
+        """
+        在预测局面上后台思考 (go ponder)。
+
+        Args:
+            fen_string: 当前局面FEN（含走棋方）
+            moves: 从当前局面出发的走法序列，通常为 [我方推荐走法, 预测的对方应着]
+            expected_fen: 走完 moves 后的局面FEN，后续 go 收到相同局面即视为 ponderhit
+            history: 对局从初始局面开始的走法列表，提供时以 position startpos moves 发送
+
+        Returns:
+            bool: 是否已开始后台思考
+        """
+        if self.pikafish is None or not moves:
+            return False
+        with self._lock:
+            if len(moves) > 1 and self._last_search_fen == fen_string and self.last_ponder_move != moves[1]:
+                # 推荐产生之后引擎又搜索过同一局面，预测的应着已经过时
+                logger.info("[Engine] Stale ponder move %s (latest: %s), not pondering.", moves[1],
+                            self.last_ponder_move)
+                return False
+            if self._ponder_fen is not None:
+                self._stop_ponder()
+            try:
+                param = self.params.get('goParam', 'depth')
+                value = self.params.get(param, '15')
+                if history is not None:
+                    pos_command = f"position startpos moves {' '.join(list(history) + list(moves))}\n"
+                else:
+                    pos_command = f"position fen {fen_string} moves {' '.join(moves)}\n"
+                go_command = f"go ponder {param} {value}\n"
+                logger.debug("[Engine] > Sending command: %s", pos_command.strip())
+                logger.debug("[Engine] > Sending command: %s", go_command.strip())
+                self.pikafish.stdin.write(pos_command)
+                self.pikafish.stdin.write(go_command)
+                self.pikafish.stdin.flush()
+                self._ponder_fen = expected_fen
+                return True
+            except Exception as e:
+                logger.error(f"go ponder命令出错: {e}")
+                return False
+
+    def ponder_matches(self, fen_string):
+        """当前后台思考的局面是否就是 fen_string"""
+        return self._ponder_fen is not None and self._ponder_fen == fen_string
+
+    def stop_ponder(self):
+        """
+        停止后台思考（没有在思考时什么都不做）。
+
+        Returns:
+            bool: 是否确实停止了一次后台思考
+        """
+        if self.pikafish is None:
+            return False
+        with self._lock:
+            if self._ponder_fen is None:
+                return False
+            self._stop_ponder()
+            return True
+
+    def _ponderhit(self):
+        """对方走了预测的应着：发送 ponderhit，直接取后台思考的结果"""
+        logger.info("[Engine] Ponder hit: %s", self._ponder_fen)
+        self._ponder_fen = None
+        self.last_analysis_lines = []
+        try:
+            self.pikafish.stdin.write('ponderhit\n')
+            self.pikafish.stdin.flush()
+            return self._read_output_with_timeout(50)
+        except Exception as e:
+            logger.error(f"ponderhit命令出错: {e}")
+            return [], "bestmove a1a2"
+
+    def _stop_ponder(self):
+        """预测落空：停止后台思考并丢弃其结果"""
+        logger.info("[Engine] Ponder miss, stopping search on: %s", self._ponder_fen)
+        self._ponder_fen = None
+        try:
+            self.pikafish.stdin.write('stop\n')
+            self.pikafish.stdin.flush()
+            self._read_output_with_timeout(5)
+        except Exception as e:
+            logger.error(f"stop命令出错: {e}")
+
+    @staticmethod
+    def _parse_ponder_move(best_move, lines):
+        """从 'bestmove xxx ponder yyy' 或最后一条PV中取出预测的对方应着"""
+        parts = best_move.split() if best_move else []
+        if 'ponder' in parts and parts.index('ponder') + 1 < len(parts):
+            return parts[parts.index('ponder') + 1]
+        for line in reversed(lines or []):
+            pv = line.split(' pv ')
+            if len(pv) == 2 and len(pv[1].split()) >= 2:
+                return pv[1].split()[1]
+        return None
+
+    def _go(self, fen_string, param, value, moves=None, game_id=None):
         self.last_analysis_lines = []
         if self.pikafish is None:
             return [], "bestmove a1a2"
         try:
             start_fen_board = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR"
-            if fen_string.startswith(start_fen_board):
+            if moves is not None:
+                # 对局分析：只在切换到另一对局时清空置换表，同一对局保留上一步的搜索结果
+                if game_id is None or game_id != self.current_game_id:
+                    logger.info("[Engine] Switching to game %s, sending ucinewgame.", game_id)
+                    self.ucinewgame()
+                self.current_game_id = game_id
+                pos_command = "position startpos" + (" moves " + " ".join(moves) if moves else "") + "\n"
+            elif self.current_game_id is not None:
+                # 单次分析不应复用某局对局的置换表
+                logger.info("[Engine] Leaving game context, sending ucinewgame.")
+                self.ucinewgame()
+                self.current_game_id = None
+                pos_command = "position fen " + fen_string + "\n"
+            elif fen_string.startswith(start_fen_board):
                 logger.info("[Engine] Detected start position, sending ucinewgame and position startpos.")
                 self.ucinewgame()
                 pos_command = "position startpos\n"
             else:
                 pos_command = "position fen " + fen_string + "\n"
-            logger.info(f"[Engine] > Sending command: {pos_command.strip()}")
+            logger.debug("[Engine] > Sending command: %s", pos_command.strip())
             self.pikafish.stdin.write(pos_command)
             go_command = "go " + param + " " + value + "\n"
-            logger.info(f"[Engine] > Sending command: {go_command.strip()}")
+            logger.debug("[Engine] > Sending command: %s", go_command.strip())
             self.pikafish.stdin.write(go_command)
             self.pikafish.stdin.flush()
             lines, best_move = self._read_output_with_timeout(50)
@@ -281,12 +460,13 @@ class Engine:
         """
         执行引擎关闭时的清理工作
         """
+        self._ponder_fen = None
         if self.pikafish:
             try:
                 self.pikafish.stdin.write('quit\n')
                 self.pikafish.stdin.flush()
             except (IOError, BrokenPipeError) as e:
-                logger.debug(f"Error writing to engine pipe: {e}")
+                logger.debug("Error writing to engine pipe: %s", e)
             
             try:
                 self.pikafish.terminate()
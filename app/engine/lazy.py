@@ -0,0 +1,61 @@
+"""
+引擎的延迟初始化
+
+创建 Engine 会启动 Pikafish 子进程并完成 uci/setoption/isready 握手，还会改写 params.json。
+导入 app 的进程（测试、只做识别的 worker、Redis 消费者启动阶段）不一定会用到引擎，
+因此模块级的 engine_instance 是一个代理：第一次访问引擎属性时才真正创建 Engine。
+
+引擎对象记录创建它的进程号。fork 出的子进程（gunicorn worker）继承的引擎与父进程共用
+同一组管道，不能在子进程里使用，也不能关闭（会终止父进程的 Pikafish），子进程中第一次
+使用时会丢弃继承来的引用并创建自己的引擎。
+"""
+import os
+import threading
+from typing import Callable, Optional
+
+from .core import Engine
+
+
+class LazyEngine:
+    """首次使用时才创建 Engine 的代理，属性访问全部转发给真实引擎"""
+
+    def __init__(self, factory: Callable[[], Engine] = Engine):
+        self._factory = factory
+        self._engine: Optional[Engine] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        """当前进程的真实引擎是否已经创建"""
+        return self._engine is not None and self._pid == os.getpid()
+
+    def get(self) -> Engine:
+        """返回真实引擎，必要时创建（多线程并发首次访问时只创建一次）"""
+        engine = self._engine
+        if engine is None or self._pid != os.getpid():
+            with self._lock:
+                if self._engine is None or self._pid != os.getpid():
+                    self._engine = self._factory()
+                    self._pid = os.getpid()
+                engine = self._engine
+        return engine
+
+    def reset_after_fork(self):
+        """在 fork 出的子进程中丢弃继承来的引擎引用（不关闭，子进程不拥有它）"""
+        if self._pid != os.getpid():
+            self._engine = None
+            self._pid = None
+            self._lock = threading.Lock()
+
+    def close(self):
+        """关闭本进程创建的引擎；从未使用过时什么都不做，不会为了关闭而启动引擎"""
+        if self.started:
+            self._engine.close()
+
+    def __getattr__(self, name):
+        # 只有代理自身没有的属性才会走到这里
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        return f"<LazyEngine started={self.started}>"
@@ -0,0 +1,109 @@
+"""
+对局与引擎的绑定（engine affinity）
+
+每个对局固定使用池中的一个引擎实例，局面以 position startpos moves ... 的形式发送，
+同一对局的连续分析可以复用引擎置换表中上一步的搜索结果。池中引擎数量有限，
+对局数超过引擎数时按最近最少使用回收引擎，引擎切换对局时发送 ucinewgame，
+因此不同对局不会共享置换表内容。
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+from app.logging_config import logger
+from .core import Engine
+
+
+class EngineSession:
+    """绑定到某一对局的引擎视图，接口与 Engine 的分析相关方法一致"""
+
+    def __init__(self, engine: Engine, game_id: str, moves: Sequence[str]):
+        self.engine = engine
+        self.game_id = game_id
+        self.moves = list(moves)
+
+    def get_best_move(self, fen, side):
+        return self.engine.get_best_move(fen, side, moves=self.moves, game_id=self.game_id)
+
+    def start_ponder(self, fen_string, moves, expected_fen):
+        return self.engine.start_ponder(fen_string, moves, expected_fen, history=self.moves)
+
+    def ponder_matches(self, fen_string):
+        return self.engine.ponder_matches(fen_string)
+
+    def stop_ponder(self):
+        return self.engine.stop_ponder()
+
+    def ponder_move(self, fen_string):
+        return self.engine.ponder_move(fen_string)
+
+
+class EngineSessionPool:
+    """按 game_id 分配引擎实例的池"""
+
+    def __init__(self, shared_engine: Optional[Engine] = None, max_engines: int = 1,
+                 engine_factory: Callable[[], Engine] = Engine):
+        """
+        Args:
+            shared_engine: 已创建的引擎，作为池中的第一个实例复用
+            max_engines: 池中最多的引擎进程数（每个进程有独立的置换表）
+            engine_factory: 创建新引擎实例的工厂函数
+        """
+        self.max_engines = max(1, max_engines)
+        self._engine_factory = engine_factory
+        self._engines: List[Engine] = [shared_engine] if shared_engine is not None else []
+        self._owned: List[Engine] = []
+        self._assignment: "OrderedDict[str, Engine]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, game_id: str) -> Engine:
+        """获取对局绑定的引擎，必要时分配空闲引擎或回收最久未使用对局的引擎"""
+        with self._lock:
+            engine = self._assignment.get(game_id)
+            if engine is not None:
+                self._assignment.move_to_end(game_id)
+                return engine
+
+            in_use = set(map(id, self._assignment.values()))
+            engine = next((e for e in self._engines if id(e) not in in_use), None)
+            if engine is None and len(self._engines) < self.max_engines:
+                engine = self._engine_factory()
+                self._engines.append(engine)
+                self._owned.append(engine)
+            if engine is None:
+                evicted_game, engine = self._assignment.popitem(last=False)
+                logger.info(f"[EngineSessionPool] 对局 {evicted_game} 的引擎被回收给 {game_id}")
+
+            self._assignment[game_id] = engine
+            return engine
+
+    def session(self, game_id: str, moves: Sequence[str]) -> EngineSession:
+        """为对局创建一次分析使用的会话"""
+        return EngineSession(self.acquire(game_id), game_id, moves)
+
+    def release(self, game_id: str):
+        """对局结束后解除绑定，引擎可分配给其他对局"""
+        with self._lock:
+            self._assignment.pop(game_id, None)
+
+    def assignments(self) -> Dict[str, int]:
+        """当前对局到引擎序号的映射"""
+        with self._lock:
+            index = {id(e): i for i, e in enumerate(self._engines)}
+            return {game_id: index[id(engine)] for game_id, engine in self._assignment.items()}
+
+    def close(self):
+        """关闭池自己创建的引擎（共享引擎由其创建者负责关闭）"""
+        with self._lock:
+            for engine in self._owned:
+                engine.close()
+            self._engines = [e for e in self._engines if e not in self._owned]
+            self._owned = []
+            self._assignment.clear()
+
+    def reset_after_fork(self):
+        """fork 出的子进程中丢弃继承来的引擎（与父进程共用管道，不能使用也不能关闭）"""
+        self._lock = threading.Lock()
+        self._engines = [e for e in self._engines if e not in self._owned]
+        self._owned = []
+        self._assignment.clear()
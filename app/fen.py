@@ -0,0 +1,145 @@
+"""
+FEN 编解码
+
+棋盘数组是 10x9 的二维数组，'-' 表示空位，第 0 行对应 FEN 的第一段（红方视角下的最上方）。
+识别、引擎分析、对局消息处理都要在 FEN 与棋盘数组之间反复转换，这里集中提供一份实现：
+
+- 行级查表：每一段 FEN 行字符串与其 9 个格子的元组一一对应，解析和生成时按整行查表，
+  不再逐字符拼接列表。象棋的行组合有限，表在运行中很快填满常见局面
+- 最近解析过的 FEN 用 LRU 缓存整盘结果（不可变元组），对外返回时再复制成可修改的列表
+- 需要矩阵运算的调用方可以用 fen_to_numpy 直接拿到 NumPy 数组
+"""
+import re
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+EMPTY = '-'
+ROWS = 10
+COLS = 9
+
+# 最近解析过的 FEN 数量
+FEN_CACHE_SIZE = 1024
+# 行表的上限，超过后新出现的行只计算不再入表，防止异常输入撑大内存
+ROW_TABLE_SIZE = 16384
+
+START_FEN = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR"
+
+Row = Tuple[str, ...]
+Board = Tuple[Row, ...]
+
+_EMPTY_RUN = re.compile(r'-+')
+
+# FEN 行字符串 -> 格子元组
+_ROW_CELLS = {}
+# 格子元组 -> FEN 行字符串
+_ROW_FEN = {}
+
+
+def _intern_row(row_fen: str, cells: Row):
+    if len(_ROW_CELLS) < ROW_TABLE_SIZE:
+        _ROW_CELLS[row_fen] = cells
+        _ROW_FEN[cells] = row_fen
+
+
+def decode_row(row_fen: str) -> Row:
+    """把一段 FEN 行（如 '2R6'）解码为 9 个格子的元组"""
+    cells = _ROW_CELLS.get(row_fen)
+    if cells is not None:
+        return cells
+    expanded = []
+    for char in row_fen:
+        if char.isdigit():
+            expanded.extend(EMPTY * int(char))
+        else:
+            expanded.append(char)
+    if len(expanded) != COLS:
+        raise ValueError("Invalid FEN row length")
+    cells = tuple(expanded)
+    _intern_row(row_fen, cells)
+    return cells
+
+
+def encode_row(row: Sequence[str]) -> str:
+    """把一行 9 个格子编码为 FEN 行字符串"""
+    cells = tuple(row)
+    row_fen = _ROW_FEN.get(cells)
+    if row_fen is not None:
+        return row_fen
+    if len(cells) != COLS:
+        raise ValueError("Invalid board row length")
+    row_fen = _EMPTY_RUN.sub(lambda m: str(len(m.group())), ''.join(cells))
+    _intern_row(row_fen, cells)
+    return row_fen
+
+
+def board_part(fen: str) -> str:
+    """取 FEN 的棋盘部分（去掉轮走方等字段）"""
+    return fen.strip().split(' ', 1)[0]
+
+
+@lru_cache(maxsize=FEN_CACHE_SIZE)
+def _parse_board(fen_board: str) -> Board:
+    rows = fen_board.split('/')
+    if len(rows) != ROWS:
+        raise ValueError("Invalid FEN number of rows")
+    return tuple(decode_row(row) for row in rows)
+
+
+def parse_board(fen: str) -> Board:
+    """
+    解析 FEN 为不可变的 10x9 元组（带 LRU 缓存，调用方不能修改返回值）
+
+    Args:
+        fen: 完整 FEN 或只有棋盘部分
+
+    Raises:
+        ValueError: 行数不是 10 或某行展开后不是 9 格
+    """
+    return _parse_board(board_part(fen))
+
+
+def fen_to_board_array(fen: str) -> List[List[str]]:
+    """解析 FEN 为可修改的 10x9 列表"""
+    return [list(row) for row in parse_board(fen)]
+
+
+def fen_to_numpy(fen: str):
+    """解析 FEN 为 shape (10, 9)、dtype '<U1' 的 NumPy 数组"""
+    import numpy as np
+
+    return np.array(parse_board(fen), dtype='<U1')
+
+
+def flip_board(array):
+    """旋转 180 度（黑方视角与红方视角互换）"""
+    return [row[::-1] for row in array[::-1]]
+
+
+def board_to_fen(array) -> str:
+    """
+    把 10x9 棋盘数组（列表、元组或 NumPy 数组）编码为 FEN 的棋盘部分
+
+    Raises:
+        ValueError: 行数不是 10 或某行不是 9 格
+    """
+    if len(array) != ROWS:
+        raise ValueError("Invalid board number of rows")
+    return '/'.join([encode_row(row) for row in array])
+
+
+def cache_info():
+    """FEN 缓存与行表的使用情况"""
+    info = _parse_board.cache_info()
+    return {
+        "fen_hits": info.hits,
+        "fen_misses": info.misses,
+        "fen_size": info.currsize,
+        "fen_maxsize": info.maxsize,
+        "rows": len(_ROW_CELLS),
+    }
+
+
+def clear_cache():
+    _parse_board.cache_clear()
+    _ROW_CELLS.clear()
+    _ROW_FEN.clear()
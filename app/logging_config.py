@@ -1,14 +1,14 @@
 """
 日志配置模块
 """
+import copy
 import logging
 from logging.handlers import RotatingFileHandler
 import os
-import sys; print('PYTHONPATH:', sys.path)
-import app.routes
 from app.config import Config
 import logging.config
 from app.shutdown import shutdown_manager
+from app.logging_handlers import QueueLogging, SamplingFilter
 
 # 确保日志目录存在
 LOG_DIR = 'logs'
@@ -26,6 +26,9 @@ LOGGING_CONFIG = {
         'detailed': {
             'format': '%(asctime)s [%(levelname)s] %(name)s:%(lineno)d: %(message)s'
         },
+        'json': {
+            '()': 'app.logging_handlers.JsonFormatter'
+        },
     },
     'handlers': {
         'console': {
@@ -77,6 +80,12 @@ def cleanup_logging():
     """
     清理所有日志处理器
     """
+    if queue_logging is not None:
+        for handler in queue_logging.handlers():
+            try:
+                handler.close()
+            except:
+                pass
     for handler in logging.getLogger().handlers[:]:
         try:
             handler.close()
@@ -93,12 +102,34 @@ def cleanup_logging():
             except:
                 pass
 
+# 异步日志管道，LOG_ASYNC 关闭时为 None
+queue_logging = None
+
+
 def setup_logging():
     """
     设置日志配置
     """
-    logging.config.dictConfig(LOGGING_CONFIG)
-    
+    global queue_logging
+    config = copy.deepcopy(LOGGING_CONFIG)
+    if Config.LOG_JSON:
+        for handler in config['handlers'].values():
+            handler['formatter'] = 'json'
+    logging.config.dictConfig(config)
+
+    sample_rate = Config.LOG_SAMPLE_RATE
+    if Config.LOG_ASYNC:
+        # 文件/控制台写入移到后台线程；抽样过滤在入队前执行
+        queue_logging = QueueLogging(['', *config['loggers']], queue_size=Config.LOG_QUEUE_SIZE,
+                                     sample_rate=sample_rate)
+        # 在清理处理器之前把队列中剩余的日志写完
+        shutdown_manager.register(queue_logging.stop, priority=-90)
+    else:
+        sampling = SamplingFilter(sample_rate)
+        for name in ['', *config['loggers']]:
+            for handler in logging.getLogger(name or None).handlers:
+                handler.addFilter(sampling)
+
     # 注册为最后一个清理函数（优先级最低）
     shutdown_manager.register(cleanup_logging, priority=-100)
 
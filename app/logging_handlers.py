@@ -1,8 +1,17 @@
 """
 自定义日志处理器
 """
+import copy
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+from decimal import Decimal
+from enum import Enum
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterable, List
 
 class ShutdownHandler(logging.StreamHandler):
     """
@@ -28,4 +37,172 @@ class ShutdownHandler(logging.StreamHandler):
         try:
             super().close()
         except Exception:
-            pass 
\ No newline at end of file
+            pass 
+
+# 热点路径上逐个棋子、逐行输出的调试日志加上该标记后按调用位置抽样：
+#     logger.debug("棋子%d: 位置(%d,%d)", idx, x, y, extra=SAMPLED)
+SAMPLED = {'sampled': True}
+
+# 入队后不会再变的参数类型；其他类型（list、dict、numpy 数组、自定义对象……）可能在
+# 监听线程格式化之前被调用方修改
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None), Decimal, Enum)
+
+
+def _is_immutable(value) -> bool:
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+# LogRecord 自带的属性，JSON 输出时只把这些以外的属性（extra 传入的字段）作为附加字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'log_route', 'sampled'}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    带 sampled 标记的记录在每个调用位置 (文件, 行号) 只放行 1/rate 条，
+    第一条总是放行，放行的记录带有 sample_rate 属性
+    """
+
+    def __init__(self, rate: int = 10):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate == 1 or not getattr(record, 'sampled', False):
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出一行 JSON，extra 传入的字段作为顶层字段"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RoutedQueueHandler(QueueHandler):
+    """
+    把记录放入队列，由后台线程交给原来挂在该 logger 上的处理器（route 标识这组处理器）。
+
+    队列只在进程内使用，不需要像标准 QueueHandler 那样先格式化消息再入队，
+    参数都是不可变值时 %-格式化与写文件都推迟到监听线程；参数中有可变对象时在入队前
+    格式化出消息，以免调用方随后修改对象，日志记下的是修改后的值。
+    队列满时丢弃记录而不是阻塞调用线程。
+    """
+
+    def __init__(self, queue, route: str):
+        super().__init__(queue)
+        self.route = route
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.log_route = self.route
+        if not (isinstance(record.msg, str) and _is_immutable(record.args or ())):
+            try:
+                record.msg, record.args = record.getMessage(), None
+            except Exception:
+                # 格式化失败留给监听线程中的处理器按 handleError 报告
+                pass
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RoutingQueueListener(QueueListener):
+    """按记录的 log_route 把记录分发给对应 logger 原来的处理器"""
+
+    def __init__(self, log_queue, routes: Dict[str, List[logging.Handler]]):
+        super().__init__(log_queue, respect_handler_level=True)
+        self.routes = routes
+
+    def handle(self, record):
+        for handler in self.routes.get(getattr(record, 'log_route', ''), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class QueueLogging:
+    """
+    异步日志管道：把若干 logger 上的处理器移到一个后台线程中执行，
+    请求线程只做一次入队。fork 出的子进程会自动换用新的队列并重启监听线程。
+    """
+
+    def __init__(self, logger_names: Iterable[str], queue_size: int = 10000,
+                 sample_rate: int = 1):
+        self.queue_size = queue_size
+        self.queue = queue.Queue(queue_size)
+        self.sampling = SamplingFilter(sample_rate)
+        self.queue_handlers: List[RoutedQueueHandler] = []
+        routes = {}
+        for name in logger_names:
+            target = logging.getLogger(name or None)
+            handlers = list(target.handlers)
+            if not handlers:
+                continue
+            for handler in handlers:
+                target.removeHandler(handler)
+            queue_handler = RoutedQueueHandler(self.queue, name)
+            queue_handler.setLevel(min(handler.level for handler in handlers))
+            queue_handler.addFilter(self.sampling)
+            target.addHandler(queue_handler)
+            self.queue_handlers.append(queue_handler)
+            routes[name] = handlers
+        self.listener = RoutingQueueListener(self.queue, routes)
+        self.listener.start()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    @property
+    def dropped(self) -> int:
+        return sum(handler.dropped for handler in self.queue_handlers)
+
+    def handlers(self) -> List[logging.Handler]:
+        """后台线程中执行的处理器"""
+        return [handler for handlers in self.listener.routes.values() for handler in handlers]
+
+    def _restart_in_child(self):
+        # 父进程的监听线程不会被 fork 到子进程，队列的锁也可能处于持有状态，整体换新
+        if self.listener._thread is None:
+            return
+        self.queue = queue.Queue(self.queue_size)
+        for handler in self.queue_handlers:
+            handler.queue = self.queue
+        self.listener.queue = self.queue
+        self.listener._thread = None
+        self.listener.start()
+
+    def stop(self):
+        """处理完队列中剩余的记录后停止后台线程"""
+        if self.listener._thread is not None:
+            self.listener.stop()
@@ -5,6 +5,7 @@
 
 from .chess_message_models import GameMessage,ChessMessage, MessageType
 from .redis_consumer import RedisConsumer
+from .redis_stream_consumer import RedisStreamConsumer
 from .config import Config
 
 __version__ = "1.0.0"
@@ -15,5 +16,6 @@ __all__ = [
     'ChessMessage',
     'MessageType',
     'RedisConsumer',
+    'RedisStreamConsumer',
     'Config'
 ] 
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+AI分析请求优先级调度器
+
+位于消息处理与 analyze_fen 之间：所有分析请求进入优先队列，由单个工作线程
+串行交给引擎（引擎本身就是单进程）。排序规则：
+1. 轮到我方走棋 (is_ai_move) 的请求优先
+2. 剩余用时越少越优先（未知用时排在已知用时之后）
+3. 消息 priority 越大越优先
+4. 其余按提交顺序
+出队时若对局已经走到更新的局面（请求过期），直接丢弃，不再送入引擎。
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnalysisRequest:
+    """一次AI分析请求"""
+    game_id: str
+    fen: str
+    is_red_turn: bool
+    board_array: List[List[str]]
+    move_number: int = 0
+    is_ai_move: bool = True
+    remaining_time: Optional[int] = None  # 我方剩余用时（毫秒），未知为None
+    priority: int = 1
+    engine: Optional[Any] = None  # 对局绑定的引擎会话 (EngineSession)，None使用共享引擎
+    created_at: float = field(default_factory=time.time)
+
+    def sort_key(self) -> tuple:
+        remaining = self.remaining_time if self.remaining_time is not None else float('inf')
+        return (0 if self.is_ai_move else 1, remaining, -self.priority)
+
+
+class AnalysisScheduler:
+    """基于优先队列的AI分析调度器"""
+
+    def __init__(self,
+                 analyze: Callable[[str, bool, list], Dict[str, Any]],
+                 is_stale: Optional[Callable[[AnalysisRequest], bool]] = None):
+        """
+        Args:
+            analyze: 实际执行分析的函数，签名同 analyze_fen(fen, is_red_turn, board_array, engine=None)
+            is_stale: 判断请求是否已过期的回调，返回True则丢弃
+        """
+        self._analyze = analyze
+        self._is_stale = is_stale
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._latest: Dict[str, int] = {}  # game_id -> 仍在队列中的最新请求序号，出队即移除
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.stats = {"submitted": 0, "completed": 0, "dropped_stale": 0, "failed": 0}
+
+    def submit(self, request: AnalysisRequest) -> Future:
+        """
+        提交分析请求
+
+        Returns:
+            Future: 结果为 analyze 的返回值；请求过期被丢弃时结果为 None
+        """
+        future: Future = Future()
+        with self._cond:
+            seq = next(self._seq)
+            self._latest[request.game_id] = seq
+            heapq.heappush(self._heap, (request.sort_key(), seq, request, future))
+            self.stats["submitted"] += 1
+            self._ensure_worker()
+            self._cond.notify()
+        return future
+
+    def pending_count(self) -> int:
+        """等待分析的请求数量"""
+        with self._cond:
+            return len(self._heap)
+
+    def stop(self, timeout: float = 5):
+        """停止工作线程，未处理的请求以None结束"""
+        with self._cond:
+            self._running = False
+            pending, self._heap = self._heap, []
+            self._latest.clear()
+            self._cond.notify_all()
+        for _, _, _, future in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_result(None)
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._worker, name='analysis-scheduler', daemon=True)
+            self._thread.start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._running and not self._heap:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                _, seq, request, future = heapq.heappop(self._heap)
+                superseded = self._latest.get(request.game_id) != seq
+                if not superseded:
+                    # 该局最新的请求已出队，无论执行还是丢弃都不再需要记录
+                    del self._latest[request.game_id]
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if superseded or (self._is_stale and self._is_stale(request)):
+                self.stats["dropped_stale"] += 1
+                logger.info(f"丢弃过期分析请求: game={request.game_id}, move={request.move_number}, fen={request.fen}")
+                future.set_result(None)
+                continue
+
+            try:
+                result = self._analyze(request.fen, request.is_red_turn, request.board_array, engine=request.engine)
+                self.stats["completed"] += 1
+                future.set_result(result)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"AI分析失败: game={request.game_id}, {e}", exc_info=True)
+                future.set_exception(e)
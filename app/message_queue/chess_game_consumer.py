@@ -1,19 +1,29 @@
 import json
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Optional
 from dataclasses import dataclass
 from enum import Enum
 import os
+import threading
+import time
 
 from app.chess.game_manager import game_manager, Player, GameResult, GameStatus
-from app.database import get_db_session
+from app.chess.board import ChessBoard
+from app.engine import engine_sessions
+from app.database import get_db_session, session_scope
 from sqlalchemy import text
 from app.services.analysis import analyze_fen
+from app.metrics import ANALYSIS_PENDING, CONSUMER_MESSAGES, CONSUMER_MESSAGE_SECONDS
 from .chess_message_models import MessageType,ChessMessage,GameMessage
+from .analysis_scheduler import AnalysisScheduler, AnalysisRequest
+from .config import Config
 
 logger = logging.getLogger(__name__)
 
+_KNOWN_MESSAGE_TYPES = frozenset(t.value for t in MessageType)
+
 class ChessGameMessageProcessor:
     """象棋游戏消息处理器"""
     
@@ -21,11 +31,45 @@ class ChessGameMessageProcessor:
         self.active_games: Dict[str, Dict[str, Any]] = {}
         self.user_games: Dict[int, str] = {}  # user_id -> game_id 映射
         self._msg_count = 0
+        # 批量消费时处理器在多个线程上并发调用，计数需加锁
+        self._stats_lock = threading.Lock()
         self.current_user_id = None # 用于判断AI应该为哪一方服务
+        self.recommendations: Dict[str, Dict[str, Any]] = {}  # game_id -> 最近一次AI推荐
+        self.analysis_timeout = Config.get_consumer_config().get('analysis_timeout', 90)
+        # 所有AI分析经由优先级调度器串行送入引擎（_analyze 延迟绑定analyze_fen，便于测试替换）
+        self.scheduler = AnalysisScheduler(analyze=self._analyze, is_stale=self._is_stale_request)
+        ANALYSIS_PENDING.set_function(self.scheduler.pending_count)
         
-    def process_message(self, message_data: Any) -> Dict[str, Any]:
+    def _analyze(self, *args, **kwargs):
+        # 调度器线程中每次分析是一个数据库会话作用域
+        with session_scope():
+            return analyze_fen(*args, **kwargs)
+
+    def process_message(self, message_data: Any, coalesced: bool = False) -> Dict[str, Any]:
+        """
+        处理一条消息
+
+        Args:
+            message_data: 消息字典
+            coalesced: 批量消费时该走棋已被同局后续走棋覆盖，不再触发AI分析
+        """
+        start = time.perf_counter()
+        # 一条消息内的数据库操作共用一个会话，处理完关闭
+        with session_scope():
+            result = self._process_message(message_data, coalesced)
+        # 消息类型来自外部输入，只把已知类型作为指标标签，避免标签数量失控
+        message_type = result.get("message_type")
+        if message_type not in _KNOWN_MESSAGE_TYPES:
+            message_type = "unknown"
+        CONSUMER_MESSAGES.labels(message_type=message_type,
+                                 result="success" if result.get("success") else "failure").inc()
+        CONSUMER_MESSAGE_SECONDS.labels(message_type=message_type).observe(time.perf_counter() - start)
+        return result
+
+    def _process_message(self, message_data: Any, coalesced: bool = False) -> Dict[str, Any]:
         # 记录最原始的消息用于调试
-        logger.debug(f"收到原始消息: {json.dumps(message_data, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("收到原始消息: %s", json.dumps(message_data, ensure_ascii=False))
         
         # 自动解包被`message`键包裹的消息
         if isinstance(message_data, dict) and 'message' in message_data and isinstance(message_data['message'], dict):
@@ -39,10 +83,11 @@ class ChessGameMessageProcessor:
             elif hasattr(message_data, '__dict__'):
                 message_data = dict(message_data.__dict__)
             else:
-                logger.error(f"不支持的消息类型: {type(message_data)}，原始内容: {message_data}")
+                logger.error("不支持的消息类型: %s，原始内容: %s", type(message_data), message_data)
                 return {"success": False, "error": f"不支持的消息类型: {type(message_data)}", "raw": str(message_data)}
         
-        self._msg_count += 1
+        with self._stats_lock:
+            self._msg_count += 1
         
         result = {}
         try:
@@ -51,9 +96,10 @@ class ChessGameMessageProcessor:
                 data=message_data.get("data", {}),
                 timestamp=message_data.get("timestamp"),
                 source=message_data.get("source"),
-                priority=message_data.get("priority", 1)
+                priority=message_data.get("priority", 1),
+                coalesced=coalesced
             )
-            logger.info(f"处理消息: {message.message_type}")
+            logger.info("处理消息: %s", message.message_type)
             
             # 根据消息类型路由到不同的处理器
             if message.message_type == MessageType.CHESS_PROTOCOL_ACK.value:
@@ -65,7 +111,7 @@ class ChessGameMessageProcessor:
             elif message.message_type == MessageType.CHESS_RESPOND_RESULT_EX_ACK.value:
                 result = self._handle_chess_respond_result(message)
             else:
-                logger.warning(f"未知消息类型: {message.message_type}, 原始消息: {json.dumps(message_data, ensure_ascii=False)}")
+                logger.warning("未知消息类型: %s, 原始消息: %s", message.message_type, message_data)
                 result = {"success": False, "error": f"未知消息类型: {message.message_type}"}
             
             # 确保返回结果中包含消息类型
@@ -74,7 +120,7 @@ class ChessGameMessageProcessor:
             return result
             
         except Exception as e:
-            logger.error(f"处理消息失败: {e}", exc_info=True)
+            logger.error("处理消息失败: %s", e, exc_info=True)
             serializable_message = message_data
             if not isinstance(message_data, dict):
                 if hasattr(message_data, 'to_dict'):
@@ -101,8 +147,8 @@ class ChessGameMessageProcessor:
             players_map = event_data.get("players", {})
             red_info = players_map.get("0", {}) # seat 0 is red
             black_info = players_map.get("1", {}) # seat 1 is black
-            logger.info(f"red_info: {red_info}")
-            logger.info(f"black_info: {black_info}")
+            logger.debug("red_info: %s", red_info)
+            logger.debug("black_info: %s", black_info)
 
             if not red_info or not black_info:
                 return {"success": False, "error": "缺少玩家信息"}
@@ -141,25 +187,30 @@ class ChessGameMessageProcessor:
                 return {"success": False, "error": f"游戏创建后无法在管理器中找到: {game_id}"}
                 
             game.start_game()
-            logger.info(f"游戏协议处理成功，游戏实例创建并开始: {game_id}")
+            logger.info("游戏协议处理成功，游戏实例创建并开始: %s", game_id)
             # 我方，则让ai推荐走法
             if current_user_start:
-                logger.info(f"我方先手(uid={current_user_id})走棋，请求AI分析...")
+                logger.info("我方先手(uid=%s)走棋，请求AI分析...", current_user_id)
                 fen = game.board.to_fen()
-                logger.info(f"fen:{fen}")
+                logger.debug("fen: %s", fen)
                 is_red_turn = game.board.player_to_move == 'red'
                 board_array = game.board.fen_to_board_array(fen)  # 获取二维数组棋盘
 
-                ai_move = analyze_fen(fen, is_red_turn, board_array)
-                logger.info(f"AI推荐走法 for {game_id}: {ai_move}")
-                move = ai_move.get('move','')
-                if not move:
-                    game.board.handle_ucci_move(move)
+                session = engine_sessions.session(game_id, [])
+                self._request_analysis(AnalysisRequest(
+                    game_id=game_id,
+                    fen=fen,
+                    is_red_turn=is_red_turn,
+                    board_array=board_array,
+                    move_number=game.current_move_number,
+                    priority=message.priority,
+                    engine=session
+                ), lambda ai_move: self._publish_recommendation(game_id, session, fen, ai_move))
 
             return {"success": True, "game_id": game_id, "status": "game_created_and_started"}
 
         except Exception as e:
-            logger.error(f"处理游戏开始协议失败: {e}", exc_info=True)
+            logger.error("处理游戏开始协议失败: %s", e, exc_info=True)
             return {"success": False, "error": str(e)}
     
     def _handle_chess_move(self, message: GameMessage) -> Dict[str, Any]:
@@ -174,7 +225,7 @@ class ChessGameMessageProcessor:
 
             chess_game = game_manager.get_game(game_id)
             if not chess_game:
-                logger.warning(f"处理走棋消息时，游戏实例不存在, game_id: {game_id}")
+                logger.warning("处理走棋消息时，游戏实例不存在, game_id: %s", game_id)
                 return {"success": False, "error": f"游戏实例不存在: {game_id}"}
 
             # 解析移动数据
@@ -189,39 +240,135 @@ class ChessGameMessageProcessor:
             if not move_result.get("success"):
                 return move_result # 如果移动失败，直接返回结果
 
-            logger.info(f"执行移动成功: {game_id}, {move_result.get('notation')}")
+            logger.info("执行移动成功: %s, %s", game_id, move_result.get('notation'))
 
             # AI分析与推荐
             # 判断是否需要AI提供建议（轮到我方走棋）
             is_ai_move = False
             my_user_id = chess_game.current_user_id # 使用当前棋局的user_id
-            logger.info(f"my_user_id: {my_user_id},{chess_game.current_user_start}")
             if chess_game.current_user_start:
                 if chess_game.board.player_to_move == 'red':
                     is_ai_move = True
             else:
                 if chess_game.board.player_to_move == 'black':
                     is_ai_move = True
-            logger.info(f"red_user_id{chess_game.red_player.user_id},move:{chess_game.board.player_to_move},{is_ai_move}")
-            logger.info(f"black_user_id:{chess_game.black_player.user_id},move:{chess_game.board.player_to_move},{is_ai_move}")
-            ai_move = None
-            if is_ai_move:
-                logger.info(f"轮到我方(uid={my_user_id})走棋，请求AI分析...")
+            logger.debug("my_user_id: %s, 先手: %s, red_user_id: %s, black_user_id: %s, 轮到: %s, 我方走棋: %s",
+                         my_user_id, chess_game.current_user_start, chess_game.red_player.user_id,
+                         chess_game.black_player.user_id, chess_game.board.player_to_move, is_ai_move)
+            if is_ai_move and message.coalesced:
+                logger.info("同批次中该局还有后续走棋，跳过AI分析: %s", game_id)
+                move_result['analysis_skipped'] = 'coalesced'
+            elif is_ai_move:
+                logger.info("轮到我方(uid=%s)走棋，请求AI分析...", my_user_id)
                 fen = move_result.get('fen')
-                logger.info(f"fen:{fen}")
+                logger.debug("fen: %s", fen)
                 is_red_turn = chess_game.board.player_to_move == 'red'
                 board_array = chess_game.board.fen_to_board_array(fen) # 获取二维数组棋盘
+                # 引擎按 position startpos moves ... 接收整局走法，保留本局的置换表
+                session = engine_sessions.session(game_id, [m.ctm for m in chess_game.moves])
                 
-                ai_move = analyze_fen(fen, is_red_turn, board_array)
-                logger.info(f"AI推荐走法 for {game_id}: {ai_move}")
+                self._request_analysis(AnalysisRequest(
+                    game_id=game_id,
+                    fen=fen,
+                    is_red_turn=is_red_turn,
+                    board_array=board_array,
+                    move_number=move_result.get('move_number', chess_game.current_move_number),
+                    is_ai_move=is_ai_move,
+                    remaining_time=self._extract_remaining_time(move_data),
+                    priority=message.priority,
+                    engine=session
+                ), lambda ai_move: self._publish_recommendation(game_id, session, fen, ai_move))
+                move_result['analysis'] = 'queued'
 
-            move_result['ai_recommendation'] = ai_move
             return move_result
             
         except Exception as e:
-            logger.error(f"处理走棋消息失败: {e}", exc_info=True)
+            logger.error("处理走棋消息失败: %s", e, exc_info=True)
             return {"success": False, "error": str(e)}
     
+    def _request_analysis(self, request: AnalysisRequest,
+                          on_result: Optional[Callable[[Optional[Dict[str, Any]]], None]] = None) -> Future:
+        """
+        提交分析请求到调度器后立即返回，不阻塞消息处理线程
+
+        处理线程不等待结果，多个对局的请求才会同时留在调度器的优先队列里按优先级出队。
+        结果由 on_result 在调度器线程上发布，请求过期被丢弃时为 None；分析失败时不调用
+        （调度器已记录）。
+        """
+        future = self.scheduler.submit(request)
+        if on_result is not None:
+            future.add_done_callback(lambda done: self._deliver_result(request, done, on_result))
+        return future
+
+    @staticmethod
+    def _deliver_result(request: AnalysisRequest, future: Future, on_result):
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            on_result(future.result())
+        except Exception as e:
+            logger.error("发布AI推荐失败: game=%s, %s", request.game_id, e, exc_info=True)
+
+    def _publish_recommendation(self, game_id: str, session, fen: str, ai_move: Optional[Dict[str, Any]]):
+        """记录AI推荐走法，并按预测应着启动后台思考"""
+        if ai_move is None:
+            logger.info("分析请求已过期，未产生推荐: %s", game_id)
+            return
+        self.recommendations[game_id] = ai_move
+        logger.info("AI推荐走法 for %s: %s", game_id, ai_move)
+        if session is not None:
+            self._start_ponder(session, fen, ai_move)
+
+    def get_recommendation(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """获取对局最近一次AI推荐走法"""
+        return self.recommendations.get(game_id)
+
+    def _start_ponder(self, session, fen: str, ai_move: Dict[str, Any]):
+        """
+        推荐走法来自本地引擎时，按PV中预测的对方应着让引擎在预期局面上后台思考，
+        对方如期应着后下一次分析可直接 ponderhit 取结果。
+        """
+        best_move = ai_move.get('move')
+        ponder_move = ai_move.get('ponder_move')
+        if not best_move or not ponder_move:
+            return
+        try:
+            board = ChessBoard(fen)
+            for ucci_move in (best_move, ponder_move):
+                coords = board.parse_ucci_move(ucci_move)
+                if not coords:
+                    return
+                x1, y1, x2, y2 = coords
+                board.move_piece((x1, y1), (x2, y2))
+            expected_fen = board.to_fen()
+        except Exception as e:
+            logger.warning("无法推演预测局面，跳过后台思考: %s", e)
+            return
+        if session.start_ponder(fen, [best_move, ponder_move], expected_fen):
+            logger.info("引擎开始后台思考: 预测 %s %s -> %s", best_move, ponder_move, expected_fen)
+
+    def _is_stale_request(self, request: AnalysisRequest) -> bool:
+        """排队超过 analysis_timeout、对局已结束或已走到更新的局面时，分析请求过期"""
+        if time.time() - request.created_at > self.analysis_timeout:
+            return True
+        game = game_manager.get_game(request.game_id)
+        if game is None:
+            return False
+        if game.status == GameStatus.FINISHED:
+            return True
+        return game.current_move_number != request.move_number
+
+    @staticmethod
+    def _extract_remaining_time(move_data: Dict[str, Any]) -> Optional[int]:
+        """从走棋消息中提取剩余用时（毫秒），消息未携带时返回None"""
+        for key in ('remaining_time', 'lefttime', 'left_time'):
+            value = move_data.get(key)
+            if isinstance(value, (int, float)):
+                return int(value)
+            if isinstance(value, str) and value.isdigit():
+                return int(value)
+        return None
+
     def _handle_chess_game_over(self, message: GameMessage) -> Dict[str, Any]:
         """处理游戏结束消息，仅做标记，不判定胜负"""
         try:
@@ -236,7 +383,7 @@ class ChessGameMessageProcessor:
             
             chess_game = game_manager.get_game(game_id)
             if not chess_game:
-                logger.warning(f"处理游戏结束消息时，游戏实例不存在, game_id: {game_id}")
+                logger.warning("处理游戏结束消息时，游戏实例不存在, game_id: %s", game_id)
                 return {"success": False, "error": f"游戏实例不存在: {game_id}"}
             
             # 标记游戏结束，但不判定胜负
@@ -245,8 +392,10 @@ class ChessGameMessageProcessor:
             # 可选：记录结束原因
             chess_game.extra_info['end_reason'] = end_reason
             chess_game._update_game_in_database()
+            engine_sessions.release(game_id)
+            self.recommendations.pop(game_id, None)
             
-            logger.info(f"游戏结束: {game_id}, 原因: {end_reason}")
+            logger.info("游戏结束: %s, 原因: %s", game_id, end_reason)
             
             return {
                 "success": True,
@@ -255,7 +404,7 @@ class ChessGameMessageProcessor:
                 "status": "finished"
             }
         except Exception as e:
-            logger.error(f"处理游戏结束消息失败: {e}", exc_info=True)
+            logger.error("处理游戏结束消息失败: %s", e, exc_info=True)
             return {"success": False, "error": str(e)}
     
     def _handle_chess_respond_result(self, message: GameMessage) -> Dict[str, Any]:
@@ -274,7 +423,7 @@ class ChessGameMessageProcessor:
             
             chess_game = game_manager.get_game(game_id)
             if not chess_game:
-                logger.warning(f"处理游戏结果响应消息时，游戏实例不存在, game_id: {game_id}")
+                logger.warning("处理游戏结果响应消息时，游戏实例不存在, game_id: %s", game_id)
                 return {"success": False, "error": f"游戏实例不存在: {game_id}"}
             
             # 判定胜负
@@ -285,8 +434,10 @@ class ChessGameMessageProcessor:
             
             chess_game.end_game(result)
             chess_game._update_game_in_database()
+            engine_sessions.release(game_id)
+            self.recommendations.pop(game_id, None)
             
-            logger.info(f"游戏结果确认: {game_id}, 失败方: {loss_seat}, 结果: {result.value}")
+            logger.info("游戏结果确认: %s, 失败方: %s, 结果: %s", game_id, loss_seat, result.value)
             
             return {
                 "success": True,
@@ -296,7 +447,7 @@ class ChessGameMessageProcessor:
                 "status": "finished"
             }
         except Exception as e:
-            logger.error(f"处理游戏结果消息失败: {e}", exc_info=True)
+            logger.error("处理游戏结果消息失败: %s", e, exc_info=True)
             return {"success": False, "error": str(e)}
     
     def _create_chess_game_instance(self, game_id: str, players_info: Dict[str, Any]):
@@ -338,14 +489,14 @@ class ChessGameMessageProcessor:
                 game_instance = game_manager.get_game(game_id)
                 if game_instance:
                     game_instance.start_game()
-                    logger.info(f"开始游戏: {game_id}")
+                    logger.info("开始游戏: %s", game_id)
                 else:
-                    logger.error(f"无法获取游戏实例: {game_id}")
+                    logger.error("无法获取游戏实例: %s", game_id)
             else:
-                logger.error(f"创建游戏实例失败: {game_id}")
+                logger.error("创建游戏实例失败: %s", game_id)
             
         except Exception as e:
-            logger.error(f"创建游戏实例失败: {e}")
+            logger.error("创建游戏实例失败: %s", e)
     
     def get_game_status(self, game_id: str) -> Optional[Dict[str, Any]]:
         """获取游戏状态"""
@@ -361,10 +512,13 @@ class ChessGameMessageProcessor:
 
     def get_statistics(self):
         """返回简单的消息统计信息"""
+        with self._stats_lock:
+            total_messages = self._msg_count
         return {
-            "total_messages": self._msg_count,
+            "total_messages": total_messages,
             "active_games": len(self.active_games),
-            "user_games": len(self.user_games)
+            "user_games": len(self.user_games),
+            "analysis": dict(self.scheduler.stats, pending=self.scheduler.pending_count())
         }
 
 
@@ -25,6 +25,7 @@ class GameMessage:
     timestamp: str
     source: str
     priority: int
+    coalesced: bool = False  # 批量消费时被同局后续走棋覆盖，无需AI分析
 
 @dataclass
 class ChessMessage:
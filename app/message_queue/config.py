@@ -36,7 +36,27 @@ class Config:
         'batch_size': int(os.getenv('CONSUMER_BATCH_SIZE', 10)),
         'timeout': int(os.getenv('CONSUMER_TIMEOUT', 1)),
         'retry_count': int(os.getenv('CONSUMER_RETRY_COUNT', 3)),
-        'retry_delay': int(os.getenv('CONSUMER_RETRY_DELAY', 1))
+        'retry_delay': int(os.getenv('CONSUMER_RETRY_DELAY', 1)),
+        # 批量模式下并发处理不同对局的线程数
+        'max_workers': int(os.getenv('CONSUMER_MAX_WORKERS', 4)),
+        # AI分析请求排队超过该秒数仍未开始则丢弃（结果已无意义）
+        'analysis_timeout': int(os.getenv('CONSUMER_ANALYSIS_TIMEOUT', 90)),
+        # 消费后端: list (brpop) 或 stream (Redis Streams消费者组)
+        'backend': os.getenv('CONSUMER_BACKEND', 'list'),
+        # 指标 HTTP 服务端口 (/metrics)，0 表示不启动
+        'metrics_port': int(os.getenv('CONSUMER_METRICS_PORT', 9108))
+    }
+    
+    # Redis Streams配置
+    STREAM_CONFIG = {
+        'stream_name': os.getenv('STREAM_NAME', 'chess_message_stream'),
+        'group_name': os.getenv('STREAM_GROUP', 'chess_consumer_group'),
+        'consumer_name': os.getenv('STREAM_CONSUMER_NAME') or None,
+        'dead_letter_stream': os.getenv('STREAM_DEAD_LETTER', 'chess_message_dead_letter'),
+        'block_ms': int(os.getenv('STREAM_BLOCK_MS', 1000)),
+        'claim_min_idle_ms': int(os.getenv('STREAM_CLAIM_MIN_IDLE_MS', 30000)),
+        'claim_interval': int(os.getenv('STREAM_CLAIM_INTERVAL', 5)),
+        'maxlen': int(os.getenv('STREAM_MAXLEN', 100000))
     }
     
     @classmethod
@@ -59,6 +79,11 @@ class Config:
         """获取消费者配置"""
         return cls.CONSUMER_CONFIG.copy()
     
+    @classmethod
+    def get_stream_config(cls) -> Dict[str, Any]:
+        """获取Redis Streams配置"""
+        return cls.STREAM_CONFIG.copy()
+    
     @classmethod
     def validate_config(cls) -> bool:
         """验证配置"""
@@ -101,4 +126,17 @@ CONSUMER_BATCH_SIZE=10
 CONSUMER_TIMEOUT=1
 CONSUMER_RETRY_COUNT=3
 CONSUMER_RETRY_DELAY=1
+CONSUMER_MAX_WORKERS=4
+CONSUMER_ANALYSIS_TIMEOUT=90
+# list 或 stream
+CONSUMER_BACKEND=list
+
+# Redis Streams配置（CONSUMER_BACKEND=stream 时生效）
+STREAM_NAME=chess_message_stream
+STREAM_GROUP=chess_consumer_group
+STREAM_DEAD_LETTER=chess_message_dead_letter
+STREAM_BLOCK_MS=1000
+STREAM_CLAIM_MIN_IDLE_MS=30000
+STREAM_CLAIM_INTERVAL=5
+STREAM_MAXLEN=100000
 """ 
\ No newline at end of file
@@ -5,13 +5,50 @@ import json
 import threading
 import logging
 import time
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, Any, List, Set
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import redis
-from .chess_message_models import ChessMessage
+from app.metrics import QUEUE_LENGTH
+from .chess_message_models import ChessMessage, MessageType
 
 logger = logging.getLogger(__name__)
 
+ERROR_QUEUE = 'chess_message_error_queue'
+
+
+def _unwrap_message(msg_dict: Any) -> Any:
+    """与处理器保持一致：自动解包被`message`键包裹的消息"""
+    if isinstance(msg_dict, dict) and isinstance(msg_dict.get('message'), dict):
+        return msg_dict['message']
+    return msg_dict
+
+
+def _get_game_id(msg_dict: Any) -> Optional[str]:
+    """提取消息所属的对局ID，无法识别时返回None"""
+    inner = _unwrap_message(msg_dict)
+    if not isinstance(inner, dict):
+        return None
+    game = (inner.get('data') or {}).get('game') or {}
+    return game.get('gameid') if isinstance(game, dict) else None
+
+
+def _coalesce_moves(messages: List[Dict[str, Any]]) -> Set[int]:
+    """
+    同一对局中，后面紧跟另一条走棋消息的走棋消息不再触发AI分析
+
+    Returns:
+        Set[int]: 被合并的消息下标。标记不写入消息本身，失败转入错误队列的仍是原始内容
+    """
+    coalesced = set()
+    for index, (current, following) in enumerate(zip(messages, messages[1:])):
+        current_inner, following_inner = _unwrap_message(current), _unwrap_message(following)
+        if (isinstance(current_inner, dict) and isinstance(following_inner, dict)
+                and current_inner.get('message_type') == MessageType.CHESS_MOVE_ACK.value
+                and following_inner.get('message_type') == MessageType.CHESS_MOVE_ACK.value):
+            coalesced.add(index)
+    return coalesced
+
 class RedisConsumer:
     """Redis消息消费者"""
     
@@ -20,7 +57,11 @@ class RedisConsumer:
                  port: int = 6379,
                  db: int = 0,
                  password: str = '123456',
-                 queue_name: str = 'chess_message_queue'):
+                 queue_name: str = 'chess_message_queue',
+                 batch_size: int = 1,
+                 max_workers: int = 4,
+                 timeout: int = 1,
+                 redis_client: Optional[redis.Redis] = None):
         """
         初始化Redis消费者
         
@@ -30,16 +71,28 @@ class RedisConsumer:
             db: Redis数据库编号
             password: Redis密码
             queue_name: 队列名称
+            batch_size: 每次往返最多拉取的消息数，1表示逐条消费
+            max_workers: 批量模式下并发处理不同对局的线程数
+            timeout: brpop阻塞等待秒数
+            redis_client: 已创建的Redis客户端（测试时可传入fakeredis）
         """
         self.host = host
         self.port = port
         self.db = db
         self.password = password
         self.queue_name = queue_name
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
         self.handler: Optional[Callable] = None
         self.consumer_thread = None
         self.running = False
         
+        if redis_client is not None:
+            self.redis = redis_client
+            return
+
         # 创建Redis连接
         try:
             self.redis = redis.StrictRedis(
@@ -61,7 +114,8 @@ class RedisConsumer:
         设置消息处理器
         
         Args:
-            handler: 消息处理函数，接收ChessMessage对象，返回处理是否成功
+            handler: 消息处理函数，接收消息字典，返回处理结果字典。
+                批量模式下被同局后续走棋合并的消息以 handler(msg, coalesced=True) 调用
         """
         self.handler = handler
         print("✅ 消息处理器设置成功")
@@ -78,6 +132,8 @@ class RedisConsumer:
             return
             
         self.running = True
+        # 队列长度在抓取指标时才查询
+        QUEUE_LENGTH.labels(queue=self.queue_name).set_function(self.get_queue_length)
         self.consumer_thread = threading.Thread(target=self._consume_messages, args=(max_messages,), daemon=True)
         self.consumer_thread.start()
         print(f"✅ Redis消费者已启动，队列: {self.queue_name}")
@@ -116,52 +172,122 @@ class RedisConsumer:
                 self.running = False
                 break
 
-            msg_dict = None # 在 try 外部初始化
+            limit = self.batch_size
+            if max_messages is not None:
+                limit = min(limit, max_messages - consumed_count)
+
             try:
-                # 从Redis队列获取消息
-                msg_json = self.redis.brpop(self.queue_name, timeout=1)
-                if not msg_json:
+                # 从Redis队列获取消息（批量模式下一次往返最多取 batch_size 条）
+                msg_strs = self._fetch_messages(limit)
+                if not msg_strs:
                     continue
                 
-                consumed_count += 1
-                    
-                _, msg_str = msg_json
-                msg_dict = json.loads(msg_str)
+                consumed_count += len(msg_strs)
+                if len(msg_strs) == 1:
+                    self._process_raw_message(msg_strs[0])
+                else:
+                    self._dispatch_batch(msg_strs)
+
+            except Exception as e:
+                print(f"❌ Redis消息消费失败: {e}")
+                time.sleep(1)  # 避免频繁重试
+
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _fetch_messages(self, limit: int) -> List[str]:
+        """
+        拉取一批消息：先用 brpop 阻塞等待第一条，再用 RPOP count 一次取走剩余的
+
+        Args:
+            limit: 本次最多拉取的消息数
+
+        Returns:
+            List[str]: 原始消息字符串列表，按入队顺序排列
+        """
+        msg_json = self.redis.brpop(self.queue_name, timeout=self.timeout)
+        if not msg_json:
+            return []
+        _, msg_str = msg_json
+        msg_strs = [msg_str]
+        if limit > 1:
+            # RPOP key count 需要 Redis >= 6.2
+            rest = self.redis.rpop(self.queue_name, limit - 1)
+            if rest:
+                msg_strs.extend(rest)
+        return msg_strs
+
+    def _process_raw_message(self, msg_str: str):
+        """解析并处理单条原始消息，无法解析的消息移入错误队列"""
+        try:
+            msg_dict = json.loads(msg_str)
+        except json.JSONDecodeError as e:
+            print(f"❌ 消息JSON解析失败: {e} - 原始消息: {msg_str}")
+            # 将无法解析的原始字符串存入错误队列
+            self.redis.lpush(ERROR_QUEUE, msg_str)
+            logger.error(f"无法解析的JSON消息已移入错误队列: {msg_str}")
+            return
+        self._handle_message(msg_dict)
+
+    def _handle_message(self, msg_dict: Dict[str, Any], coalesced: bool = False):
+        """调用处理器处理消息字典，失败的消息转移到错误队列"""
+        # 直接将字典传递给处理器，不再反序列化为对象
+        if not self.handler:
+            return
+        try:
+            result = self.handler(msg_dict, coalesced=True) if coalesced else self.handler(msg_dict)
+            message_type = result.get("message_type", "unknown")
+
+            if result.get("success"):
+                print(f"✅ 消息处理成功: {message_type}")
+            else:
+                error_msg = result.get('error', '未知错误')
+                print(f"❌ 消息处理失败: {message_type}, 原因: {error_msg}")
                 
-                # 直接将字典传递给处理器，不再反序列化为对象
-                if self.handler:
-                    try:
-                        # 确保传递的是字典
-                        result = self.handler(msg_dict)
-                        message_type = result.get("message_type", "unknown")
-
-                        if result.get("success"):
-                            print(f"✅ 消息处理成功: {message_type}")
-                        else:
-                            error_msg = result.get('error', '未知错误')
-                            print(f"❌ 消息处理失败: {message_type}, 原因: {error_msg}")
-                            
-                            # 失败消息转移到错误队列，使用原始字典
-                            if msg_dict:
-                                self.redis.lpush('chess_message_error_queue', json.dumps(msg_dict))
-                                logger.warning(f"消息处理失败，已移入错误队列: {message_type}")
-
-                    except Exception as e:
-                        print(f"❌ 消息处理器异常: {e}")
-                        # 处理器异常时，也将消息移入错误队列
-                        if msg_dict:
-                            self.redis.lpush('chess_message_error_queue', json.dumps(msg_dict))
-                            logger.error(f"处理器异常，消息已移入错误队列: {e}", exc_info=True)
-                        
+                # 失败消息转移到错误队列，使用原始字典
+                self.redis.lpush(ERROR_QUEUE, json.dumps(msg_dict))
+                logger.warning(f"消息处理失败，已移入错误队列: {message_type}")
+
+        except Exception as e:
+            print(f"❌ 消息处理器异常: {e}")
+            # 处理器异常时，也将消息移入错误队列
+            self.redis.lpush(ERROR_QUEUE, json.dumps(msg_dict))
+            logger.error(f"处理器异常，消息已移入错误队列: {e}", exc_info=True)
+
+    def _dispatch_batch(self, msg_strs: List[str]):
+        """
+        处理一批消息：按对局分组，组内保持顺序串行处理，不同对局并发处理。
+        同一对局中连续的走棋消息只让最后一条触发AI分析，其余以 coalesced=True 交给处理器。
+        """
+        groups: Dict[Any, List[Dict[str, Any]]] = {}
+        for msg_str in msg_strs:
+            try:
+                msg_dict = json.loads(msg_str)
             except json.JSONDecodeError as e:
                 print(f"❌ 消息JSON解析失败: {e} - 原始消息: {msg_str}")
-                # 将无法解析的原始字符串存入错误队列
-                self.redis.lpush('chess_message_error_queue', msg_str)
+                self.redis.lpush(ERROR_QUEUE, msg_str)
                 logger.error(f"无法解析的JSON消息已移入错误队列: {msg_str}")
+                continue
+            groups.setdefault(_get_game_id(msg_dict), []).append(msg_dict)
 
-            except Exception as e:
-                print(f"❌ Redis消息消费失败: {e}")
-                time.sleep(1)  # 避免频繁重试
+        logger.info(f"批量拉取 {len(msg_strs)} 条消息，涉及 {len(groups)} 个对局")
+        if len(groups) == 1 or self.max_workers <= 1:
+            for messages in groups.values():
+                self._handle_group(messages)
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='chess-consumer')
+        futures = [self._executor.submit(self._handle_group, messages) for messages in groups.values()]
+        for future in futures:
+            future.result()
+
+    def _handle_group(self, messages: List[Dict[str, Any]]):
+        """按顺序处理同一对局的消息"""
+        coalesced = _coalesce_moves(messages)
+        for index, msg_dict in enumerate(messages):
+            self._handle_message(msg_dict, coalesced=index in coalesced)
 
     def get_queue_length(self) -> int:
         """获取队列长度"""
@@ -0,0 +1,344 @@
+"""
+Redis Streams消费者 - 基于消费者组的可靠消费
+
+与 RedisConsumer (brpop) 不同，消息在处理成功后才 XACK 确认：
+进程在处理中途退出时，消息仍留在消费者组的 PEL (pending entries list) 中，
+由其他消费者通过 XAUTOCLAIM 认领并重新投递。多个消费者进程可以加入同一个
+消费者组安全地分担负载。超过重试次数的消息转入死信流。
+"""
+import json
+import os
+import socket
+import threading
+import logging
+import time
+from datetime import datetime
+from typing import Optional, Callable, Dict, Any, Tuple
+import redis
+from app.metrics import QUEUE_LENGTH, QUEUE_PENDING
+
+logger = logging.getLogger(__name__)
+
+# 消息体在流条目中的字段名
+PAYLOAD_FIELD = 'payload'
+
+
+class RedisStreamConsumer:
+    """Redis Streams消息消费者（XREADGROUP / XACK / XAUTOCLAIM）"""
+
+    def __init__(self,
+                 host: str = 'localhost',
+                 port: int = 6379,
+                 db: int = 0,
+                 password: str = '123456',
+                 stream_name: str = 'chess_message_stream',
+                 group_name: str = 'chess_consumer_group',
+                 consumer_name: Optional[str] = None,
+                 dead_letter_stream: str = 'chess_message_dead_letter',
+                 batch_size: int = 10,
+                 block_ms: int = 1000,
+                 retry_count: int = 3,
+                 retry_delay: float = 1,
+                 claim_min_idle_ms: int = 30000,
+                 claim_interval: float = 5,
+                 maxlen: Optional[int] = None,
+                 redis_client: Optional[redis.Redis] = None):
+        """
+        初始化Redis Streams消费者
+
+        Args:
+            host: Redis主机地址
+            port: Redis端口
+            db: Redis数据库编号
+            password: Redis密码
+            stream_name: 消息流名称
+            group_name: 消费者组名称
+            consumer_name: 组内消费者名称，默认使用 主机名-进程号
+            dead_letter_stream: 死信流名称
+            batch_size: 每次 XREADGROUP 读取的最大消息数
+            block_ms: XREADGROUP 阻塞等待时间（毫秒）
+            retry_count: 处理失败后的最大重试次数
+            retry_delay: 首次重试的等待秒数，之后按指数退避翻倍
+            claim_min_idle_ms: 待确认消息空闲多久后允许被其他消费者认领（毫秒）
+            claim_interval: 执行 XAUTOCLAIM 的间隔（秒）
+            maxlen: 发布消息时流的近似最大长度，None表示不裁剪
+            redis_client: 已创建的Redis客户端（测试时可传入fakeredis）
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.stream_name = stream_name
+        self.group_name = group_name
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.dead_letter_stream = dead_letter_stream
+        self.batch_size = max(1, batch_size)
+        self.block_ms = block_ms
+        self.retry_count = max(0, retry_count)
+        self.retry_delay = retry_delay
+        self.claim_min_idle_ms = claim_min_idle_ms
+        self.claim_interval = claim_interval
+        self.maxlen = maxlen
+        self.handler: Optional[Callable] = None
+        self.consumer_thread = None
+        self.running = False
+        self._claim_cursor = '0-0'
+        self._last_claim_time = 0.0
+
+        if redis_client is not None:
+            self.redis = redis_client
+        else:
+            try:
+                self.redis = redis.StrictRedis(
+                    host=self.host,
+                    port=self.port,
+                    db=self.db,
+                    password=self.password,
+                    decode_responses=True
+                )
+                self.redis.ping()
+                print(f"✅ 成功连接到Redis: {self.host}:{self.port}")
+            except Exception as e:
+                print(f"❌ Redis连接失败: {e}")
+                raise
+
+        self._ensure_group()
+
+    def _ensure_group(self):
+        """创建消费者组（已存在时忽略），流不存在时一并创建"""
+        try:
+            self.redis.xgroup_create(self.stream_name, self.group_name, id='0', mkstream=True)
+            logger.info(f"创建消费者组: {self.group_name} (stream={self.stream_name})")
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def set_message_handler(self, handler: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """
+        设置消息处理器
+
+        Args:
+            handler: 消息处理函数，接收消息字典，返回包含 success 字段的结果字典
+        """
+        self.handler = handler
+        print("✅ 消息处理器设置成功")
+
+    def publish(self, message: Dict[str, Any]) -> str:
+        """
+        向消息流发布一条消息
+
+        Args:
+            message: 消息字典，格式同 ChessMessage.to_dict()
+
+        Returns:
+            str: 流条目ID
+        """
+        payload = json.dumps(message, ensure_ascii=False)
+        if self.maxlen:
+            return self.redis.xadd(self.stream_name, {PAYLOAD_FIELD: payload},
+                                   maxlen=self.maxlen, approximate=True)
+        return self.redis.xadd(self.stream_name, {PAYLOAD_FIELD: payload})
+
+    def start_consumer(self, max_messages: Optional[int] = None):
+        """
+        启动消费者
+
+        Args:
+            max_messages (Optional[int]): 最大消费消息数量，消费后自动停止。默认为None，无限循环。
+        """
+        if self.running:
+            print("⚠️ 消费者已在运行")
+            return
+
+        self.running = True
+        # 流长度与待确认数在抓取指标时才查询
+        QUEUE_LENGTH.labels(queue=self.stream_name).set_function(self.get_queue_length)
+        QUEUE_PENDING.labels(queue=self.stream_name).set_function(self.get_pending_count)
+        self.consumer_thread = threading.Thread(target=self._consume_messages, args=(max_messages,), daemon=True)
+        self.consumer_thread.start()
+        print(f"✅ Redis Streams消费者已启动，流: {self.stream_name}，消费者组: {self.group_name}，消费者: {self.consumer_name}")
+
+    def stop_consumer(self):
+        """停止消费者，未确认的消息留在PEL中等待重新投递"""
+        if not self.running:
+            return
+
+        self.running = False
+        if self.consumer_thread and self.consumer_thread.is_alive():
+            print("\nℹ️ 正在等待消费线程退出...")
+            try:
+                self.consumer_thread.join(timeout=5)
+            except KeyboardInterrupt:
+                print("\n⚠️ 检测到强制退出信号，将立即退出。")
+
+            if self.consumer_thread.is_alive():
+                print("⚠️ 消费线程未能在5秒内正常退出。程序将强制终止。")
+
+        print("✅ Redis Streams消费者已停止。")
+
+    def _consume_messages(self, max_messages: Optional[int] = None):
+        """
+        消费循环：定期认领超时的待确认消息，然后读取新消息
+
+        Args:
+            max_messages (Optional[int]): 最大消费消息数量。
+        """
+        consumed_count = 0
+        while self.running:
+            if max_messages is not None and consumed_count >= max_messages:
+                print(f"ℹ️ 已达到指定消费数量 {max_messages}，消费者自动停止。")
+                self.running = False
+                break
+
+            limit = self.batch_size
+            if max_messages is not None:
+                limit = min(limit, max_messages - consumed_count)
+
+            try:
+                if time.monotonic() - self._last_claim_time >= self.claim_interval:
+                    self._last_claim_time = time.monotonic()
+                    consumed_count += self._reclaim_pending(limit)
+                    continue
+
+                response = self.redis.xreadgroup(
+                    self.group_name, self.consumer_name,
+                    {self.stream_name: '>'},
+                    count=limit, block=self.block_ms
+                )
+                if not response:
+                    continue
+
+                for _, entries in response:
+                    for message_id, fields in entries:
+                        self._process_entry(message_id, fields)
+                        consumed_count += 1
+
+            except Exception as e:
+                print(f"❌ Redis Streams消息消费失败: {e}")
+                logger.error(f"Redis Streams消息消费失败: {e}", exc_info=True)
+                time.sleep(1)  # 避免频繁重试
+
+    def _reclaim_pending(self, count: Optional[int] = None) -> int:
+        """
+        通过 XAUTOCLAIM 认领其他消费者（可能已崩溃）长时间未确认的消息并处理。
+        投递次数已超过上限的消息直接转入死信流，避免毒消息反复拖垮消费者。
+
+        Returns:
+            int: 本次认领的消息数量
+        """
+        count = count or self.batch_size
+        response = self.redis.xautoclaim(
+            self.stream_name, self.group_name, self.consumer_name,
+            min_idle_time=self.claim_min_idle_ms,
+            start_id=self._claim_cursor, count=count
+        )
+        # Redis 7 返回 [next_cursor, entries, deleted_ids]，Redis 6.2 没有第三项
+        next_cursor, entries = response[0], response[1]
+        self._claim_cursor = next_cursor or '0-0'
+
+        for message_id, fields in entries:
+            deliveries = self._get_delivery_count(message_id)
+            logger.warning(f"认领待确认消息: {message_id}, 已投递 {deliveries} 次")
+            if deliveries > self.retry_count + 1:
+                self._dead_letter(message_id, fields, f"超过最大投递次数({deliveries})", deliveries)
+                continue
+            self._process_entry(message_id, fields)
+        return len(entries)
+
+    def _get_delivery_count(self, message_id: str) -> int:
+        """查询消息在消费者组中的投递次数"""
+        pending = self.redis.xpending_range(self.stream_name, self.group_name,
+                                            min=message_id, max=message_id, count=1)
+        return pending[0]['times_delivered'] if pending else 1
+
+    def _process_entry(self, message_id: str, fields: Optional[Dict[str, str]]) -> bool:
+        """
+        处理单条流消息：成功则 XACK，失败按指数退避重试，重试耗尽后转入死信流
+
+        Returns:
+            bool: 是否处理成功
+        """
+        if not fields or PAYLOAD_FIELD not in fields:
+            # 条目已被裁剪/删除或格式不符，直接确认避免反复投递
+            logger.warning(f"流条目缺少消息体，直接确认: {message_id}")
+            self.redis.xack(self.stream_name, self.group_name, message_id)
+            return False
+
+        try:
+            msg_dict = json.loads(fields[PAYLOAD_FIELD])
+        except json.JSONDecodeError as e:
+            print(f"❌ 消息JSON解析失败: {e} - 原始消息: {fields[PAYLOAD_FIELD]}")
+            self._dead_letter(message_id, fields, f"JSON解析失败: {e}")
+            return False
+
+        error = None
+        for attempt in range(self.retry_count + 1):
+            success, error = self._invoke_handler(msg_dict)
+            if success:
+                self.redis.xack(self.stream_name, self.group_name, message_id)
+                return True
+            if attempt < self.retry_count:
+                delay = self.retry_delay * (2 ** attempt)
+                logger.warning(f"消息处理失败，{delay}秒后第{attempt + 1}次重试: {message_id}, 原因: {error}")
+                time.sleep(delay)
+
+        self._dead_letter(message_id, fields, error, self.retry_count + 1)
+        return False
+
+    def _invoke_handler(self, msg_dict: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+        """调用消息处理器，返回 (是否成功, 错误信息)"""
+        if not self.handler:
+            return True, None
+        try:
+            result = self.handler(msg_dict) or {}
+            message_type = result.get("message_type", "unknown")
+            if result.get("success"):
+                print(f"✅ 消息处理成功: {message_type}")
+                return True, None
+            error_msg = result.get('error', '未知错误')
+            print(f"❌ 消息处理失败: {message_type}, 原因: {error_msg}")
+            return False, error_msg
+        except Exception as e:
+            print(f"❌ 消息处理器异常: {e}")
+            logger.error(f"消息处理器异常: {e}", exc_info=True)
+            return False, str(e)
+
+    def _dead_letter(self, message_id: str, fields: Dict[str, str], reason: Optional[str], deliveries: int = 1):
+        """将消息写入死信流并在原消费者组中确认"""
+        entry = {
+            PAYLOAD_FIELD: fields.get(PAYLOAD_FIELD, ''),
+            'original_id': message_id,
+            'error': str(reason or '未知错误'),
+            'consumer': self.consumer_name,
+            'deliveries': deliveries,
+            'failed_at': datetime.now().isoformat()
+        }
+        pipe = self.redis.pipeline()
+        pipe.xadd(self.dead_letter_stream, entry)
+        pipe.xack(self.stream_name, self.group_name, message_id)
+        pipe.execute()
+        logger.error(f"消息已移入死信流 {self.dead_letter_stream}: {message_id}, 原因: {reason}")
+
+    def get_queue_length(self) -> int:
+        """获取流长度"""
+        try:
+            return self.redis.xlen(self.stream_name)
+        except Exception as e:
+            print(f"❌ 获取流长度失败: {e}")
+            return 0
+
+    def get_pending_count(self) -> int:
+        """获取消费者组中已投递但未确认的消息数量"""
+        try:
+            return self.redis.xpending(self.stream_name, self.group_name).get('pending', 0)
+        except Exception as e:
+            print(f"❌ 获取待确认消息数量失败: {e}")
+            return 0
+
+    def __enter__(self):
+        """上下文管理器入口"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """上下文管理器出口"""
+        self.stop_consumer()
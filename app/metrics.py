@@ -0,0 +1,352 @@
+"""
+进程内指标注册表（Prometheus 文本格式）
+
+支持 counter、gauge、histogram 三种指标，可带标签：
+    SEARCHES = registry.counter('chess_engine_searches_total', '引擎搜索次数', ['mode'])
+    SEARCHES.labels(mode='go').inc()
+
+    with ENGINE_SEARCH_SECONDS.time():
+        ...
+
+队列长度这类只在抓取时才有意义的值用 set_function 注册回调，抓取时调用。
+render() 输出文本格式 (text/plain; version=0.0.4)，Flask 应用通过 /api/metrics 暴露，
+消费者进程通过 start_metrics_server 启动的小型 HTTP 服务暴露。
+
+gunicorn 多 worker 部署时每个 worker 有独立的注册表，抓取到的是处理该请求的 worker 的值。
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认直方图桶上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, int) or (value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Value:
+    """counter / gauge 的单个时间序列"""
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = float(value)
+
+    def set_function(self, function: Callable[[], float]):
+        """抓取时调用 function 取值，例如队列长度"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception as e:
+                logger.warning(f"指标回调失败: {e}")
+                return math.nan
+        with self._lock:
+            return self._value
+
+
+class _CounterValue(_Value):
+    def inc(self, amount: float = 1):
+        if amount < 0:
+            raise ValueError('counter 只能增加')
+        super().inc(amount)
+
+
+class _GaugeValue(_Value):
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    """histogram 的单个时间序列"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Metric:
+    """一个指标族：同名、同类型，按标签值区分时间序列"""
+
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} 带有标签，需要先调用 labels()")
+        return self.labels()
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class _SimpleMetric(Metric):
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+    def get(self) -> float:
+        return self._default().get()
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+
+
+class Counter(_SimpleMetric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+
+class Gauge(_SimpleMetric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != math.inf:
+            buckets += (math.inf,)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        """各时间序列的 (各桶非累计计数, 总和)，按标签值索引"""
+        with self._lock:
+            children = list(self._children.items())
+        return {values: child.snapshot() for values, child in children}
+
+    def samples(self):
+        for values, (counts, total) in self.snapshot().items():
+            yield from histogram_samples(self.name, self.labelnames, values, self.buckets, counts, total)
+
+
+def histogram_samples(name, labelnames, values, buckets, counts, total) -> Iterable[str]:
+    """按文本格式输出一个 histogram 时间序列（counts 为各桶非累计计数）"""
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        labels = _format_labels(labelnames, values, (('le', _format_value(bound)),))
+        yield f"{name}_bucket{labels} {cumulative}"
+    labels = _format_labels(labelnames, values)
+    yield f"{name}_sum{labels} {_format_value(total)}"
+    yield f"{name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """指标注册表；同名指标重复注册时返回已有实例，便于模块重复导入"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"指标 {name} 已以不同类型或标签注册")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+# --- 各热点路径使用的指标 ---
+
+ENGINE_SEARCHES = registry.counter(
+    'chess_engine_searches_total', '引擎搜索次数（mode: go 正常搜索, ponderhit 命中后台思考）', ['mode'])
+ENGINE_SEARCH_SECONDS = registry.histogram(
+    'chess_engine_search_seconds', '引擎单次搜索耗时', ['mode'])
+ENGINE_NPS = registry.gauge('chess_engine_nps', '最近一次搜索报告的每秒节点数')
+
+CLOUD_REQUESTS = registry.counter(
+    'chess_cloud_requests_total', '云库查询次数（result: hit 有收录着法, miss 未收录, error 请求失败）', ['result'])
+CLOUD_REQUEST_SECONDS = registry.histogram('chess_cloud_request_seconds', '云库查询耗时')
+
+DB_COMMIT_SECONDS = registry.histogram(
+    'chess_db_commit_seconds', '数据库写入（执行+提交）耗时', ['operation'])
+DB_ERRORS = registry.counter('chess_db_errors_total', '数据库写入失败次数', ['operation'])
+DB_POOL_CONNECTIONS = registry.gauge(
+    'chess_db_pool_connections', '数据库连接数（state: open 已建立, checked_out 正在使用）', ['state'])
+DB_POOL_CONNECTS = registry.counter('chess_db_pool_connects_total', '新建数据库连接次数')
+DB_POOL_INVALIDATIONS = registry.counter(
+    'chess_db_pool_invalidations_total', '失效被丢弃的数据库连接数（预检失败、连接断开）')
+
+QUEUE_LENGTH = registry.gauge('chess_queue_length', 'Redis 队列/流中的消息数', ['queue'])
+QUEUE_PENDING = registry.gauge('chess_queue_pending', 'Redis 流中已投递未确认的消息数', ['queue'])
+CONSUMER_MESSAGES = registry.counter(
+    'chess_consumer_messages_total', '消费者处理的消息数', ['message_type', 'result'])
+CONSUMER_MESSAGE_SECONDS = registry.histogram(
+    'chess_consumer_message_seconds', '消费者处理单条消息的耗时', ['message_type'])
+ANALYSIS_PENDING = registry.gauge('chess_analysis_pending', '等待引擎分析的请求数')
+
+RECOGNITION_STAGE_SECONDS = registry.histogram(
+    'chess_recognition_stage_seconds', '识别各阶段耗时（见 app.services.recognition.timing）', ['stage'],
+    buckets=(0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5))
+
+
+# --- 独立 HTTP 服务（消费者进程） ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = registry
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format % args)
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0', metrics_registry: MetricsRegistry = registry):
+    """
+    在后台线程中启动只提供 /metrics 的 HTTP 服务
+
+    Returns:
+        ThreadingHTTPServer: 调用 shutdown() 停止；port 为 0 时实际端口见 server_address
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': metrics_registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logger.info(f"指标服务已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -20,12 +20,13 @@ class AiChess(Base):
     created_at = Column(DateTime, server_default=func.now(), comment='记录创建时间')
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment='记录更新时间')
 
+# SQLite 只有 INTEGER PRIMARY KEY 会自增，BIGINT 主键在 SQLite 上映射为 INTEGER
 class AIChessGame(Base):
     __tablename__ = 'ai_chess_game'
     __table_args__ = (
         UniqueConstraint('chess_id', name='uq_chess_id'),
     )
-    id = Column(BigInteger, primary_key=True, autoincrement=True, comment='主键，自增ID')
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True, comment='主键，自增ID')
     chess_id = Column(String(64), nullable=False, comment='棋局唯一ID')
     match_id = Column(BigInteger, comment='比赛ID')
     start_time = Column(DateTime, comment='对局开始时间')
@@ -37,7 +38,7 @@ class AIChessGame(Base):
 
 class AIChessMove(Base):
     __tablename__ = 'ai_chess_move'
-    id = Column(BigInteger, primary_key=True, autoincrement=True, comment='主键，自增ID')
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True, comment='主键，自增ID')
     game_id = Column(BigInteger, ForeignKey('ai_chess_game.id'), nullable=False, comment='关联ai_chess_game.id')
     chess_id = Column(String(64), nullable=False, comment='棋局唯一ID')
     move_number = Column(Integer, comment='步数')
@@ -58,4 +59,23 @@ class AIChessMove(Base):
         Index('idx_fen', 'fen'),
         Index('idx_game_move', 'game_id', 'move_number'),
         Index('idx_chess_id', 'chess_id'),
-    ) 
\ No newline at end of file
+    ) 
+
+class AIChessPositionStat(Base):
+    """局面着法统计：ai_chess_move 按 (局面, 走棋方, 着法) 的物化汇总，由 app/services/position_stats.py 维护"""
+    __tablename__ = 'ai_chess_position_stat'
+    __table_args__ = (
+        UniqueConstraint('fen_hash', 'side', 'move', name='uq_position_side_move'),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True, comment='主键，自增ID')
+    fen_hash = Column(BigInteger, nullable=False, comment='走子前局面FEN棋盘部分的64位哈希')
+    fen = Column(String(128), nullable=False, comment='走子前局面FEN (不包含走棋方)')
+    side = Column(CHAR(1), nullable=False, comment='走棋方, w:红方 b:黑方')
+    move = Column(String(16), nullable=False, comment='走法 (例如 h2e2)')
+    cc = Column(String(16), nullable=False, server_default='', comment='中文走法')
+    play_count = Column(Integer, nullable=False, server_default=text('0'), comment='走出次数')
+    win_count = Column(Integer, nullable=False, server_default=text('0'), comment='已结束对局中走棋方获胜次数')
+    draw_count = Column(Integer, nullable=False, server_default=text('0'), comment='已结束对局中和棋次数')
+    loss_count = Column(Integer, nullable=False, server_default=text('0'), comment='已结束对局中走棋方失利次数')
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment='记录更新时间')
@@ -0,0 +1,187 @@
+"""
+中文着法记谱（查表生成）
+
+引擎和云库返回的是 UCCI 着法（如 h2e2），展示与入库需要中文记谱（如 炮二平五）。
+列号、步数、前后中等文字全部预先制成表，一个局面只建一次按列的棋子索引，
+同一局面下的一批着法（云库一次返回几十条）用 moves_to_chinese 一次生成。
+
+记谱规则：
+- 红方列号用中文数字、从右往左数；黑方用阿拉伯数字、从左往右数（都以己方视角）
+- 车、炮、兵卒、帅将直进直退时末尾是步数，马、相象、仕士末尾是终点列号
+- 同一列有两个同名棋子时用"前/后"代替列号；三个用"前/中/后"；四个及以上用"一二三四五"（从前往后）
+- 兵卒在两条以上的列都有多个时，"前/中/后"之后写列号代替棋子名，如 前七平六
+"""
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+UCCI_MOVE = re.compile(r'^[a-i][0-9][a-i][0-9]$')
+
+PIECE_NAMES = {
+    'r': '车', 'n': '马', 'b': '象', 'a': '士', 'k': '将', 'p': '卒', 'c': '炮',
+    'R': '车', 'N': '马', 'B': '相', 'A': '士', 'K': '帅', 'P': '兵', 'C': '炮',
+}
+# 直进直退时末尾写步数的棋子
+STRAIGHT_PIECES = frozenset('rRcCpPkK')
+# 帅将只有一个，不会出现同列同名
+TANDEM_PIECES = frozenset('rRnNbBaAcCpP')
+PAWNS = frozenset('pP')
+
+CHINESE_NUMERALS = ('零', '一', '二', '三', '四', '五', '六', '七', '八', '九')
+ARABIC_NUMERALS = tuple(str(i) for i in range(10))
+
+# 以 is_red 为键：列号表按棋盘列（a-i 即 0-8）索引，步数表按步数索引
+FILE_LABELS = {
+    True: tuple(CHINESE_NUMERALS[9 - col] for col in range(9)),
+    False: tuple(ARABIC_NUMERALS[col + 1] for col in range(9)),
+}
+STEP_LABELS = {True: CHINESE_NUMERALS, False: ARABIC_NUMERALS}
+# 同列同名棋子数 -> 从前往后的称呼
+ORDER_LABELS = {2: '前后', 3: '前中后', 4: '一二三四', 5: '一二三四五'}
+
+
+class FileIndex:
+    """按 (棋子, 列) 记录棋子所在的行（UCCI 行号 0-9，红方底线为 0），棋子用 FEN 字符或中文名均可"""
+
+    def __init__(self, cells: Iterable[Tuple[str, int, int]] = ()):
+        self._ranks: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+        for char, col, rank in cells:
+            self._ranks[(char, col)].append(rank)
+        self._doubled: Dict[str, int] = defaultdict(int)
+        for (char, _), ranks in self._ranks.items():
+            if len(ranks) > 1:
+                self._doubled[char] += 1
+
+    @classmethod
+    def from_board(cls, board_array: Sequence[Sequence[str]]) -> 'FileIndex':
+        """由 10x9 棋盘数组（第 0 行是 FEN 第一段，即 UCCI 第 9 行）建立索引"""
+        return cls(
+            (char, col, 9 - row_idx)
+            for row_idx, row in enumerate(board_array)
+            for col, char in enumerate(row)
+            if char in TANDEM_PIECES
+        )
+
+    def ranks(self, char: str, col: int) -> List[int]:
+        return self._ranks.get((char, col), [])
+
+    def doubled_files(self, char: str) -> int:
+        """该棋子有两个及以上的列数"""
+        return self._doubled.get(char, 0)
+
+
+def format_move(name: str, from_col: int, from_rank: int, to_col: int, to_rank: int,
+                is_red: bool, straight: bool, ranks_on_file: Sequence[int] = (),
+                by_file: bool = False) -> str:
+    """
+    按坐标生成一步中文记谱
+
+    Args:
+        name: 棋子中文名
+        from_col/to_col: 列 0-8（a-i）
+        from_rank/to_rank: UCCI 行号 0-9（红方底线为 0）
+        is_red: 走子方是否为红方
+        straight: 是否为车炮兵帅这类直进直退时写步数的棋子
+        ranks_on_file: 起点所在列上同名棋子（含自身）的行号
+        by_file: 用列号代替棋子名（多列都有多个兵卒时）
+    """
+    files = FILE_LABELS[is_red]
+    if len(ranks_on_file) > 1:
+        # 红方行号大的在前，黑方行号小的在前
+        order = sorted(ranks_on_file, reverse=is_red)
+        labels = ORDER_LABELS[min(len(order), 5)]
+        head = labels[order.index(from_rank)] + (files[from_col] if by_file else name)
+    else:
+        head = name + files[from_col]
+
+    if from_rank == to_rank:
+        return f"{head}平{files[to_col]}"
+    action = '进' if (to_rank > from_rank) == is_red else '退'
+    if straight:
+        return f"{head}{action}{STEP_LABELS[is_red][abs(to_rank - from_rank)]}"
+    return f"{head}{action}{files[to_col]}"
+
+
+def _is_board_array(board_array) -> bool:
+    try:
+        return len(board_array) == 10 and all(len(row) == 9 for row in board_array)
+    except TypeError:
+        return False
+
+
+def _notate(move, board_array, index: FileIndex, is_red: bool):
+    if not isinstance(move, str) or not UCCI_MOVE.match(move):
+        return move
+    from_col, from_rank = ord(move[0]) - 97, ord(move[1]) - 48
+    to_col, to_rank = ord(move[2]) - 97, ord(move[3]) - 48
+    char = board_array[9 - from_rank][from_col]
+    name = PIECE_NAMES.get(char)
+    if name is None:
+        logger.debug("着法 %s 的起点没有棋子", move)
+        return move
+    ranks = index.ranks(char, from_col)
+    by_file = char in PAWNS and len(ranks) > 1 and index.doubled_files(char) > 1
+    return format_move(name, from_col, from_rank, to_col, to_rank, is_red,
+                       char in STRAIGHT_PIECES, ranks, by_file)
+
+
+def moves_to_chinese(moves: Iterable[str], board_array, is_red: bool) -> List:
+    """
+    把同一局面下的一批 UCCI 着法转换为中文记谱
+
+    Args:
+        moves: UCCI 着法列表（如 ["h2e2", "b0c2"]）
+        board_array: 10x9 棋盘数组
+        is_red: 走子方是否为红方
+
+    Returns:
+        list: 与 moves 一一对应的中文记谱；格式不对或起点没有棋子的着法原样返回
+    """
+    moves = list(moves)
+    if not _is_board_array(board_array):
+        logger.warning("[moves_to_chinese] Invalid board_array shape: %s", type(board_array))
+        return moves
+    index = FileIndex.from_board(board_array)
+    return [_notate(move, board_array, index, is_red) for move in moves]
+
+
+def move_to_chinese(move: str, board_array, is_red: bool):
+    """单步着法的中文记谱"""
+    return moves_to_chinese([move], board_array, is_red)[0]
+
+
+# 解析时把红黑棋子名、繁体/异体字、中文/全角/半角数字统一成同一种写法再查表，
+# 例如 "傌二進三"、"马2进3"、"馬２进３" 得到同一个键
+_KEY_TABLE = str.maketrans({
+    '帅': '将', '帥': '将', '將': '将', '仕': '士', '相': '象', '兵': '卒',
+    '俥': '车', '車': '车', '傌': '马', '馬': '马', '砲': '炮', '包': '炮',
+    '進': '进', '後': '后',
+    **{numeral: str(i) for i, numeral in enumerate(CHINESE_NUMERALS) if i},
+    **{chr(0xFF10 + i): str(i) for i in range(10)},
+})
+_RECORD_SEPARATORS = re.compile(r'[\s.,;:、，。；：]+')
+
+
+def notation_key(text: str) -> str:
+    """中文记谱的查表键（与红黑方写法、数字写法无关）"""
+    return ''.join(text.split()).translate(_KEY_TABLE)
+
+
+def split_record(record) -> List[str]:
+    """
+    把棋谱拆成一步一步的中文记谱
+
+    Args:
+        record: 着法列表，或 "1. 炮二平五 马8进7 2. 马二进三 ..." 这样带回合号的文本
+    """
+    if isinstance(record, str):
+        return [token for token in _RECORD_SEPARATORS.split(record) if _is_move_token(token)]
+    return list(record)
+
+
+def _is_move_token(token: str) -> bool:
+    # 回合号（"1." "12、"）和结果（"1-0"）都不是四个字的着法
+    return len(token) == 4 and not token[0].isdigit() and any(c in token for c in '进退平進')
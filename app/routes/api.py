@@ -1,18 +1,32 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, request, jsonify, send_from_directory, current_app, Response, stream_with_context
 from app.services.analysis import analyze_fen
 from app.services.recognition import analyze_image
+from app.services.upload_archive import archive_upload
+from app.services.recognition.timing import stage_snapshot
+from app.services.recognition.batch import recognize_batch, iter_archive_images, is_image_name
 from app.services.parameter import get_params, set_param
+from app.services.db_service import get_db
+from app.services.position_stats import position_stats, popular_positions
 from app.engine.board import fen_to_board_array, is_valid_move_format, convert_move_to_chinese
 from app.logging_config import logger
+import io
 import json
-import os
 from app.engine import engine_instance
+from app.warmup import readiness
+from app.metrics import registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 api = Blueprint('api', __name__)
 
 @api.route('/health')
 def health_check():
-    return jsonify({"status": "healthy", "message": "Chess AI Helper is running"})
+    """Liveness plus the engine/cache state of this worker; always 200 while the process serves requests."""
+    return jsonify(dict(readiness(), status="healthy", message="Chess AI Helper is running"))
+
+@api.route('/ready')
+def readiness_probe():
+    """Readiness probe: 200 once warm-up finished in this worker, 503 before that."""
+    state = readiness()
+    return jsonify(state), 200 if state["ready"] else 503
 
 @api.route('/upload', methods=['POST'])
 def upload_file():
@@ -21,30 +35,87 @@ def upload_file():
     file = request.files['image']
     if file.filename == '':
         return jsonify({'error': 'No image selected'}), 400
+    filename = file.filename
     try:
-        # It's better to save uploads to a dedicated, configured folder
-        # For now, let's ensure the 'app/uploads' directory exists
-        upload_folder = os.path.join(os.getcwd(), 'app', 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        
-        # Use a secure filename and save the file
-        from werkzeug.utils import secure_filename
-        filename = secure_filename(file.filename)
-        img_path = os.path.join(upload_folder, filename)
-        file.save(img_path)
+        # Decode the upload in memory; archiving to disk is optional and runs in the background
+        image_bytes = file.read()
+        if not image_bytes:
+            return jsonify({'error': 'Empty image file'}), 400
+
+        if current_app.config.get('UPLOAD_ARCHIVE'):
+            archive_upload(image_bytes, filename, current_app.config['UPLOAD_FOLDER'])
 
         param_str = request.form.get('param', '{}')
         param = json.loads(param_str)
         
         # Call the correct service function
-        analysis_result = analyze_image(img_path, param)
+        analysis_result = analyze_image(image_bytes, param)
         
         return jsonify(analysis_result)
     except Exception as e:
         logger.error(f"Error processing file {filename}: {e}", exc_info=True)
         return jsonify({'success': False, 'message': str(e)}), 500
 
+ARCHIVE_MIMETYPES = {
+    'application/zip': 'upload.zip',
+    'application/x-tar': 'upload.tar',
+    'application/gzip': 'upload.tar.gz',
+    'application/x-gtar': 'upload.tar.gz',
+}
+
+
+def _read_batch_uploads():
+    """
+    Read the uploaded images/archives into memory before the response starts streaming
+    (the request's temporary upload files are closed once the view returns).
+    """
+    if request.files:
+        return [(file.filename or '', file.read()) for _, file in request.files.items(multi=True)]
+    return [(ARCHIVE_MIMETYPES[request.mimetype], request.get_data())]
+
+
+def _iter_batch_images(uploads):
+    """Yield (name, bytes) for every image, expanding zip/tar archives in order."""
+    for name, data in uploads:
+        if name.lower().endswith(('.zip', '.tar', '.tar.gz', '.tgz')):
+            yield from iter_archive_images(io.BytesIO(data), name)
+        elif is_image_name(name):
+            yield name, data
+
+
+@api.route('/recognize/batch', methods=['POST'])
+def recognize_batch_route():
+    """
+    Recognize many boards in one request.
+
+    Accepts multipart files (images and/or zip/tar archives) or a raw zip/tar body.
+    Results stream back as NDJSON, one line per image in input order.
+    """
+    if not request.files and request.mimetype not in ARCHIVE_MIMETYPES:
+        return jsonify({'error': 'No images or archive provided'}), 400
+    try:
+        param = json.loads(request.values.get('param', '{}'))
+    except ValueError:
+        return jsonify({'error': 'Invalid param JSON'}), 400
+    max_workers = current_app.config.get('BATCH_RECOGNITION_WORKERS', 4)
+    uploads = _read_batch_uploads()
+
+    def generate():
+        for result in recognize_batch(_iter_batch_images(uploads), param, max_workers=max_workers):
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@api.route('/recognition/timings')
+def recognition_timings():
+    """Histograms of per-stage recognition latency (milliseconds) since startup."""
+    return jsonify(stage_snapshot())
+
+@api.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this worker's engine, recognition, cloud and DB metrics."""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
 @api.route('/engine/command', methods=['POST'])
 def send_engine_command():
     data = request.get_json()
@@ -84,6 +155,18 @@ def analyze_fen_route():
         logger.error(f"/analyze_fen异常: {e}")
         return jsonify({'error': f'FEN analysis failed: {str(e)}'}), 500 
 
+@api.route('/position_stats')
+def position_stats_route():
+    """局面着法统计：?fen=<FEN [w|b]>&side=w|b&limit=20，不传 fen 时返回最常见局面"""
+    fen = request.args.get('fen', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    with get_db() as db:
+        if db is None:
+            return jsonify({'error': 'Database is not enabled'}), 503
+        if not fen:
+            return jsonify({'positions': popular_positions(db, limit)})
+        return jsonify({'fen': fen, 'moves': position_stats(db, fen, request.args.get('side'), limit)})
+
 @api.route('/recevice', methods=['POST'])
 def recevice_route():
     data = request.get_json()
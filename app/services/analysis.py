@@ -21,15 +21,32 @@ def _parse_win_rate(win: int) -> int:
     """convert winning rate to winning rate."""
     return 0 if win == 0 else win/100
 
-def analyze_fen(fen_full: str, is_red: bool, board_array: list) -> dict:
+def _normalize_fen(fen_full: str) -> str:
+    """Returns '<board> <side>', the form the engine uses to key positions."""
+    fen_parts = fen_full.split(' ')
+    return f"{fen_parts[0]} {fen_parts[1] if len(fen_parts) > 1 else 'w'}"
+
+def analyze_fen(fen_full: str, is_red: bool, board_array: list, engine=None) -> dict:
     """
     Analyzes a FEN string, saves the results to the database, and returns the best move.
+
+    `engine` may be an EngineSession bound to a game so the search reuses that
+    game's engine and hash table; it defaults to the shared engine instance.
     """
+    engine = engine or engine_instance
     with get_db() as db:
-        # 1. Get cloud analysis and save to DB
-        cloud_moves = get_chessdb_analysis(fen_full,is_red, board_array)
+        # 1. Get cloud analysis and save to DB. When the engine is already pondering
+        # on this exact position (our predicted reply was played), skip the cloud
+        # round trip and take the engine's result right away.
+        ponder_hit = engine.ponder_matches(_normalize_fen(fen_full))
+        if not ponder_hit:
+            # The prediction missed: stop the background search now, a cloud answer
+            # would otherwise leave it running on the wrong position.
+            engine.stop_ponder()
+        cloud_moves = [] if ponder_hit else get_chessdb_analysis(fen_full,is_red, board_array)
         if cloud_moves:
-            logger.info(f"[analysis] cloud_moves: {cloud_moves}")
+            logger.info("[analysis] cloud best move: %s (%d moves)", cloud_moves[0].get('move'), len(cloud_moves))
+            logger.debug("[analysis] cloud_moves: %s", cloud_moves)
             add_analysis_to_db(db, cloud_moves)
             # Get list first data
             best_move_list = cloud_moves[0]
@@ -48,8 +65,8 @@ def analyze_fen(fen_full: str, is_red: bool, board_array: list) -> dict:
         fen_parts = fen.split(' ')
         fen_board = fen_parts[0]
         side_to_move = fen_parts[1] if len(fen_parts) > 1 else 'w'
-        best_move,line,fen_string = engine_instance.get_best_move(fen_board, side_to_move)
-        logger.info(f"[analysis] lines: {line}, best_move: {best_move},fen_string: {fen_string}")
+        best_move,line,fen_string = engine.get_best_move(fen_board, side_to_move)
+        logger.info("[analysis] lines: %s, best_move: %s,fen_string: %s", line, best_move, fen_string)
         if not is_valid_move_format(best_move):
             logger.error(f"Engine returned invalid move: {best_move}")
             return {"error": f"Invalid move format from engine: {best_move}"}
@@ -68,5 +85,6 @@ def analyze_fen(fen_full: str, is_red: bool, board_array: list) -> dict:
 
         # 4. Prepare and return the result
         local_analysis_data['fen'] = fen_full
+        local_analysis_data['ponder_move'] = engine.ponder_move(fen_string)
         local_analysis_data['win_rate'] = _parse_win_rate(local_analysis_data['win_rate'])
         return local_analysis_data
\ No newline at end of file
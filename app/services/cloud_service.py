@@ -1,6 +1,10 @@
+import time
 import requests
 from app.logging_config import logger
-from app.engine.board import convert_move_to_chinese, is_valid_move_format
+from app.metrics import CLOUD_REQUESTS, CLOUD_REQUEST_SECONDS
+from app.logging_handlers import SAMPLED
+from app.engine.board import is_valid_move_format
+from app.notation import moves_to_chinese
 import re
 
 def _safe_int_parse(value, default=0):
@@ -42,15 +46,20 @@ def get_chessdb_analysis(fen: str, is_red: bool, board_array: list):
         'board': fen
     }
     try:
-        logger.info(f"[chessdb.cn] 请求URL: {base_url}")
-        logger.info(f"[chessdb.cn] 请求参数: {params}")
-        response = requests.get(base_url, params=params, timeout=10)
+        logger.debug("[chessdb.cn] 请求: %s %s", base_url, params)
+        start = time.perf_counter()
+        try:
+            response = requests.get(base_url, params=params, timeout=10)
+        finally:
+            CLOUD_REQUEST_SECONDS.observe(time.perf_counter() - start)
         response.raise_for_status()
         
         content = response.text
-        logger.info(f"[chessdb.cn] 返回内容: {content}")
+        # 完整返回内容可能有几十条着法，只在调试时截断输出
+        logger.debug("[chessdb.cn] 返回内容(%d字节): %.200s", len(content), content)
         if not content or 'move' not in content:
-            logger.warning(f"No valid data from chessdb.cn for FEN: {fen}")
+            logger.warning("No valid data from chessdb.cn for FEN: %s", fen)
+            CLOUD_REQUESTS.labels(result='miss').inc()
             return []
 
         # Split FEN into board and side to move
@@ -73,14 +82,13 @@ def get_chessdb_analysis(fen: str, is_red: bool, board_array: list):
                 try:
                     if 'score' in data and ('??' in str(data.get('score'))) and 'note' in data and ('??-??' in str(data.get('note'))):
                         continue 
-                    logger.info(f"[chessdb.cn] 原始 winrate 字段: {data.get('winrate')}")
                     win_rate = _parse_win_rate(data.get('winrate', '0'))
-                    logger.info(f"[chessdb.cn] 解析后 win_rate: {win_rate}")
+                    logger.debug("[chessdb.cn] winrate: %s -> %s", data.get('winrate'), win_rate, extra=SAMPLED)
                     moves_data.append({
                         'fen': fen_board,
                         'is_move': side_to_move,
                         'move': data.get('move'),
-                        'chinese_move': convert_move_to_chinese(data.get('move'), board_array, is_red),
+                        'chinese_move': None,  # 循环结束后整批生成
                         'source': 1,  # 1 for cloud source
                         'score': _safe_int_parse(data.get('score')),
                         'rank': _safe_int_parse(data.get('rank')),
@@ -90,12 +98,19 @@ def get_chessdb_analysis(fen: str, is_red: bool, board_array: list):
                 except (ValueError, TypeError) as e:
                     logger.error(f"Error parsing move data '{part}': {e}")
 
-        
+
+        # 同一局面的全部着法共用一份按列索引，一次生成中文记谱
+        chinese_moves = moves_to_chinese([item['move'] for item in moves_data], board_array, is_red)
+        for item, chinese_move in zip(moves_data, chinese_moves):
+            item['chinese_move'] = chinese_move
+
         if not moves_data:    
-            logger.info(f'没有收录的棋局: {fen}')
+            logger.info('没有收录的棋局: %s', fen)
+        CLOUD_REQUESTS.labels(result='hit' if moves_data else 'miss').inc()
 
         return moves_data
 
     except requests.RequestException as e:
         logger.error(f"Error fetching data from chessdb.cn: {e}")
+        CLOUD_REQUESTS.labels(result='error').inc()
         return [] 
\ No newline at end of file
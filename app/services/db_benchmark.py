@@ -0,0 +1,87 @@
+"""
+Commit throughput benchmark for the SQLite engine profile.
+
+Writes one analysis row per commit through add_analysis_to_db, the same path
+the analysis service uses, and compares:
+
+- legacy: QueuePool sized with pool_size/max_overflow, default rollback journal
+  and synchronous=FULL, a new session per write (the previous setup)
+- tuned: the sqlite_profile engine (WAL, synchronous=NORMAL) with one session
+  reused per unit of work, as a request or consumer message does
+
+Usage:
+    python -m app.services.db_benchmark --commits 2000 --unit 10
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app.database import Base, engine_from_profile, sqlite_profile
+from app.services.db_service import add_analysis_to_db
+
+FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR'
+MOVES = [f"{file}{rank}{file}{rank + 1}" for file in 'abcdefghi' for rank in range(9)]
+
+
+def legacy_engine(path: str):
+    return create_engine(f"sqlite:///{path}", pool_size=5, max_overflow=10, pool_recycle=3600,
+                         connect_args={'check_same_thread': False})
+
+
+def tuned_engine(path: str):
+    return engine_from_profile(*sqlite_profile(path))
+
+
+def _row(i: int) -> dict:
+    return dict(fen=FEN, is_move='w', move=MOVES[i % len(MOVES)], chinese_move='炮二平五',
+                source=0, score=i, win_rate=9000)
+
+
+def commit_throughput(db_engine, commits: int, unit: int = 1) -> float:
+    """
+    Commits per second writing one row per commit.
+
+    Args:
+        db_engine: Engine to benchmark (its tables are created here)
+        commits: Number of commits
+        unit: Commits sharing one session before it is closed (1 = session per write)
+    """
+    Base.metadata.create_all(db_engine)
+    sessions = scoped_session(sessionmaker(bind=db_engine, autoflush=False))
+    start = time.perf_counter()
+    for i in range(commits):
+        add_analysis_to_db(sessions(), [_row(i)])
+        if (i + 1) % unit == 0:
+            sessions.remove()
+    sessions.remove()
+    elapsed = time.perf_counter() - start
+    db_engine.dispose()
+    return commits / elapsed
+
+
+def run_benchmark(commits: int = 1000, unit: int = 10, directory: str = None) -> Dict[str, float]:
+    """Run both profiles against fresh database files and return commits per second."""
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        return {
+            'legacy': round(commit_throughput(legacy_engine(os.path.join(tmp, 'legacy.db')), commits), 1),
+            'tuned': round(commit_throughput(tuned_engine(os.path.join(tmp, 'tuned.db')), commits, unit), 1),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite commit throughput: legacy vs tuned engine profile')
+    parser.add_argument('--commits', type=int, default=1000)
+    parser.add_argument('--unit', type=int, default=10, help='commits per reused session in the tuned run')
+    parser.add_argument('--dir', default=None, help='directory for the temporary database files')
+    args = parser.parse_args(argv)
+    print(json.dumps(run_benchmark(args.commits, args.unit, args.dir), indent=2))
+
+
+if __name__ == '__main__':
+    main()
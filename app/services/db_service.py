@@ -1,22 +1,25 @@
+import time
 from contextlib import contextmanager
-from app.database import SessionLocal, DB_ENABLED
+from app.database import DB_ENABLED, get_db_session
+from app.metrics import DB_COMMIT_SECONDS, DB_ERRORS
 from app.models.chess_models import AiChess
 from app.logging_config import logger
+from app.services.upsert import bulk_upsert
 from sqlalchemy.orm import Session
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
-from sqlalchemy.dialects.mysql import insert as mysql_insert
 
 @contextmanager
 def get_db():
     if not DB_ENABLED:
         yield None
         return
-    
-    db = SessionLocal()
-    try:
+
+    # Reuses the request/message scoped session; it is closed when the scope ends
+    with get_db_session() as db:
         yield db
-    finally:
-        db.close()
+
+# ai_chess rows are unique per (fen, is_move, move)
+ANALYSIS_KEY = ('fen', 'is_move', 'move')
+ANALYSIS_UPDATE_COLUMNS = ('chinese_move', 'source', 'score', 'rank', 'note', 'win_rate')
 
 def add_analysis_to_db(db: Session, analysis_data: list):
     """
@@ -25,39 +28,16 @@ def add_analysis_to_db(db: Session, analysis_data: list):
     if not db or not analysis_data:
         return
 
-    dialect_name = db.bind.dialect.name
-    if dialect_name == 'mysql':
-        stmt = mysql_insert(AiChess).values(analysis_data)
-        stmt = stmt.on_duplicate_key_update(
-            chinese_move=stmt.inserted.chinese_move,
-            source=stmt.inserted.source,
-            score=stmt.inserted.score,
-            rank=stmt.inserted.rank,
-            note=stmt.inserted.note,
-            win_rate=stmt.inserted.win_rate,
-        )
-    elif dialect_name == 'sqlite':
-        stmt = sqlite_insert(AiChess).values(analysis_data)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=['fen', 'is_move', 'move'],
-            set_=dict(
-                chinese_move=stmt.excluded.chinese_move,
-                source=stmt.excluded.source,
-                score=stmt.excluded.score,
-                rank=stmt.excluded.rank,
-                note=stmt.excluded.note,
-                win_rate=stmt.excluded.win_rate,
-            )
-        )
-    else:
-        logger.warning(f"Upsert logic not implemented for dialect: {dialect_name}")
-        return
-
+    start = time.perf_counter()
     try:
-        db.execute(stmt)
+        written = bulk_upsert(db, AiChess, analysis_data, ANALYSIS_KEY, ANALYSIS_UPDATE_COLUMNS)
         db.commit()
     except Exception as e:
         logger.error(f"Error bulk inserting analysis: {e}")
+        DB_ERRORS.labels(operation='upsert_analysis').inc()
         db.rollback()
+        return
+    finally:
+        DB_COMMIT_SECONDS.labels(operation='upsert_analysis').observe(time.perf_counter() - start)
 
-    logger.info(f"Upserted {len(analysis_data)} analysis results to database.") 
\ No newline at end of file
+    logger.info(f"Upserted {written} analysis results to database.")
@@ -0,0 +1,269 @@
+"""
+Position-frequency statistics.
+
+``ai_chess_position_stat`` holds one row per (position, side to move, move) with
+how often the move was played and how finished games went for the side that
+played it. It is maintained incrementally:
+
+- a move insert adds 1 to ``play_count`` (``record_move``, in the move's transaction)
+- a game finish adds each of its moves to ``win_count``/``draw_count``/``loss_count``
+  (``record_result``, in the game update's transaction)
+
+Both run inside ``best_effort``, a savepoint of the caller's transaction: if the
+statistics write fails (table not created yet after a deploy, a lock timeout)
+only the savepoint is rolled back and the move or game update still commits.
+
+``rebuild`` recomputes the table from ``ai_chess_move`` and ``ai_chess_game``, e.g.
+after a bulk import or to repair drift. It streams moves in (game_id, move_number)
+order, which ``idx_game_move`` already serves, and joins games by primary key.
+Lookups go through the unique (fen_hash, side, move) key, so serving statistics
+never scans the move table and needs no extra index on ``ai_chess_move``.
+
+Positions are the board part of the FEN *before* the move. ``ai_chess_move.fen``
+stores the position after each move, so the position a move was played from is the
+previous move's FEN, or the start position for move 1.
+
+Usage:
+    python -m app.services.position_stats rebuild
+    python -m app.services.position_stats query "<fen> w"
+    python -m app.services.position_stats popular --limit 20
+"""
+import argparse
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.database import get_db_session, session_scope
+from app.fen import START_FEN, board_part
+from app.logging_config import logger
+from app.metrics import DB_COMMIT_SECONDS, DB_ERRORS
+from app.models.chess_models import AIChessGame, AIChessMove, AIChessPositionStat
+from app.services.upsert import bulk_upsert
+
+STATS_KEY = ('fen_hash', 'side', 'move')
+COUNT_COLUMNS = ('play_count', 'win_count', 'draw_count', 'loss_count')
+REBUILD_BATCH_SIZE = 2000
+
+# ai_chess_game.result values (GameResult) -> side that won, '' for a draw
+_WINNER = {'红胜': 'w', '黑胜': 'b', '和棋': ''}
+
+# (fen board part, side to move, move, chinese notation)
+Position = Tuple[str, str, str, str]
+
+
+def fen_hash(fen: str) -> int:
+    """Signed 64-bit hash of a FEN's board part (fits a BIGINT column on every backend)."""
+    digest = hashlib.blake2b(board_part(fen).encode('ascii'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _side(side: str) -> str:
+    # ai_chess_move.side is 'red'/'black', FEN and ai_chess use 'w'/'b'
+    return 'w' if side in ('w', 'red') else 'b'
+
+
+def _outcome_column(result: Optional[str], side: str) -> Optional[str]:
+    winner = _WINNER.get(result)
+    if winner is None:
+        return None
+    if winner == '':
+        return 'draw_count'
+    return 'win_count' if winner == side else 'loss_count'
+
+
+def replay_positions(moves: Iterable) -> Iterator[Position]:
+    """
+    Pair each move of one game with the position it was played from.
+
+    Args:
+        moves: The game's moves in order; each has ``move_number``, ``side``,
+            ``ctm``, ``cc`` and ``fen`` (the position after the move), e.g.
+            GameMove records or ai_chess_move rows.
+
+    A move following a gap in ``move_number`` is skipped, its start position is unknown.
+    """
+    before, expected = board_part(START_FEN), 1
+    for move in moves:
+        if before is not None and move.move_number == expected and move.ctm:
+            yield before, _side(move.side), move.ctm, move.cc or ''
+        before = board_part(move.fen) if move.fen else None
+        expected = move.move_number + 1
+
+
+def _stat_row(fen: str, side: str, move: str, cc: str = '', **counts) -> dict:
+    row = dict(fen_hash=fen_hash(fen), fen=board_part(fen), side=_side(side), move=move,
+               updated_at=datetime.now())
+    if cc:
+        row['cc'] = cc
+    row.update(counts)
+    return row
+
+
+@contextmanager
+def best_effort(session: Session, operation: str):
+    """
+    Run statistics writes in a savepoint and swallow their errors.
+
+    A failure rolls back only the savepoint, is logged and counted in
+    ``chess_db_errors_total``; the caller's transaction carries on and
+    ``rebuild`` repairs the missed counts later.
+    """
+    try:
+        with session.begin_nested():
+            yield
+    except Exception as e:
+        logger.warning(f"Position statistics not updated ({operation}): {e}")
+        DB_ERRORS.labels(operation=operation).inc()
+
+
+def record_move(session: Session, fen: str, side: str, move: str, cc: str = '') -> None:
+    """Count one play of ``move`` from ``fen``. Does not commit."""
+    bulk_upsert(session, AIChessPositionStat, [_stat_row(fen, side, move, cc, play_count=1)],
+                STATS_KEY, increment_columns=COUNT_COLUMNS)
+
+
+def record_result(session: Session, positions: Iterable[Position], result: Optional[str]) -> int:
+    """
+    Add a finished game's result to the statistics of every move it played.
+
+    Args:
+        session: Session to execute in; the caller commits.
+        positions: ``replay_positions`` of the game.
+        result: ai_chess_game.result value; unknown results are not counted.
+
+    Returns:
+        int: Number of statistic rows touched.
+    """
+    if result not in _WINNER:
+        return 0
+    rows = [_stat_row(fen, side, move, cc, **{_outcome_column(result, side): 1})
+            for fen, side, move, cc in positions]
+    return bulk_upsert(session, AIChessPositionStat, rows, STATS_KEY, increment_columns=COUNT_COLUMNS)
+
+
+def _iter_games(session: Session) -> Iterator[Tuple[Optional[str], List]]:
+    query = (select(AIChessMove.game_id, AIChessMove.move_number, AIChessMove.side, AIChessMove.ctm,
+                    AIChessMove.cc, AIChessMove.fen, AIChessGame.result)
+             .join(AIChessGame, AIChessGame.id == AIChessMove.game_id)
+             .order_by(AIChessMove.game_id, AIChessMove.move_number)
+             .execution_options(yield_per=REBUILD_BATCH_SIZE))
+    game_id, result, moves = None, None, []
+    for row in session.execute(query):
+        if row.game_id != game_id:
+            if moves:
+                yield result, moves
+            game_id, result, moves = row.game_id, row.result, []
+        moves.append(row)
+    if moves:
+        yield result, moves
+
+
+def aggregate(session: Session) -> Dict[Tuple[str, str, str], dict]:
+    """Aggregate every stored game into statistic rows keyed by (fen, side, move)."""
+    stats: Dict[Tuple[str, str, str], dict] = {}
+    for result, moves in _iter_games(session):
+        for fen, side, move, cc in replay_positions(moves):
+            row = stats.get((fen, side, move))
+            if row is None:
+                row = stats[(fen, side, move)] = _stat_row(fen, side, move, cc, **dict.fromkeys(COUNT_COLUMNS, 0))
+            row['play_count'] += 1
+            column = _outcome_column(result, side)
+            if column is not None:
+                row[column] += 1
+    return stats
+
+
+def rebuild(session: Session) -> int:
+    """
+    Recompute ai_chess_position_stat from the move and game tables and commit.
+
+    Returns:
+        int: Number of statistic rows written.
+    """
+    with DB_COMMIT_SECONDS.labels(operation='rebuild_position_stats').time():
+        rows = list(aggregate(session).values())
+        session.execute(delete(AIChessPositionStat))
+        written = bulk_upsert(session, AIChessPositionStat, rows, STATS_KEY,
+                              increment_columns=COUNT_COLUMNS, batch_size=REBUILD_BATCH_SIZE)
+        session.commit()
+    logger.info(f"Rebuilt position statistics: {written} rows.")
+    return written
+
+
+def _score(wins: int, draws: int, losses: int) -> Optional[float]:
+    finished = wins + draws + losses
+    return round((wins + 0.5 * draws) / finished, 4) if finished else None
+
+
+def position_stats(session: Session, fen: str, side: Optional[str] = None, limit: int = 20) -> List[dict]:
+    """
+    Moves played from a position, most played first.
+
+    Args:
+        session: Session to query.
+        fen: Position FEN; its side-to-move field is used when ``side`` is not given.
+        side: 'w' or 'b'. Without it (and without a side in ``fen``) both sides are returned.
+        limit: Maximum number of moves.
+
+    Returns:
+        List[dict]: side, move, cc, count, wins, draws, losses and avg_score, the
+        mover's mean result over finished games (win 1, draw 0.5, loss 0; None
+        when no game has finished).
+    """
+    parts = fen.split()
+    side = side or (parts[1] if len(parts) > 1 else None)
+    query = select(AIChessPositionStat).where(AIChessPositionStat.fen_hash == fen_hash(fen))
+    if side:
+        query = query.where(AIChessPositionStat.side == _side(side))
+    query = query.order_by(AIChessPositionStat.play_count.desc(), AIChessPositionStat.move).limit(limit)
+    return [
+        dict(side=stat.side, move=stat.move, cc=stat.cc, count=stat.play_count, wins=stat.win_count,
+             draws=stat.draw_count, losses=stat.loss_count,
+             avg_score=_score(stat.win_count, stat.draw_count, stat.loss_count))
+        for stat in session.execute(query).scalars()
+    ]
+
+
+def popular_positions(session: Session, limit: int = 20) -> List[dict]:
+    """Most played positions with their total play count and number of distinct moves."""
+    count = func.sum(AIChessPositionStat.play_count).label('count')
+    query = (select(AIChessPositionStat.fen, AIChessPositionStat.side, count,
+                    func.count().label('moves'))
+             .group_by(AIChessPositionStat.fen_hash, AIChessPositionStat.side, AIChessPositionStat.fen)
+             .order_by(count.desc())
+             .limit(limit))
+    return [dict(fen=f"{row.fen} {row.side}", count=int(row.count), moves=row.moves)
+            for row in session.execute(query)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Position-frequency statistics')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rebuild', help='recompute the table from ai_chess_move and ai_chess_game')
+    query = commands.add_parser('query', help='moves played from a position')
+    query.add_argument('fen')
+    query.add_argument('--limit', type=int, default=20)
+    popular = commands.add_parser('popular', help='most played positions')
+    popular.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with session_scope(), get_db_session() as session:
+        if args.command == 'rebuild':
+            start = time.perf_counter()
+            written = rebuild(session)
+            output = {'rows': written, 'seconds': round(time.perf_counter() - start, 3)}
+        elif args.command == 'query':
+            output = position_stats(session, args.fen, limit=args.limit)
+        else:
+            output = popular_positions(session, args.limit)
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
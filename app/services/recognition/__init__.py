@@ -6,7 +6,9 @@ from flask import current_app
 from app.services.analysis import analyze_fen
 from .core import FenRecognizerCore
 from .base import BaseBoardRecognizer
+from .timing import StageTimer, span
 from app import utils
+from app.config import Config
 
 # 配置日志记录器
 logger = logging.getLogger(__name__)
@@ -26,38 +28,65 @@ class FenCompatibleRecognizer(BaseBoardRecognizer):
         识别棋盘图片，返回FEN字符串和相关信息。
 
         Args:
-            image_path: str, 图片路径
-            param: dict, 可选的参数字典
+            image_path: 图片路径，或内存中的图像数据（bytes / np.ndarray），见 FenRecognizerCore.pre_processing_image
+            param: dict, 可选的参数字典；recalibrate 为真时重新标定并保存棋盘坐标缓存
 
         Returns:
-            dict: 包含fen、board_array和is_red的字典
+            dict: 包含fen、board_array、is_red的字典，以及映射不可靠或冲突的棋子列表flagged_pieces、
+                  各阶段耗时timings（毫秒，Config.RECOGNITION_TIMING 关闭时为空）
         """
-        import os
         if param is None:
             param = {}
-            
-        # 删除旧的棋盘坐标缓存
-        board_json_path = './app/json/board.json'
-        if os.path.exists(board_json_path):
-            try:
-                os.remove(board_json_path)
-                print("已删除旧的棋盘坐标缓存，将执行新的网格检测。")
-            except OSError as e:
-                print(f"Error deleting file {board_json_path}: {e}")
-                
-        # 执行识别流程
-        image, gray = self.core.pre_processing_image(image_path)
-        x_array, y_array = self.core.board_recognition(image, gray)
-        pieces = self.core.pieces_recognition(image, gray, param)
-        position, is_red = self.core.calculate_pieces_position(x_array, y_array, pieces)
-        fen_str, board_array = utils.switch_to_fen(position, is_red)
-        for i, row in enumerate(board_array):
-            logger.info(f"{row}")
-        
+
+        # 执行识别流程；棋盘坐标缓存（fork 前预热）只在显式重新标定时改写
+        with StageTimer(enabled=Config.RECOGNITION_TIMING) as timer:
+            image, gray = self.core.pre_processing_image(image_path)
+            if param.get('recalibrate'):
+                x_array, y_array = self.core.calibrate_board(image, gray)
+            else:
+                x_array, y_array = self.core.board_recognition(image, gray)
+            result = self.recognize_pieces(image, gray, x_array, y_array, param)
+        logger.info("识别结果: %s, 各阶段耗时(ms): %s", result['fen'], timer.rounded(1))
+
+        result["timings"] = timer.rounded()
+        return result
+
+    def recognize_pieces(self, image, gray, x_array, y_array, param):
+        """
+        在已知网格坐标的图像上识别棋子并生成FEN（不读写棋盘坐标缓存，可并发调用）。
+
+        Args:
+            image: ndarray, 原始图像
+            gray: ndarray, 灰度图像
+            x_array: 竖线x坐标数组
+            y_array: 横线y坐标数组
+            param: dict, 识别参数
+
+        Returns:
+            dict: 包含fen、board_array、is_red、flagged_pieces的字典
+        """
+        flagged_pieces = []
+        if param.get('detectMode') == 'grid':
+            # 只在90个交叉点取样，跳过整图的霍夫圆检测
+            with span('pieces'):
+                position, is_red = self.core.grid_recognition(image, gray, param, x_array, y_array)
+        else:
+            circles = self.core.detect_circles(gray, grid=(x_array, y_array))
+            colors = self.core.classify_piece_colors(image, circles, gray) if circles is not None else []
+            with span('match'):
+                pieces = self.core.identify_pieces(image, gray, circles, param, colors=colors)
+            with span('position'):
+                position, is_red, details = self.core.calculate_pieces_position(
+                    x_array, y_array, pieces, return_details=True)
+            flagged_pieces = [d for d in details if d["flag"]]
+        with span('fen'):
+            fen_str, board_array = utils.switch_to_fen(position, is_red)
+
         return {
             "fen": fen_str,
             "board_array": board_array,
-            "is_red": is_red
+            "is_red": is_red,
+            "flagged_pieces": flagged_pieces
         }
 
 
@@ -68,12 +97,21 @@ RECOGNIZER_REGISTRY = {
 ACTIVE_RECOGNIZER = RECOGNIZER_REGISTRY['fen_compatible']
 
 
+def _describe_source(image_source):
+    """日志中显示的图像来源描述，避免把整段图像数据写进日志"""
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        return f"<内存图像 {len(image_source)} 字节>"
+    if hasattr(image_source, 'shape'):
+        return f"<内存图像 shape={image_source.shape}>"
+    return image_source
+
+
 def recognize_board(image_path, param=None):
     """
     统一识别入口，便于后续切换不同识别算法。
 
     Args:
-        image_path: str, 图片路径
+        image_path: 图片路径，或内存中的图像数据（bytes / np.ndarray）
         param: dict, 可选的参数字典
 
     Returns:
@@ -87,14 +125,14 @@ def analyze_image(image_path, param):
     分析图像并返回结果。
 
     Args:
-        image_path: str, 图片路径
+        image_path: 图片路径，或内存中的图像数据（bytes / np.ndarray）
         param: dict, 参数字典
 
     Returns:
         dict: 分析结果
     """
     try:
-        current_app.logger.info(f"开始分析图像: {image_path}，参数: {param}")
+        current_app.logger.info(f"开始分析图像: {_describe_source(image_path)}，参数: {param}")
         recog_result = recognize_board(image_path, param)
         fen = recog_result['fen']
         board_array = recog_result['board_array']
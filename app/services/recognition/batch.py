@@ -0,0 +1,131 @@
+"""
+批量棋盘识别
+
+用于回放工具一次识别大量归档截图：
+- 输入为 (名称, 图像数据) 序列，可来自多文件上传或 zip/tar 压缩包
+- 解码与识别流水线执行：解码线程提前解码后续图片，多个识别线程并行处理（OpenCV 计算释放GIL）
+- 同一批次中尺寸相同的截图共用一次网格标定；模板特征缓存在进程内共享
+- 结果按输入顺序逐条产出，便于以 NDJSON 流式返回
+"""
+import io
+import logging
+import os
+import tarfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from app.config import Config
+from . import ACTIVE_RECOGNIZER
+from .timing import StageTimer
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def is_image_name(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith('.')
+
+
+def iter_archive_images(fileobj, name: str = '') -> Iterator[Tuple[str, bytes]]:
+    """
+    按压缩包内的顺序读取图片
+
+    Args:
+        fileobj: 压缩包文件对象。tar 以流模式读取，无需整体读入内存；zip 需要可随机访问
+        name: 压缩包文件名，用于判断格式（.zip 或 .tar/.tar.gz/.tgz）
+
+    Yields:
+        (图片名称, 图片数据)
+    """
+    if name.lower().endswith('.zip'):
+        if not fileobj.seekable():
+            fileobj = io.BytesIO(fileobj.read())
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image_name(info.filename):
+                    yield info.filename, archive.read(info)
+        return
+
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and is_image_name(member.name):
+                yield member.name, archive.extractfile(member).read()
+
+
+class BatchRecognizer:
+    """一个批次的识别上下文，持有批次内共享的网格标定"""
+
+    def __init__(self, recognizer=None, param: Optional[Dict[str, Any]] = None, share_calibration: bool = True):
+        self.recognizer = recognizer or ACTIVE_RECOGNIZER
+        self.core = self.recognizer.core
+        self.param = param or {}
+        self.share_calibration = share_calibration
+        self._calibration: Dict[Tuple[int, int], Tuple[list, list]] = {}
+        self._lock = threading.Lock()
+
+    def decode(self, data):
+        """解码图像数据（在解码线程中执行）"""
+        return self.core.pre_processing_image(data)
+
+    def grid_for(self, image, gray):
+        """同一尺寸的截图只标定一次网格"""
+        if not self.share_calibration:
+            return self.core.detect_grid(image, gray)
+        key = gray.shape[:2]
+        with self._lock:
+            grid = self._calibration.get(key)
+        if grid is None:
+            grid = self.core.detect_grid(image, gray)
+            with self._lock:
+                grid = self._calibration.setdefault(key, grid)
+        return grid
+
+    def recognize(self, index: int, name: str, decoded) -> Dict[str, Any]:
+        """识别一张已提交解码的图片，失败时返回包含 error 的结果而不是抛出异常"""
+        try:
+            image, gray = decoded.result()
+            if image is None:
+                raise ValueError('无法解码图像数据')
+            with StageTimer(enabled=Config.RECOGNITION_TIMING) as timer:
+                x_array, y_array = self.grid_for(image, gray)
+                result = self.recognizer.recognize_pieces(image, gray, x_array, y_array, self.param)
+            return dict({"index": index, "name": name, "success": True}, **result, timings=timer.rounded())
+        except Exception as e:
+            logger.error(f"批量识别 {name} 失败: {e}", exc_info=True)
+            return {"index": index, "name": name, "success": False, "error": str(e)}
+
+
+def recognize_batch(images: Iterable[Tuple[str, bytes]], param: Optional[Dict[str, Any]] = None,
+                    max_workers: int = 4, share_calibration: bool = True,
+                    recognizer=None) -> Iterator[Dict[str, Any]]:
+    """
+    批量识别，按输入顺序逐条产出结果
+
+    Args:
+        images: (名称, 图像数据) 的可迭代对象，可以是生成器（例如 iter_archive_images）
+        param: 识别参数，对批次内所有图片生效
+        max_workers: 并行识别的线程数
+        share_calibration: 同一尺寸的截图是否共用网格标定
+        recognizer: 识别器，默认使用当前激活的识别器
+
+    Yields:
+        dict: index、name、success，以及 recognize 的返回字段或 error
+    """
+    batch = BatchRecognizer(recognizer, param, share_calibration)
+    # 在途任务数有上限，避免大批次一次性解码全部图片占满内存
+    window = max(1, max_workers) * 2
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch-decode') as decoder, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='batch-recognize') as workers:
+        for index, (name, data) in enumerate(images):
+            decoded = decoder.submit(batch.decode, data)
+            pending.append(workers.submit(batch.recognize, index, name, decoded))
+            while len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
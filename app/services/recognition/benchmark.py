@@ -0,0 +1,157 @@
+"""
+棋盘识别基准测试：准确率与分阶段耗时
+
+语料为一个JSON清单（见 tests/resources/recognition_corpus.json），每条记录包含截图路径、
+平台和人工核对过的FEN。运行器逐阶段调用 FenRecognizerCore，统计各阶段耗时的分位数，
+并按格子比较识别结果与标准答案。
+
+命令行用法：
+    python -m app.services.recognition.benchmark tests/resources/recognition_corpus.json --repeats 5
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app import utils
+from .core import FenRecognizerCore
+from .timing import StageTimer, span
+
+STAGES = ('preprocess', 'grid', 'circles', 'color', 'match', 'fen')
+PERCENTILES = (50, 90, 99)
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """读取语料清单，图片路径转换为绝对路径"""
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    return [dict(entry, image=os.path.join(base, entry['image'])) for entry in manifest['images']]
+
+
+def recognize_with_timings(core: FenRecognizerCore, image_source, param: Dict[str, Any]):
+    """
+    按阶段执行一次完整识别（与 FenCompatibleRecognizer.recognize 的霍夫圆流程一致），
+    不计入全局耗时直方图
+
+    Returns:
+        tuple: (FEN字符串, {阶段名: 耗时毫秒})
+    """
+    with StageTimer(histograms=None) as timer:
+        image, gray = core.pre_processing_image(image_source)
+        # 每张图都检测网格，不读写棋盘坐标缓存文件
+        with span('grid'):
+            x_array, y_array = core.detect_grid(image, gray)
+        circles = core.detect_circles(gray, (x_array, y_array))
+        colors = core.classify_piece_colors(image, circles, gray) if circles is not None else []
+        with span('match'):
+            pieces = core.identify_pieces(image, gray, circles, param, colors=colors)
+        with span('fen'):
+            position, is_red = core.calculate_pieces_position(x_array, y_array, pieces)
+            fen = utils.switch_to_fen(position, is_red)[0]
+    timings = {stage: timer.timings.get(stage, 0.0) for stage in STAGES}
+    return fen, timings
+
+
+def compare_boards(expected_fen: str, actual_fen: str) -> List[Dict[str, Any]]:
+    """逐格比较两个FEN的棋盘部分，返回不一致的格子"""
+    expected = utils.fen_to_board_array(expected_fen.split()[0])
+    actual = utils.fen_to_board_array(actual_fen.split()[0])
+    return [{"row": r, "col": c, "expected": expected[r][c], "actual": actual[r][c]}
+            for r in range(10) for c in range(9) if expected[r][c] != actual[r][c]]
+
+
+def run_benchmark(corpus: List[Dict[str, Any]], repeats: int = 3,
+                  core: Optional[FenRecognizerCore] = None) -> Dict[str, Any]:
+    """
+    对语料中的每张截图重复识别 repeats 次
+
+    Returns:
+        dict: stages 为各阶段（及 total）耗时分位数（毫秒），accuracy 为格子/整盘准确率，
+              results 为每张图的识别结果和错误格子
+    """
+    core = core or FenRecognizerCore()
+    samples: Dict[str, List[float]] = {stage: [] for stage in STAGES + ('total',)}
+    results = []
+    correct_squares = 0
+    exact_boards = 0
+
+    for entry in corpus:
+        with open(entry['image'], 'rb') as f:
+            data = f.read()
+        param = dict(entry.get('param', {}), platform=entry.get('platform', 'JJ'))
+        fen = None
+        for _ in range(max(1, repeats)):
+            fen, timings = recognize_with_timings(core, data, param)
+            for stage in STAGES:
+                samples[stage].append(timings.get(stage, 0.0))
+            samples['total'].append(sum(timings.values()))
+
+        errors = compare_boards(entry['fen'], fen)
+        correct_squares += 90 - len(errors)
+        exact_boards += not errors
+        results.append({
+            "image": os.path.basename(entry['image']),
+            "platform": param['platform'],
+            "expected": entry['fen'],
+            "fen": fen,
+            "square_accuracy": (90 - len(errors)) / 90,
+            "errors": errors,
+        })
+
+    stages = {}
+    for stage, values in samples.items():
+        if values:
+            stats = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+            stats["mean"] = float(np.mean(values))
+            stages[stage] = stats
+
+    return {
+        "images": len(corpus),
+        "repeats": repeats,
+        "stages": stages,
+        "accuracy": {
+            "squares": correct_squares / (90 * len(corpus)) if corpus else 0.0,
+            "boards": exact_boards / len(corpus) if corpus else 0.0,
+        },
+        "results": results,
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """把基准结果格式化为文本表格"""
+    lines = [f"images={report['images']} repeats={report['repeats']}", "",
+             f"{'stage':<12}" + "".join(f"{'p%d' % p:>10}" for p in PERCENTILES) + f"{'mean':>10}"]
+    for stage, stats in report['stages'].items():
+        lines.append(f"{stage:<12}" + "".join(f"{stats['p%d' % p]:>10.2f}" for p in PERCENTILES)
+                     + f"{stats['mean']:>10.2f}")
+    accuracy = report['accuracy']
+    lines += ["", f"square accuracy: {accuracy['squares']:.2%}   board accuracy: {accuracy['boards']:.2%}"]
+    for result in report['results']:
+        if result['errors']:
+            wrong = ", ".join(f"({e['row']},{e['col']}) {e['expected']}->{e['actual']}" for e in result['errors'])
+            lines.append(f"  {result['image']} [{result['platform']}]: {wrong}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='棋盘识别准确率与分阶段耗时基准')
+    parser.add_argument('corpus', help='语料清单JSON文件')
+    parser.add_argument('--repeats', type=int, default=3, help='每张图片重复识别的次数')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出完整结果')
+    parser.add_argument('--min-accuracy', type=float, default=None,
+                        help='格子准确率低于该值时以非零状态退出（用于CI）')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(load_corpus(args.corpus), repeats=args.repeats)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    if args.min_accuracy is not None and report['accuracy']['squares'] < args.min_accuracy:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,53 +3,164 @@ import numpy as np
 import os
 import json
 import logging
+import threading
 from app import utils
+from app.logging_handlers import SAMPLED
+from .timing import timed
 
 # 配置日志记录器
 logger = logging.getLogger(__name__)
 
+# 棋盘坐标缓存文件
+BOARD_JSON_PATH = './app/json/board.json'
+
+# 未能检测到网格时使用的默认坐标
+DEFAULT_X_ARRAY = (32, 146, 262, 376, 492, 608, 724, 840, 956)
+DEFAULT_Y_ARRAY = (30, 86, 144, 202, 260, 318, 374, 432, 490, 548)
+
+# 各平台的棋子模板目录
+TEMPLATE_FOLDERS = {
+    'JJ': './app/images/jj',
+    'tiantian': './app/images/tiantian',
+}
+
+# 模板SIFT描述子缓存 (模板目录, 颜色) -> [(文件名, 描述子)]，进程内所有识别共享
+_TEMPLATE_CACHE = {}
+_TEMPLATE_LOCK = threading.Lock()
+
+# 棋盘坐标缓存文件的内存副本 (文件修改时间, x坐标, y坐标, 标定图像尺寸)，文件未变化时不再重复读取解析
+_BOARD_DATA_CACHE = None
+
+# 棋子圆心偏离交叉点超过半个网格间距的一半时，认为映射不可靠
+LOW_POSITION_CONFIDENCE = 0.5
+
+def template_folder(platform):
+    """平台对应的棋子模板目录，未知平台使用天天象棋模板"""
+    return TEMPLATE_FOLDERS.get(platform, TEMPLATE_FOLDERS['tiantian'])
+
+
+def template_cache_info():
+    """已缓存的模板特征统计：{模板目录: {颜色: 模板数量}}"""
+    info = {}
+    for (folder, color), templates in list(_TEMPLATE_CACHE.items()):
+        info.setdefault(folder, {})[color] = len(templates)
+    return info
+
+
+def board_cache_loaded():
+    """棋盘坐标缓存是否已经读入内存"""
+    return _BOARD_DATA_CACHE is not None
+
+
 class FenRecognizerCore:
     """
     具体识别算法实现，负责图像处理、棋盘/棋子识别等。
     """
     
-    def pre_processing_image(self, img_path):
+    @timed('preprocess')
+    def pre_processing_image(self, img_source):
         """
-        图像预处理：读取图像并转换为灰度图。
+        图像预处理：读取/解码图像并转换为灰度图。
         
         Args:
-            img_path: str, 图像文件路径
+            img_source: 图像来源，支持以下几种形式：
+                - str/PathLike: 图像文件路径，使用 cv2.imread 读取
+                - bytes/bytearray/memoryview: 编码后的图像数据（如上传的PNG/JPG），使用 cv2.imdecode 解码
+                - np.ndarray: 一维 uint8 编码数据（同上解码），或已解码的 BGR/灰度图像
             
         Returns:
             tuple: (原始图像, 灰度图像) 或 (None, None) 如果读取失败
         """
-        img = cv2.imread(img_path)
+        img = self.load_image(img_source)
         if img is None:
-            logger.error(f"无法读取图像文件: {img_path}")
             return None, None
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         logger.debug("图像预处理完成")
         return img, gray
 
-    def get_board_data(self):
+    @staticmethod
+    def load_image(img_source):
+        """
+        将各种形式的图像来源转换为 BGR 图像，内存中的数据直接解码，不经过临时文件。
+
+        Returns:
+            np.ndarray: BGR 图像，失败返回 None
+        """
+        if isinstance(img_source, (bytes, bytearray, memoryview)):
+            img_source = np.frombuffer(img_source, dtype=np.uint8)
+
+        if isinstance(img_source, np.ndarray):
+            if img_source.ndim == 1:
+                img = cv2.imdecode(img_source, cv2.IMREAD_COLOR)
+                if img is None:
+                    logger.error(f"无法解码图像数据 ({img_source.size} 字节)")
+                return img
+            if img_source.ndim == 2:
+                return cv2.cvtColor(img_source, cv2.COLOR_GRAY2BGR)
+            if img_source.ndim == 3 and img_source.shape[2] == 4:
+                return cv2.cvtColor(img_source, cv2.COLOR_BGRA2BGR)
+            return img_source
+
+        img = cv2.imread(os.fspath(img_source))
+        if img is None:
+            logger.error(f"无法读取图像文件: {img_source}")
+        return img
+
+    @timed('grid')
+    def calibrate_board(self, img, gray):
+        """
+        重新标定：检测网格并写入棋盘坐标缓存文件（连同图像尺寸），之后同尺寸的截图直接使用。
+
+        先写临时文件再原子替换，并发识别的 worker 不会读到写了一半的文件。
+
+        Returns:
+            tuple: (x坐标数组, y坐标数组)
+        """
+        x_array, y_array = self.detect_grid(img, gray)
+        height, width = img.shape[:2]
+        data = {"x": x_array, "y": y_array, "width": width, "height": height}
+        temp_path = f"{BOARD_JSON_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(data, file)
+            os.replace(temp_path, BOARD_JSON_PATH)
+            logger.info("棋盘坐标已保存到JSON文件 (%dx%d)", width, height)
+        except Exception as e:
+            logger.error(f"保存棋盘坐标时发生错误: {e}")
+        return x_array, y_array
+
+    def get_board_data(self, shape=None):
         """
         从JSON文件获取棋盘坐标数据。
+
+        Args:
+            shape: 待识别图像的 shape；给出时，只有标定时的图像尺寸与之相同才返回缓存的坐标
         
         Returns:
             tuple: (x坐标数组, y坐标数组, 错误信息)
         """
+        global _BOARD_DATA_CACHE
         x_array = []
         y_array = []
         error = ''
         try:
-            with open('./app/json/board.json', 'r') as file:
-                data = json.load(file)
-            x_array = data["x"]
-            y_array = data["y"]
-            logger.debug("成功从JSON文件读取棋盘坐标")
+            # 多个 worker 进程共用同一个缓存文件，按修改时间判断内存副本是否仍然有效
+            mtime = os.stat(BOARD_JSON_PATH).st_mtime_ns
+            cached = _BOARD_DATA_CACHE
+            if cached is None or cached[0] != mtime:
+                with open(BOARD_JSON_PATH, 'r') as file:
+                    data = json.load(file)
+                size = (data["height"], data["width"]) if "width" in data and "height" in data else None
+                cached = _BOARD_DATA_CACHE = (mtime, tuple(data["x"]), tuple(data["y"]), size)
+                logger.debug("成功从JSON文件读取棋盘坐标")
+            if shape is not None and cached[3] != tuple(shape[:2]):
+                # 没有记录尺寸的旧文件同样不能确定适用于这张图
+                return x_array, y_array, '图像尺寸与标定不一致'
+            x_array, y_array = list(cached[1]), list(cached[2])
         except FileNotFoundError:
+            _BOARD_DATA_CACHE = None
             error = '文件未找到'
-            logger.warning("棋盘坐标JSON文件未找到")
+            logger.debug("棋盘坐标JSON文件未找到")
         except json.JSONDecodeError:
             error = 'JSON解析错误'
             logger.error("棋盘坐标JSON文件格式错误")
@@ -58,9 +169,11 @@ class FenRecognizerCore:
             logger.error(f"读取棋盘坐标时发生错误: {e}")
         return x_array, y_array, error
 
+    @timed('grid')
     def board_recognition(self, img, gray):
         """
-        识别棋盘网格线。
+        识别棋盘网格线：图像尺寸与标定一致时使用缓存的坐标，否则只为本次识别检测网格，
+        不写缓存文件（缓存只由 calibrate_board 显式更新）。
         
         Args:
             img: ndarray, 原始图像
@@ -69,14 +182,27 @@ class FenRecognizerCore:
         Returns:
             tuple: (x坐标数组, y坐标数组)
         """
-        x_array, y_array, error = self.get_board_data()
+        x_array, y_array, error = self.get_board_data(img.shape)
         if not error:
-            logger.info("从JSON文件读取棋盘坐标")
+            logger.debug("从JSON文件读取棋盘坐标")
             if len(x_array) == 9 and len(y_array) == 10:
                 return x_array, y_array
             else:
                 logger.warning("JSON文件中的棋盘坐标数据不完整，重新检测")
 
+        return self.detect_grid(img, gray)
+
+    def detect_grid(self, img, gray):
+        """
+        检测棋盘网格线（不读写缓存文件，可并发调用）。
+        
+        Args:
+            img: ndarray, 原始图像
+            gray: ndarray, 灰度图像
+            
+        Returns:
+            tuple: (x坐标数组, y坐标数组)，检测失败时为默认坐标
+        """
         logger.info("开始检测棋盘网格线...")
         gaus = cv2.GaussianBlur(gray, (5, 5), 0)
         edges = cv2.Canny(gaus, 30, 150, apertureSize=3)
@@ -88,39 +214,24 @@ class FenRecognizerCore:
             
         if lines is None:
             logger.error("未能检测到任何线条，使用默认坐标")
-            return [32, 146, 262, 376, 492, 608, 724, 840, 956], [30, 86, 144, 202, 260, 318, 374, 432, 490, 548]
+            return list(DEFAULT_X_ARRAY), list(DEFAULT_Y_ARRAY)
 
-        logger.info(f"检测到 {len(lines)} 条线")
+        logger.info("检测到 %d 条线", len(lines))
         x_array, yMin, yMax = utils.filter_vertical_lines(lines, img.shape[1])
         y_array, xMin, xMax = utils.filter_horizontal_lines(lines, img.shape[1])
-        logger.info(f"过滤后结果: 竖线{len(x_array)}条, 横线{len(y_array)}条")
+        logger.info("过滤后结果: 竖线%d条, 横线%d条", len(x_array), len(y_array))
 
         if len(x_array) < 9 or len(y_array) < 10:
             logger.error("未能检测到完整的棋盘网格，使用默认坐标")
-            default_x = [32, 146, 262, 376, 492, 608, 724, 840, 956]
-            default_y = [30, 86, 144, 202, 260, 318, 374, 432, 490, 548]
-            data = {"x": default_x, "y": default_y}
-            with open('./app/json/board.json', 'w') as file:
-                json.dump(data, file)
-            return default_x, default_y
+            return list(DEFAULT_X_ARRAY), list(DEFAULT_Y_ARRAY)
 
         x_array.sort()
         y_array.sort()
-        logger.debug(f"最终坐标 - 竖线: {x_array}")
-        logger.debug(f"最终坐标 - 横线: {y_array}")
-
-        # 保存坐标到JSON文件
-        data = {"x": x_array, "y": y_array}
-        try:
-            with open('./app/json/board.json', 'w') as file:
-                json.dump(data, file)
-            logger.info("棋盘坐标已保存到JSON文件")
-        except Exception as e:
-            logger.error(f"保存棋盘坐标时发生错误: {e}")
-
+        logger.debug("最终坐标 - 竖线: %s", x_array)
+        logger.debug("最终坐标 - 横线: %s", y_array)
         return x_array, y_array
 
-    def pieces_recognition(self, img, gray, param):
+    def pieces_recognition(self, img, gray, param, grid=None):
         """
         识别棋子位置和类型。
         
@@ -128,18 +239,34 @@ class FenRecognizerCore:
             img: ndarray, 原始图像
             gray: ndarray, 灰度图像
             param: dict, 识别参数
+            grid: 可选的 (x坐标数组, y坐标数组)，提供时同一交叉点上只保留一个棋子
             
         Returns:
             list: 识别到的棋子列表，每个元素为 (x, y, r, piece_name)
         """
-        width = img.shape[1]
-        height = img.shape[0]
+        circles = self.detect_circles(gray, grid)
+        return self.identify_pieces(img, gray, circles, param)
+
+    @timed('circles')
+    def detect_circles(self, gray, grid=None):
+        """
+        霍夫圆检测棋子候选区域，多组参数检测后去重。
+
+        Args:
+            gray: ndarray, 灰度图像
+            grid: 可选的 (x坐标数组, y坐标数组)，见 deduplicate_circles
+
+        Returns:
+            ndarray: 棋子圆形数组，每行为 (x, y, r)；未检测到时为 None
+        """
+        width = gray.shape[1]
         maxRadius = int(width / 9 / 2)
         minRadius = int(0.5 * maxRadius)
         minDist = int(0.7 * width / 9)
-        logger.info(f"棋子检测参数: 最小半径={minRadius}, 最大半径={maxRadius}, 最小距离={minDist}")
+        logger.info("棋子检测参数: 最小半径=%s, 最大半径=%s, 最小距离=%s", minRadius, maxRadius, minDist)
 
         circles_list = []
+        scores_list = []
         param2_values = [12, 18, 24]
         param1_value = 50
 
@@ -151,34 +278,38 @@ class FenRecognizerCore:
             if circles is not None:
                 circles = np.round(circles[0, :]).astype("int")
                 circles_list.extend(circles.tolist())
-                logger.debug(f"参数(param1={param1_value}, param2={param2}): 检测到 {len(circles)} 个圆")
+                # 累加器阈值越高的检测越可信；同一次检测内 HoughCircles 按票数从高到低输出
+                scores_list.extend(param2 + 1 - np.arange(1, len(circles) + 1) / (len(circles) + 1))
+                logger.debug("参数(param1=%s, param2=%s): 检测到 %d 个圆", param1_value, param2, len(circles))
 
         # 去重并保留最佳检测结果
-        if circles_list:
-            circles_array = np.array(circles_list)
-            unique_circles = []
-
-            for circle in circles_array:
-                x, y, r = circle
-                # 检查是否与已有圆重叠
-                is_duplicate = False
-                for existing in unique_circles:
-                    ex, ey, er = existing
-                    distance = np.sqrt((x - ex) ** 2 + (y - ey) ** 2)
-                    if distance < min(r, er):  # 如果圆心距离小于较小半径，认为是重复
-                        is_duplicate = True
-                        break
-                if not is_duplicate:
-                    unique_circles.append(circle)
-
-            circles = np.array(unique_circles)
-            logger.info(f"去重后检测到 {len(circles)} 个棋子")
-        else:
-            circles = None
+        if not circles_list:
             logger.warning("未检测到任何棋子")
+            return None
+        x_array, y_array = grid if grid is not None else (None, None)
+        circles = self.deduplicate_circles(np.array(circles_list), np.array(scores_list), x_array, y_array)
+        logger.info("去重后检测到 %d 个棋子", len(circles))
+        return circles
+
+    def identify_pieces(self, img, gray, circles, param, colors=None):
+        """
+        对检测到的棋子区域做颜色识别和模板匹配。
+
+        Args:
+            img: ndarray, 原始图像
+            gray: ndarray, 灰度图像
+            circles: 棋子圆形数组，每行为 (x, y, r)，可以为 None
+            param: dict, 识别参数
+            colors: 可选，已由 classify_piece_colors 得到的颜色列表
 
+        Returns:
+            list: 识别到的棋子列表，每个元素为 (x, y, r, piece_name)
+        """
         pieces = []
         if circles is not None:
+            # 整张棋盘只做一次HSV转换和掩码计算，每个棋子的颜色比例由积分图直接求得
+            if colors is None:
+                colors = self.classify_piece_colors(img, circles, gray)
             for idx, (x, y, r) in enumerate(circles):
                 try:
                     # 计算棋子区域
@@ -197,17 +328,13 @@ class FenRecognizerCore:
                         continue
 
                     # 颜色识别
-                    color = self.check_chess_piece_color_improved_v2(piece_slice)
+                    color = colors[idx]
                     if color is None:
-                        logger.warning(f"棋子{idx}: 主要颜色检测失败，尝试备选方法")
-                        color = self.check_chess_piece_color_alternative(piece_slice)
-                        if color is None:
-                            logger.warning(f"棋子{idx}: 所有颜色检测方法失败，使用默认红色")
-                            color = 'red'
+                        logger.warning(f"棋子{idx}: 所有颜色检测方法失败，使用默认红色")
+                        color = 'red'
 
                     # 选择模板路径
-                    platform = param.get('platform', 'JJ')
-                    path_str = './app/images/jj' if platform == 'JJ' else './app/images/tiantian'
+                    path_str = template_folder(param.get('platform', 'JJ'))
 
                     # 模板匹配
                     best_match, best_score = self.find_best_match_improved(piece_slice, path_str, color)
@@ -215,7 +342,8 @@ class FenRecognizerCore:
 
                     if best_score >= 5:
                         pieces.append((x, y, r, piece_name))
-                        logger.debug(f"棋子{idx}: 位置({x},{y}), 半径{r}, 类型{piece_name}, 匹配度{best_score:.2f}, 颜色{color}")
+                        logger.debug("棋子%d: 位置(%d,%d), 半径%d, 类型%s, 匹配度%.2f, 颜色%s",
+                                     idx, x, y, r, piece_name, best_score, color, extra=SAMPLED)
                     else:
                         logger.warning(f"棋子{idx}: 匹配度过低({best_score:.2f})，跳过")
 
@@ -226,7 +354,7 @@ class FenRecognizerCore:
         # 统计结果
         red_count = sum(1 for p in pieces if p[3].isupper())
         black_count = sum(1 for p in pieces if p[3].islower())
-        logger.info(f"识别结果统计: 红方{red_count}个棋子, 黑方{black_count}个棋子")
+        logger.info("识别结果统计: 红方%d个棋子, 黑方%d个棋子", red_count, black_count)
 
         if red_count == 0:
             logger.warning("未检测到红方棋子，请检查图片质量或识别参数")
@@ -235,27 +363,33 @@ class FenRecognizerCore:
 
         return pieces
 
-    def calculate_pieces_position(self, x_array, y_array, circles):
+    def calculate_pieces_position(self, x_array, y_array, circles, return_details=False):
         """
         计算棋子在棋盘上的位置（修复版）
         
         算法步骤：
         1. 验证并修复棋盘坐标数组
         2. 初始化10行9列的棋盘数组
-        3. 对每个棋子，找到最近的横线和竖线
-        4. 在对应位置标记棋子
+        3. 对所有棋子一次性查找最近的横线和竖线（np.searchsorted）
+        4. 在对应位置标记棋子；多个棋子落在同一位置时保留置信度最高的一个
         5. 判断本方颜色（根据黑将位置）
         
+        每个棋子的置信度为 1 - 圆心到交叉点的偏移 / 半个网格间距（取横纵两个方向中较差的一个），
+        正好在交叉点上为1，位于两条线正中间为0。
+        
         Args:
             x_array: 竖线x坐标数组（9列）
             y_array: 横线y坐标数组（10行）
             circles: 棋子信息列表
+            return_details: 为True时额外返回每个棋子的映射详情
             
         Returns:
-            tuple: (棋盘数组, 是否红方)
+            tuple: (棋盘数组, 是否红方)，return_details为True时为
+                   (棋盘数组, 是否红方, 映射详情列表)，详情包含
+                   name/row/col/x/y/confidence/flag，flag 为 None、'low_confidence' 或 'conflict'
         """
         # 验证并修复棋盘坐标数组
-        logger.debug(f"原始坐标数组: y_array长度={len(y_array)}, x_array长度={len(x_array)}")
+        logger.debug("原始坐标数组: y_array长度=%d, x_array长度=%d", len(y_array), len(x_array))
 
         # 确保有足够的横线和竖线
         if len(y_array) < 10:
@@ -266,7 +400,7 @@ class FenRecognizerCore:
                 step = y_array[-1] // len(y_array) if len(y_array) > 0 else 60
                 y_array = [i * step for i in range(10)]
             else:
-                y_array = [30, 86, 144, 202, 260, 318, 374, 432, 490, 548]
+                y_array = list(DEFAULT_Y_ARRAY)
 
         if len(x_array) < 9:
             logger.warning(f"Warning: 竖线数量不足({len(x_array)})，使用默认值")
@@ -275,31 +409,105 @@ class FenRecognizerCore:
                 step = x_array[-1] // len(x_array) if len(x_array) > 0 else 120
                 x_array = [i * step for i in range(9)]
             else:
-                x_array = [32, 146, 262, 376, 492, 608, 724, 840, 956]
+                x_array = list(DEFAULT_X_ARRAY)
 
-        logger.debug(f"修复后坐标数组: y_array长度={len(y_array)}, x_array长度={len(x_array)}")
-        logger.debug(f"横线坐标: {y_array}")
-        logger.debug(f"竖线坐标: {x_array}")
+        logger.debug("修复后坐标数组: y_array长度=%d, x_array长度=%d", len(y_array), len(x_array))
+        logger.debug("横线坐标: %s", y_array)
+        logger.debug("竖线坐标: %s", x_array)
 
         # 初始化棋盘数组 - 10行9列
         pieceArray = [["-"] * len(x_array) for _ in range(len(y_array))]
 
-        logger.debug(f"初始化棋盘: {len(pieceArray)}行 x {len(pieceArray[0])}列")
+        logger.debug("初始化棋盘: %d行 x %d列", len(pieceArray), len(pieceArray[0]))
+
+        # 一次性计算所有棋子最近的竖线和横线
+        details = []
+        if len(circles):
+            cx = np.array([c[0] for c in circles], dtype=np.float64)
+            cy = np.array([c[1] for c in circles], dtype=np.float64)
+            cols, dx = self.nearest_line_indices(cx, x_array)
+            rows, dy = self.nearest_line_indices(cy, y_array)
+            half_x = self.grid_spacing(x_array) / 2
+            half_y = self.grid_spacing(y_array) / 2
+            confidence = np.clip(1 - np.maximum(dx / half_x, dy / half_y), 0, 1)
+
+            for i, (_, _, _, name) in enumerate(circles):
+                details.append({
+                    "name": name, "row": int(rows[i]), "col": int(cols[i]),
+                    "x": int(cx[i]), "y": int(cy[i]),
+                    "confidence": round(float(confidence[i]), 3),
+                    "flag": 'low_confidence' if confidence[i] < LOW_POSITION_CONFIDENCE else None
+                })
+
+            # 置信度高的棋子先占位，同一位置上的其他棋子标记为冲突而不是覆盖
+            occupant = {}
+            for i in np.argsort(-confidence, kind='stable'):
+                item = details[i]
+                cell = (item["row"], item["col"])
+                if cell in occupant:
+                    item["flag"] = 'conflict'
+                    winner = details[occupant[cell]]
+                    logger.warning(f"棋子 {item['name']}({item['x']},{item['y']}) 与 {winner['name']} 映射到同一位置 "
+                                   f"行{cell[0]}, 列{cell[1]}，保留置信度较高的 {winner['name']}")
+                    continue
+                occupant[cell] = i
+                pieceArray[cell[0]][cell[1]] = item["name"]
+                if item["flag"]:
+                    logger.warning(f"棋子 {item['name']} 映射置信度低({item['confidence']:.2f}): 行{cell[0]}, 列{cell[1]} "
+                                   f"(坐标: x={item['x']}, y={item['y']})")
 
-        # 处理每个棋子
-        for cx, cy, radius, name in circles:
-            # 找到最接近的竖线和横线的索引
-            nearest_x_index = self.find_nearest_index(cx, x_array)
-            nearest_y_index = self.find_nearest_index(cy, y_array)
+        is_red = self.detect_side(pieceArray)
 
-            # 边界检查
-            if 0 <= nearest_y_index < len(pieceArray) and 0 <= nearest_x_index < len(pieceArray[0]):
-                # 在棋盘数组中标记棋子位置
-                pieceArray[nearest_y_index][nearest_x_index] = name
-                logger.debug(f"棋子 {name} 映射到位置: 行{nearest_y_index}, 列{nearest_x_index} (坐标: x={cx}, y={cy})")
-            else:
-                logger.warning(f"Warning: 棋子 {name} 位置超出边界: y={nearest_y_index}, x={nearest_x_index}")
+        # 打印棋盘状态用于调试
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("棋盘状态:\n%s", "\n".join(f"第{i}行: {row}" for i, row in enumerate(pieceArray)))
+
+        if return_details:
+            return pieceArray, is_red, details
+        return pieceArray, is_red
+
+    @staticmethod
+    def nearest_line_indices(points, lines):
+        """
+        向量化查找每个坐标最近的网格线
+
+        Args:
+            points: 坐标数组
+            lines: 网格线坐标数组（可以无序）
+
+        Returns:
+            tuple: (最近网格线在 lines 中的索引数组, 到该网格线的距离数组)
+        """
+        points = np.asarray(points, dtype=np.float64)
+        lines = np.asarray(lines, dtype=np.float64)
+        order = np.argsort(lines, kind='stable')
+        sorted_lines = lines[order]
+
+        right = np.clip(np.searchsorted(sorted_lines, points), 1, len(sorted_lines) - 1) if len(sorted_lines) > 1 \
+            else np.zeros(len(points), dtype=int)
+        left = np.maximum(right - 1, 0)
+        left_distance = np.abs(points - sorted_lines[left])
+        right_distance = np.abs(sorted_lines[right] - points)
+        nearest = np.where(right_distance < left_distance, right, left)
+        return order[nearest], np.minimum(left_distance, right_distance)
+
+    @staticmethod
+    def grid_spacing(lines):
+        """网格线的典型间距（相邻线距离的中位数）"""
+        if len(lines) < 2:
+            return 1.0
+        return max(float(np.median(np.diff(np.sort(np.asarray(lines, dtype=np.float64))))), 1.0)
+
+    def detect_side(self, pieceArray):
+        """
+        根据将帅位置判断本方颜色
 
+        Args:
+            pieceArray: 10行9列的棋盘数组
+
+        Returns:
+            bool: 本方是否为红方
+        """
         # 判断本方是红棋还是黑棋
         # 寻找黑将(k)的位置来判断本方颜色
         # 黑将(k)在棋盘上方（前3行），红帅(K)在棋盘下方
@@ -326,12 +534,204 @@ class FenRecognizerCore:
                         logger.info(f"在后{len(pieceArray) - i}行找到红帅，本方为黑方")
                         break
 
-        # 打印棋盘状态用于调试
-        logger.debug("棋盘状态:")
-        for i, row in enumerate(pieceArray):
-            logger.debug(f"第{i}行: {row}")
+        return is_red
 
-        return pieceArray, is_red
+    def grid_recognition(self, img, gray, param, x_array, y_array):
+        """
+        基于网格的棋子识别：只在90个交叉点取固定半径的区域
+
+        算法步骤：
+        1. 用积分图一次算出每个交叉点区域的灰度标准差
+        2. 标准差超过阈值的交叉点视为有棋子（空交叉点只有细网格线，标准差很小）
+        3. 只对有棋子的区域做颜色识别和模板匹配
+        4. 棋子直接写入对应的行列，不需要再查找最近的网格线
+
+        Args:
+            img: ndarray, 原始图像
+            gray: ndarray, 灰度图像
+            param: dict, 识别参数，可选 occupancyThreshold 覆盖默认阈值
+            x_array: 竖线x坐标数组（9列）
+            y_array: 横线y坐标数组（10行）
+
+        Returns:
+            tuple: (棋盘数组, 是否红方)
+        """
+        threshold = float(param.get('occupancyThreshold', 40))
+        occupied, radius = self.detect_occupied_intersections(gray, x_array, y_array, threshold)
+        rows, cols = np.nonzero(occupied)
+        logger.info("网格检测: %d 个交叉点有棋子，取样半径=%s", len(rows), radius)
+
+        xs = np.asarray(x_array, dtype=int)
+        ys = np.asarray(y_array, dtype=int)
+        circles = np.stack([xs[cols], ys[rows], np.full(len(rows), radius)], axis=1)
+        pieces = self.identify_pieces(img, gray, circles, param)
+
+        pieceArray = [["-"] * len(x_array) for _ in range(len(y_array))]
+        cell = {(int(x), int(y)): (int(row), int(col)) for x, y, row, col in zip(circles[:, 0], circles[:, 1], rows, cols)}
+        for x, y, _, name in pieces:
+            row, col = cell[(int(x), int(y))]
+            pieceArray[row][col] = name
+
+        return pieceArray, self.detect_side(pieceArray)
+
+    @staticmethod
+    @timed('occupancy')
+    def detect_occupied_intersections(gray, x_array, y_array, threshold=40):
+        """
+        判断每个交叉点是否有棋子
+
+        Args:
+            gray: ndarray, 灰度图像
+            x_array: 竖线x坐标数组
+            y_array: 横线y坐标数组
+            threshold: 灰度标准差阈值
+
+        Returns:
+            tuple: (len(y_array) x len(x_array) 的布尔数组, 取样半径)
+        """
+        xs = np.asarray(x_array, dtype=int)
+        ys = np.asarray(y_array, dtype=int)
+        pitch = min(np.diff(np.sort(xs)).mean(), np.diff(np.sort(ys)).mean())
+        radius = max(1, int(0.4 * pitch))
+        height, width = gray.shape[:2]
+
+        x1 = np.clip(xs - radius, 0, width)[None, :]
+        x2 = np.clip(xs + radius + 1, 0, width)[None, :]
+        y1 = np.clip(ys - radius, 0, height)[:, None]
+        y2 = np.clip(ys + radius + 1, 0, height)[:, None]
+
+        total, squared = cv2.integral2(gray, sdepth=cv2.CV_64F)
+
+        def box_sums(integral):
+            return integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+
+        area = np.maximum((x2 - x1) * (y2 - y1), 1)
+        mean = box_sums(total) / area
+        variance = np.maximum(box_sums(squared) / area - mean ** 2, 0)
+        return np.sqrt(variance) > threshold, radius
+
+    @staticmethod
+    def deduplicate_circles(circles, scores=None, x_array=None, y_array=None):
+        """
+        圆形检测结果去重（向量化）
+
+        两个圆心距离小于较小半径时视为同一棋子；若给出棋盘坐标，落在同一交叉点
+        （最近的竖线和横线相同）的检测也视为同一棋子。每组重复中保留置信度最高的一个。
+
+        Args:
+            circles: ndarray, 每行为 (x, y, r)
+            scores: 每个圆的置信度，越大越可信；默认按输入顺序递减
+            x_array: 可选，竖线x坐标数组
+            y_array: 可选，横线y坐标数组
+
+        Returns:
+            ndarray: 去重后的圆，按置信度从高到低排列
+        """
+        circles = np.asarray(circles).reshape(-1, 3)
+        if len(circles) == 0:
+            return circles
+        if scores is None:
+            scores = -np.arange(len(circles), dtype=np.float64)
+
+        order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+        circles = circles[order]
+        xy = circles[:, :2].astype(np.float64)
+        r = circles[:, 2]
+
+        # 成对距离矩阵，duplicate[i, j] 表示 i 与 j 为同一棋子
+        distance = np.sqrt(((xy[:, None, :] - xy[None, :, :]) ** 2).sum(axis=-1))
+        duplicate = distance < np.minimum(r[:, None], r[None, :])
+        if x_array is not None and y_array is not None and len(x_array) and len(y_array):
+            col = np.abs(xy[:, 0, None] - np.asarray(x_array)[None, :]).argmin(axis=1)
+            row = np.abs(xy[:, 1, None] - np.asarray(y_array)[None, :]).argmin(axis=1)
+            cell = row * len(x_array) + col
+            duplicate |= cell[:, None] == cell[None, :]
+
+        # 按置信度从高到低贪心保留（类似非极大值抑制）
+        suppressed = np.zeros(len(circles), dtype=bool)
+        keep = []
+        for i in range(len(circles)):
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            suppressed |= duplicate[i]
+        return circles[keep]
+
+    @timed('color')
+    def classify_piece_colors(self, img, circles, gray=None):
+        """
+        整盘棋子颜色识别（与 check_chess_piece_color_improved_v2 + alternative 判定规则一致）
+
+        算法步骤：
+        1. 整张图像只转换一次HSV，红色/黑色掩码各计算一次（v2中多个阈值范围的并集）
+        2. 对掩码和灰度图计算积分图
+        3. 对所有棋子外接正方形一次性求和，得到红色/黑色比例和平均亮度
+        4. 比例不足以判定时使用亮度规则（备用方法）
+
+        颜色识别的耗时与棋子数量无关。
+
+        Args:
+            img: 整张棋盘图像 (BGR)
+            circles: 棋子圆形数组，每行为 (x, y, r)
+            gray: 可选的灰度图，未提供时由img转换
+
+        Returns:
+            list: 每个棋子的颜色 'red' / 'black'，无法判断时为 None
+        """
+        circles = np.asarray(circles, dtype=np.int64).reshape(-1, 3)
+        if len(circles) == 0:
+            return []
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        # v2 中的5个红色范围合并后即为 H∈[0,10] 且 S,V≥20，加上 H∈[160,180] 且 S,V≥30
+        red_mask = cv2.bitwise_or(cv2.inRange(hsv, np.array([0, 20, 20], np.uint8), np.array([10, 255, 255], np.uint8)),
+                                  cv2.inRange(hsv, np.array([160, 30, 30], np.uint8), np.array([180, 255, 255], np.uint8)))
+        # 3个黑色范围的并集即为 V≤120
+        black_mask = cv2.inRange(hsv, np.array([0, 0, 0], np.uint8), np.array([180, 255, 120], np.uint8))
+
+        kernel = np.ones((3, 3), np.uint8)
+        red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel)
+        black_mask = cv2.morphologyEx(black_mask, cv2.MORPH_OPEN, kernel)
+
+        height, width = gray.shape[:2]
+        x, y, r = circles[:, 0], circles[:, 1], circles[:, 2]
+        x1 = np.clip(x - r, 0, None)
+        y1 = np.clip(y - r, 0, None)
+        x2 = np.minimum(width - 1, x + r) + 1
+        y2 = np.minimum(height - 1, y + r) + 1
+        valid = (x2 > x1 + 1) & (y2 > y1 + 1)
+        x2 = np.maximum(x2, x1)
+        y2 = np.maximum(y2, y1)
+
+        def box_sums(integral):
+            return integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+
+        area = ((x2 - x1) * (y2 - y1)).astype(np.float64)
+        area[area == 0] = 1
+        red_ratio = box_sums(cv2.integral(red_mask // 255)) / area
+        black_ratio = box_sums(cv2.integral(black_mask // 255)) / area
+        mean_brightness = box_sums(cv2.integral(gray)) / area
+
+        colors = []
+        for idx in range(len(circles)):
+            if not valid[idx]:
+                colors.append(None)
+                continue
+            if red_ratio[idx] > 0.05 and red_ratio[idx] > black_ratio[idx]:
+                colors.append('red')
+            elif black_ratio[idx] > 0.05 and black_ratio[idx] > red_ratio[idx]:
+                colors.append('black')
+            elif mean_brightness[idx] > 100:
+                colors.append('red')
+            elif mean_brightness[idx] < 80:
+                colors.append('black')
+            else:
+                colors.append(None)
+            logger.debug("棋子%d颜色: 红色比例=%.3f, 黑色比例=%.3f, 平均亮度=%.1f -> %s",
+                         idx, red_ratio[idx], black_ratio[idx], mean_brightness[idx], colors[-1], extra=SAMPLED)
+        return colors
 
     def check_chess_piece_color_improved_v2(self,img):
         """
@@ -407,7 +807,7 @@ class FenRecognizerCore:
         red_ratio = red_area / total_area
         black_ratio = black_area / total_area
 
-        logger.debug(f"颜色检测v2: 红色比例={red_ratio:.3f}, 黑色比例={black_ratio:.3f}")
+        logger.debug("颜色检测v2: 红色比例=%.3f, 黑色比例=%.3f", red_ratio, black_ratio, extra=SAMPLED)
 
         # 返回颜色判断结果
         # 降低阈值，提高检测率
@@ -416,7 +816,7 @@ class FenRecognizerCore:
         elif black_ratio > 0.05 and black_ratio > red_ratio:  # 降低黑色阈值
             return "black"
         else:
-            logger.debug(f"颜色检测不确定: 红色比例={red_ratio:.3f}, 黑色比例={black_ratio:.3f}")
+            logger.debug("颜色检测不确定: 红色比例=%.3f, 黑色比例=%.3f", red_ratio, black_ratio, extra=SAMPLED)
             return None
 
     def find_best_match_improved(self,img, images_folder, color):
@@ -424,8 +824,8 @@ class FenRecognizerCore:
         改进的模板匹配算法
 
         算法步骤：
-        1. 根据颜色筛选模板图片
-        2. 使用多种特征匹配方法
+        1. 根据颜色筛选模板图片（模板的SIFT描述子在进程内缓存，只计算一次）
+        2. 棋子图像的特征只提取一次，与每个模板做特征匹配
         3. 综合评分选择最佳匹配
 
         Args:
@@ -445,23 +845,16 @@ class FenRecognizerCore:
             logger.warning(f"Warning: Images folder {images_folder} does not exist")
             return "unknown.jpg", 0
 
-        # 遍历images_folder中的所有图片
-        for filename in os.listdir(images_folder):
-            if filename.endswith('.jpg'):
-                # 检查文件名是否与目标棋子颜色匹配
-                if (color == 'red' and filename.startswith('red_')) or (
-                        color == 'black' and filename.startswith('black_')):
-                    local_img_path = os.path.join(images_folder, filename)
-                    local_img = cv2.imread(local_img_path)
-                    if local_img is not None:
-                        # 计算两张图片的相似度（使用改进的特征匹配）
-                        score = self.compare_feature_improved(img, local_img)
-                        # 更新最高分和最佳匹配
-                        if score > best_score:
-                            best_score = score
-                            best_match = filename
-
-                            # 如果没有找到匹配，返回默认值
+        _, des1 = cv2.SIFT_create().detectAndCompute(img, None)
+        for filename, des2 in self.get_template_descriptors(images_folder, color):
+            # 计算两张图片的相似度（使用改进的特征匹配）
+            score = self.count_good_matches(des1, des2)
+            # 更新最高分和最佳匹配
+            if score > best_score:
+                best_score = score
+                best_match = filename
+
+        # 如果没有找到匹配，返回默认值
         if best_match is None:
             logger.warning(f"Warning: No match found for {color} piece, using default")
             if color == 'red':
@@ -472,6 +865,57 @@ class FenRecognizerCore:
 
         return best_match, best_score
 
+    def preload(self, platforms=None):
+        """
+        预先计算模板特征并读入棋盘坐标缓存。
+
+        在 gunicorn 的 master 进程 fork 之前调用时，缓存所在的内存页以写时复制的方式
+        被所有 worker 共享，worker 的第一次识别不再承担模板特征计算的开销。
+
+        Args:
+            platforms: 需要预热的平台列表，默认全部平台
+
+        Returns:
+            dict: 每个模板目录每种颜色缓存的模板数量
+        """
+        for platform in platforms or TEMPLATE_FOLDERS:
+            folder = template_folder(platform)
+            if not os.path.exists(folder):
+                logger.warning(f"模板目录不存在，跳过预热: {folder}")
+                continue
+            for color in ('red', 'black'):
+                self.get_template_descriptors(folder, color)
+        self.get_board_data()
+        return template_cache_info()
+
+    def get_template_descriptors(self, images_folder, color):
+        """
+        获取某个平台某种颜色的模板SIFT描述子（按目录顺序），首次调用时计算并缓存
+
+        Returns:
+            list: [(模板文件名, 描述子), ...]
+        """
+        key = (os.path.abspath(images_folder), color)
+        templates = _TEMPLATE_CACHE.get(key)
+        if templates is not None:
+            return templates
+
+        with _TEMPLATE_LOCK:
+            templates = _TEMPLATE_CACHE.get(key)
+            if templates is None:
+                sift = cv2.SIFT_create()
+                templates = []
+                # 遍历images_folder中的所有图片
+                for filename in os.listdir(images_folder):
+                    # 检查文件名是否与目标棋子颜色匹配
+                    if filename.endswith('.jpg') and filename.startswith('red_' if color == 'red' else 'black_'):
+                        local_img = cv2.imread(os.path.join(images_folder, filename))
+                        if local_img is not None:
+                            templates.append((filename, sift.detectAndCompute(local_img, None)[1]))
+                _TEMPLATE_CACHE[key] = templates
+                logger.info(f"已缓存模板特征: {images_folder} ({color}) {len(templates)} 个")
+        return templates
+
     def compare_feature_improved(self,img1, img2):
         """
         改进的特征点匹配算法
@@ -495,7 +939,20 @@ class FenRecognizerCore:
         # 检测特征点和描述符
         kp1, des1 = sift.detectAndCompute(img1, None)
         kp2, des2 = sift.detectAndCompute(img2, None)
+        return self.count_good_matches(des1, des2)
+
+    @staticmethod
+    def count_good_matches(des1, des2):
+        """
+        FLANN k近邻匹配 + Lowe's ratio 测试后的有效匹配点数量
 
+        Args:
+            des1: 第一张图像的SIFT描述子
+            des2: 第二张图像的SIFT描述子
+
+        Returns:
+            int: 有效匹配点数量
+        """
         # 如果任一图像没有特征点，返回0
         if des1 is None or des2 is None:
             return 0
@@ -537,7 +994,7 @@ class FenRecognizerCore:
         # 计算标准差（对比度）
         std_brightness = np.std(gray)
 
-        logger.debug(f"备用颜色检测: 平均亮度={mean_brightness:.1f}, 标准差={std_brightness:.1f}")
+        logger.debug("备用颜色检测: 平均亮度=%.1f, 标准差=%.1f", mean_brightness, std_brightness, extra=SAMPLED)
 
         # 简单的阈值判断
         if mean_brightness > 100:  # 较亮的图像可能是红色
@@ -571,12 +1028,7 @@ class FenRecognizerCore:
 
     def find_nearest_index(self,point, points):
         """
-        找到最近点的索引（改进版）
-
-        算法改进：
-        1. 使用更精确的距离计算
-        2. 添加边界检查
-        3. 改进最近点选择逻辑
+        找到最近点的索引（单点查询，批量查询请使用 nearest_line_indices）
 
         Args:
             point: 目标点坐标
@@ -585,19 +1037,7 @@ class FenRecognizerCore:
         Returns:
             int: 最近点的索引
         """
-        if not points:
+        if not len(points):
             return 0
-
-        # 计算到每个点的距离
-        distances = []
-        for p in points:
-            distance = abs(point - p)
-            distances.append(distance)
-
-        # 找到最小距离的索引
-        min_index = distances.index(min(distances))
-
-        # 调试信息
-        logger.debug(f"  点{point}到各点距离: {distances}, 最近点索引: {min_index}")
-
-        return min_index
\ No newline at end of file
+        indices, _ = self.nearest_line_indices([point], points)
+        return int(indices[0])
\ No newline at end of file
@@ -0,0 +1,322 @@
+"""
+视频/连续截图流识别
+
+操作员持续录制对局窗口，这里把录像文件或按顺序编号的截图目录当作帧源离线处理：
+- 每帧只取棋盘区域缩成小图做签名（量化后的缩略图），与上一次识别时的签名几乎相同就直接跳过
+- 签名变化后要求连续若干帧保持不变（走子动画、鼠标拖动结束）才做一次完整识别
+- 相邻两次识别的棋盘数组做差，推断出走法，产出 (x, y) 坐标与 ChessGame.make_move 一致的走子事件
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .batch import BatchRecognizer, is_image_name
+
+logger = logging.getLogger(__name__)
+
+# 棋盘区域缩略图尺寸 (宽, 高)，每个交叉点约 4x4 像素
+SIGNATURE_SIZE = (36, 40)
+# 缩略图像素差超过该灰度值才算变化（压缩噪声、抗锯齿通常在这以下）
+PIXEL_DELTA = 24
+# 变化像素占比超过该值认为棋盘发生了变化；一次走子约影响 1%~2% 的像素
+CHANGE_RATIO = 0.005
+
+
+# --- 帧源 ---
+
+def _natural_key(name: str):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def iter_directory_frames(path: str) -> Iterator[Tuple[int, np.ndarray]]:
+    """按文件名自然顺序 (frame2 在 frame10 之前) 读取目录中的截图"""
+    names = sorted((name for name in os.listdir(path) if is_image_name(name)), key=_natural_key)
+    for index, name in enumerate(names):
+        frame = cv2.imread(os.path.join(path, name))
+        if frame is None:
+            logger.warning(f"跳过无法读取的帧: {name}")
+            continue
+        yield index, frame
+
+
+def iter_video_frames(path: str, step: int = 1) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    读取视频帧
+
+    Args:
+        path: 视频文件路径
+        step: 每隔 step 帧取一帧，录像帧率远高于走子频率时可以降低开销
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"无法打开视频: {path}")
+    try:
+        index = 0
+        while True:
+            if index % step:
+                # grab 只推进不解码，跳过的帧几乎没有开销
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield index, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def open_frame_source(path: str, step: int = 1) -> Iterator[Tuple[int, np.ndarray]]:
+    """目录按截图序列读取，其余按视频文件读取"""
+    if os.path.isdir(path):
+        return iter_directory_frames(path)
+    return iter_video_frames(path, step=step)
+
+
+# --- 变化检测 ---
+
+def board_region(x_array, y_array, shape) -> Tuple[int, int, int, int]:
+    """由网格线坐标得到棋盘区域 (x0, y0, x1, y1)，四周留出半个格距容纳边线上的棋子"""
+    pad_x = (x_array[-1] - x_array[0]) / 16
+    pad_y = (y_array[-1] - y_array[0]) / 18
+    height, width = shape[:2]
+    x0 = max(0, int(x_array[0] - pad_x))
+    y0 = max(0, int(y_array[0] - pad_y))
+    x1 = min(width, int(np.ceil(x_array[-1] + pad_x)) + 1)
+    y1 = min(height, int(np.ceil(y_array[-1] + pad_y)) + 1)
+    return x0, y0, x1, y1
+
+
+def board_signature(gray: np.ndarray, region: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+    """棋盘区域的缩略图签名（INTER_AREA 缩小后量化到 32 级灰度）"""
+    if region is not None:
+        x0, y0, x1, y1 = region
+        gray = gray[y0:y1, x0:x1]
+    thumb = cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+    return thumb & 0xF8
+
+
+def signature_changed(a: np.ndarray, b: np.ndarray,
+                      pixel_delta: int = PIXEL_DELTA, change_ratio: float = CHANGE_RATIO) -> bool:
+    """两个签名是否代表不同的棋盘画面"""
+    if a.shape != b.shape:
+        return True
+    diff = cv2.absdiff(a, b)
+    return np.count_nonzero(diff > pixel_delta) > change_ratio * diff.size
+
+
+# --- 走法推断 ---
+
+@dataclass
+class MoveEvent:
+    """
+    识别流产出的事件
+
+    kind:
+        'position': 第一次识别得到的局面，或无法解释为一步棋的变化（例如切换对局、连走多步）
+        'move': 一步棋，from_pos/to_pos 可直接传给 ChessGame.make_move
+    """
+    kind: str
+    frame_index: int
+    fen_before: Optional[str]
+    fen_after: str
+    from_pos: Optional[Tuple[int, int]] = None
+    to_pos: Optional[Tuple[int, int]] = None
+    piece: Optional[str] = None
+    captured: Optional[str] = None
+    ucci: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def board_position(row: int, col: int) -> Tuple[int, int]:
+    """棋盘数组下标 (行, 列) 转为 ChessBoard 坐标 (x, y)：第 0 行是 FEN 第一行，对应 y=9"""
+    return col, 9 - row
+
+
+def diff_boards(before: List[List[str]], after: List[List[str]]):
+    """
+    比较两个标准视角（红方在下）的棋盘数组，推断走法
+
+    Returns:
+        tuple: (from_pos, to_pos, piece, captured)；不是恰好一步棋时返回 None
+    """
+    vacated, arrived = [], []
+    for row in range(10):
+        for col in range(9):
+            old, new = before[row][col], after[row][col]
+            if old == new:
+                continue
+            if new == '-':
+                vacated.append((row, col, old))
+            else:
+                arrived.append((row, col, old, new))
+    if len(vacated) != 1 or len(arrived) != 1:
+        return None
+    from_row, from_col, piece = vacated[0]
+    to_row, to_col, old, new = arrived[0]
+    if new != piece:
+        return None
+    captured = None if old == '-' else old
+    if captured is not None and captured.isupper() == piece.isupper():
+        return None
+    return board_position(from_row, from_col), board_position(to_row, to_col), piece, captured
+
+
+def _with_side(fen: str, red_to_move: bool) -> str:
+    return f"{fen.split()[0]} {'w' if red_to_move else 'b'}"
+
+
+def _ucci(from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> str:
+    return f"{chr(ord('a') + from_pos[0])}{from_pos[1]}{chr(ord('a') + to_pos[0])}{to_pos[1]}"
+
+
+# --- 流识别 ---
+
+@dataclass
+class StreamStats:
+    frames: int = 0
+    unchanged: int = 0
+    unstable: int = 0
+    recognized: int = 0
+    failed: int = 0
+    events: int = 0
+
+
+@dataclass
+class StreamRecognizer:
+    """
+    逐帧处理帧源，只在画面稳定变化后识别
+
+    Args:
+        param: 识别参数，同 recognize_board
+        stable_frames: 变化后的画面需要连续保持不变的帧数
+        recognizer: 识别器，默认使用当前激活的识别器
+    """
+    param: Dict[str, Any] = field(default_factory=dict)
+    stable_frames: int = 3
+    recognizer: Any = None
+    stats: StreamStats = field(default_factory=StreamStats)
+
+    def __post_init__(self):
+        # 网格标定按帧尺寸缓存，录像中只在第一帧标定一次
+        self._batch = BatchRecognizer(self.recognizer, self.param)
+        self._regions: Dict[Tuple[int, int], Tuple[int, int, int, int]] = {}
+        self._last_signature: Optional[np.ndarray] = None
+        self._candidate: Optional[np.ndarray] = None
+        self._candidate_count = 0
+        self._board: Optional[List[List[str]]] = None
+        self._fen: Optional[str] = None
+
+    def _grid(self, image, gray):
+        x_array, y_array = self._batch.grid_for(image, gray)
+        key = gray.shape[:2]
+        if key not in self._regions:
+            self._regions[key] = board_region(x_array, y_array, gray.shape)
+        return x_array, y_array, self._regions[key]
+
+    def process(self, frame_index: int, frame) -> Optional[MoveEvent]:
+        """处理一帧，棋盘局面变化时返回事件"""
+        self.stats.frames += 1
+        image, gray = self._batch.core.pre_processing_image(frame)
+        if image is None:
+            self.stats.failed += 1
+            return None
+        x_array, y_array, region = self._grid(image, gray)
+        signature = board_signature(gray, region)
+
+        if self._last_signature is not None and not signature_changed(signature, self._last_signature):
+            self.stats.unchanged += 1
+            self._candidate, self._candidate_count = None, 0
+            return None
+        if self._candidate is not None and not signature_changed(signature, self._candidate):
+            self._candidate_count += 1
+        else:
+            self._candidate, self._candidate_count = signature, 1
+        if self._candidate_count < self.stable_frames:
+            self.stats.unstable += 1
+            return None
+
+        self._candidate, self._candidate_count = None, 0
+        self._last_signature = signature
+        return self._recognize(frame_index, image, gray, x_array, y_array)
+
+    def _recognize(self, frame_index, image, gray, x_array, y_array) -> Optional[MoveEvent]:
+        try:
+            result = self._batch.recognizer.recognize_pieces(image, gray, x_array, y_array, self.param)
+        except Exception as e:
+            self.stats.failed += 1
+            logger.error(f"第 {frame_index} 帧识别失败: {e}", exc_info=True)
+            return None
+        self.stats.recognized += 1
+
+        board, fen = result["board_array"], result["fen"]
+        before_board, before_fen = self._board, self._fen
+        self._board, self._fen = board, fen
+        if before_board == board:
+            # 画面变了但棋子没变（选中高亮、鼠标悬停等）
+            return None
+
+        move = diff_boards(before_board, board) if before_board is not None else None
+        if move is None:
+            event = MoveEvent('position', frame_index, before_fen, fen)
+        else:
+            from_pos, to_pos, piece, captured = move
+            red_moved = piece.isupper()
+            event = MoveEvent('move', frame_index,
+                              _with_side(before_fen, red_moved), _with_side(fen, not red_moved),
+                              from_pos, to_pos, piece, captured, _ucci(from_pos, to_pos))
+        self.stats.events += 1
+        logger.info(f"第 {frame_index} 帧: {event.kind} {event.ucci or ''} {event.fen_after}")
+        return event
+
+    def run(self, frames: Iterable[Tuple[int, np.ndarray]]) -> Iterator[MoveEvent]:
+        for frame_index, frame in frames:
+            event = self.process(frame_index, frame)
+            if event is not None:
+                yield event
+
+
+def recognize_stream(source, param: Optional[Dict[str, Any]] = None, stable_frames: int = 3,
+                     step: int = 1, recognizer=None) -> Iterator[MoveEvent]:
+    """
+    识别帧源中的走子事件
+
+    Args:
+        source: 视频文件路径、截图目录路径，或 (帧序号, BGR图像) 的可迭代对象
+        param: 识别参数
+        stable_frames: 变化后需要保持不变的帧数
+        step: 视频抽帧间隔
+        recognizer: 识别器，默认使用当前激活的识别器
+    """
+    frames = open_frame_source(source, step=step) if isinstance(source, (str, os.PathLike)) else source
+    stream = StreamRecognizer(param or {}, stable_frames, recognizer)
+    return stream.run(frames)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="识别录像/截图序列中的走子，按行输出 JSON 事件")
+    parser.add_argument('source', help="视频文件或按顺序编号的截图目录")
+    parser.add_argument('--stable-frames', type=int, default=3, help="变化后需要保持不变的帧数")
+    parser.add_argument('--step', type=int, default=1, help="视频抽帧间隔")
+    parser.add_argument('--detect-mode', choices=('circles', 'grid'), default='circles', help="棋子检测方式")
+    args = parser.parse_args(argv)
+
+    param = {'detectMode': 'grid'} if args.detect_mode == 'grid' else {}
+    for event in recognize_stream(os.fspath(args.source), param, args.stable_frames, args.step):
+        print(json.dumps(event.to_dict(), ensure_ascii=False), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
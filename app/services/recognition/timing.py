@@ -0,0 +1,110 @@
+"""
+识别流程的分阶段计时
+
+用法：
+    with StageTimer() as timer:
+        with span('grid'):
+            ...
+    timer.timings  # {'grid': 12.3, ...} 毫秒
+
+    @timed('circles')
+    def detect_circles(...): ...
+
+没有活动的 StageTimer（或计时被禁用）时，span 返回共享的空上下文、timed 直接调用原函数，
+开销只有一次 ContextVar 读取。每次计时结束后各阶段耗时汇总进指标注册表中的
+chess_recognition_stage_seconds 直方图（按 stage 标签区分），/api/metrics 与
+/api/recognition/timings 都读取这一个直方图。
+"""
+import contextvars
+import functools
+import math
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+from app.metrics import RECOGNITION_STAGE_SECONDS, Histogram
+
+_current_timer: contextvars.ContextVar = contextvars.ContextVar('recognition_stage_timer', default=None)
+_NULL_SPAN = nullcontext()
+
+stage_histograms = RECOGNITION_STAGE_SECONDS
+
+
+def observe_stages(histograms: Histogram, timings: Dict[str, float]):
+    """把一次识别的各阶段耗时（毫秒）记入按 stage 标签区分的直方图（秒）"""
+    for stage, value in timings.items():
+        histograms.labels(stage=stage).observe(value / 1000)
+
+
+def stage_snapshot(histograms: Histogram = stage_histograms) -> Dict[str, Dict]:
+    """各阶段的累计直方图，换算为毫秒：{stage: {count, sum_ms, buckets: {上限: 累计计数}}}"""
+    bounds = ['+Inf' if bound == math.inf else f'{bound * 1000:g}' for bound in histograms.buckets]
+    snapshot = {}
+    for (stage,), (counts, total) in histograms.snapshot().items():
+        cumulative, running = {}, 0
+        for bound, count in zip(bounds, counts):
+            running += count
+            cumulative[bound] = running
+        snapshot[stage] = {"count": running, "sum_ms": round(total * 1000, 3), "buckets": cumulative}
+    return snapshot
+
+
+class StageTimer:
+    """一次识别的阶段计时器，作为上下文管理器激活"""
+
+    def __init__(self, enabled: bool = True, histograms: Optional[Histogram] = stage_histograms):
+        self.enabled = enabled
+        self.histograms = histograms
+        self.timings: Dict[str, float] = {}
+        self._token = None
+        self._start = 0.0
+
+    def __enter__(self):
+        if self.enabled:
+            self._token = _current_timer.set(self)
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        self.timings['total'] = (time.perf_counter() - self._start) * 1000
+        _current_timer.reset(self._token)
+        if self.histograms is not None and exc_type is None:
+            observe_stages(self.histograms, self.timings)
+        return False
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # 同一阶段多次出现时累加
+            self.timings[stage] = self.timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+
+    def rounded(self, digits: int = 3) -> Dict[str, float]:
+        """四舍五入后的耗时，便于放进接口返回值"""
+        return {stage: round(value, digits) for stage, value in self.timings.items()}
+
+
+def span(stage: str):
+    """在当前活动的 StageTimer 中记录一个阶段；没有活动计时器时不做任何事"""
+    timer = _current_timer.get()
+    if timer is None:
+        return _NULL_SPAN
+    return timer.span(stage)
+
+
+def timed(stage: str):
+    """把整个函数调用记录为一个阶段的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _current_timer.get()
+            if timer is None:
+                return func(*args, **kwargs)
+            with timer.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
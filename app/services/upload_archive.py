@@ -0,0 +1,73 @@
+"""
+Optional asynchronous archiving of uploaded board images.
+
+Recognition decodes uploads straight from memory; writing them to disk is only
+needed for debugging or collecting samples, so it runs on a background thread
+and never delays the response.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from werkzeug.utils import secure_filename
+
+from app.logging_config import logger
+from app.shutdown import shutdown_manager
+
+_executor: Optional[ThreadPoolExecutor] = None
+# Concurrent first uploads must not each create an executor (only one would be shut down)
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-archive')
+        return _executor
+
+
+def _write_upload(folder: str, filename: str, data: bytes) -> str:
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def archive_upload(data: bytes, filename: str, folder: str) -> Future:
+    """
+    Save an uploaded image in the background.
+
+    The stored name is prefixed with a timestamp and a random suffix so that
+    concurrent uploads with the same original filename never overwrite each other.
+
+    Returns:
+        Future resolving to the written file path.
+    """
+    name = secure_filename(filename) or 'upload'
+    unique_name = f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}_{name}"
+    future = _get_executor().submit(_write_upload, folder, unique_name, data)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _log_failure(future: Future):
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Failed to archive upload: {error}")
+
+
+def shutdown_archiver():
+    """Wait for pending archive writes to finish."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+shutdown_manager.register(shutdown_archiver, priority=50)
@@ -0,0 +1,167 @@
+"""
+Dialect-neutral bulk upsert.
+
+``bulk_upsert`` writes a list of row dicts as "insert, or update the existing row
+on a unique-key conflict":
+
+- MySQL: ``INSERT ... ON DUPLICATE KEY UPDATE``
+- PostgreSQL and SQLite: ``INSERT ... ON CONFLICT (key) DO UPDATE``
+- any other dialect: ``UPDATE`` by key, then ``INSERT`` when no row matched
+
+Conflicting rows either take the new values (``update_columns``) or add them to the
+stored ones (``increment_columns``, for counters).
+
+The upsert statement is built once per (dialect, table, key, update columns) and
+executed with the rows as parameters, so SQLAlchemy reuses the compiled statement
+and sends each batch as one executemany (batched multi-row VALUES on PostgreSQL and
+SQLite, rewritten multi-row INSERT on PyMySQL). ``bulk_upsert`` does not commit.
+"""
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, insert, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+DEFAULT_BATCH_SIZE = 500
+
+_BUILDERS: Dict[str, Callable] = {}
+
+
+def upsert_builder(dialect_name: str):
+    """Register a statement builder for a dialect."""
+    def register(builder):
+        _BUILDERS[dialect_name] = builder
+        return builder
+    return register
+
+
+def _set_clause(table, new_values, update_columns, increment_columns):
+    values = {col: new_values[col] for col in update_columns}
+    values.update({col: table.c[col] + new_values[col] for col in increment_columns})
+    return values
+
+
+@upsert_builder('mysql')
+def _mysql_upsert(table, conflict_columns, update_columns, increment_columns):
+    # MySQL resolves conflicts against every unique key, conflict_columns is implied
+    stmt = mysql_insert(table)
+    return stmt.on_duplicate_key_update(
+        _set_clause(table, stmt.inserted, update_columns, increment_columns))
+
+
+def _on_conflict_upsert(stmt, table, conflict_columns, update_columns, increment_columns):
+    return stmt.on_conflict_do_update(
+        index_elements=list(conflict_columns),
+        set_=_set_clause(table, stmt.excluded, update_columns, increment_columns),
+    )
+
+
+@upsert_builder('postgresql')
+def _postgresql_upsert(table, conflict_columns, update_columns, increment_columns):
+    return _on_conflict_upsert(postgresql_insert(table), table, conflict_columns,
+                               update_columns, increment_columns)
+
+
+@upsert_builder('sqlite')
+def _sqlite_upsert(table, conflict_columns, update_columns, increment_columns):
+    return _on_conflict_upsert(sqlite_insert(table), table, conflict_columns,
+                               update_columns, increment_columns)
+
+
+@lru_cache(maxsize=64)
+def upsert_statement(dialect_name: str, table, conflict_columns: Tuple[str, ...],
+                     update_columns: Tuple[str, ...], increment_columns: Tuple[str, ...] = ()):
+    """
+    Return the cached upsert statement for a dialect, or None when the dialect has
+    no native upsert. The statement carries no values; rows are bound at execution.
+    """
+    builder = _BUILDERS.get(dialect_name)
+    if builder is None:
+        return None
+    return builder(table, conflict_columns, update_columns, increment_columns)
+
+
+def _dedupe(rows: Iterable[dict], conflict_columns: Sequence[str],
+            increment_columns: Sequence[str] = ()) -> List[dict]:
+    # A single ON CONFLICT statement cannot touch the same row twice (PostgreSQL
+    # rejects it), so merge rows per key as sequential upserts would: later values
+    # win, increments add up.
+    merged = {}
+    for row in rows:
+        key = tuple(row[col] for col in conflict_columns)
+        previous = merged.get(key)
+        if previous is not None and increment_columns:
+            row = dict(row)
+            for col in increment_columns:
+                if col in previous:
+                    row[col] = previous[col] + row.get(col, 0)
+        merged[key] = row
+    return list(merged.values())
+
+
+def _batches(rows: List[dict], batch_size: int):
+    # executemany needs the same keys in every parameter set
+    groups: Dict[Tuple[str, ...], List[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        for start in range(0, len(group), batch_size):
+            yield group[start:start + batch_size]
+
+
+def _upsert_row_by_row(session: Session, table, rows: List[dict], conflict_columns: Sequence[str],
+                       update_columns: Sequence[str], increment_columns: Sequence[str]):
+    for row in rows:
+        key = and_(*(table.c[col] == row[col] for col in conflict_columns))
+        values = {col: row[col] for col in update_columns if col in row}
+        values.update({col: table.c[col] + row[col] for col in increment_columns if col in row})
+        result = session.execute(update(table).where(key).values(values)) if values else None
+        if result is None or result.rowcount == 0:
+            session.execute(insert(table).values(row))
+
+
+def bulk_upsert(session: Session, model, rows: Iterable[dict], conflict_columns: Sequence[str],
+                update_columns: Optional[Sequence[str]] = None,
+                increment_columns: Sequence[str] = (),
+                batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Insert ``rows`` into ``model`` (an ORM class or a Table), updating
+    ``update_columns`` of rows whose ``conflict_columns`` already exist.
+
+    Args:
+        session: Session to execute in; the caller commits or rolls back.
+        model: ORM mapped class or Table.
+        rows: Row dicts keyed by column name.
+        conflict_columns: Columns of the unique key the upsert resolves on.
+        update_columns: Columns to overwrite on conflict. Defaults to every
+            non-key, non-increment column present in the rows.
+        increment_columns: Columns added to the stored value on conflict.
+            Rows with the same key within one call are summed, not replaced.
+        batch_size: Rows per executemany round trip.
+
+    Returns:
+        int: Number of distinct rows written.
+    """
+    increment_columns = tuple(increment_columns)
+    rows = _dedupe(rows, conflict_columns, increment_columns)
+    if not rows:
+        return 0
+    table = getattr(model, '__table__', model)
+    conflict_columns = tuple(conflict_columns)
+    if update_columns is None:
+        present = {col for row in rows for col in row}
+        update_columns = [col.name for col in table.columns if col.name in present
+                          and col.name not in conflict_columns and col.name not in increment_columns]
+    update_columns = tuple(update_columns)
+
+    dialect_name = session.get_bind().dialect.name
+    stmt = upsert_statement(dialect_name, table, conflict_columns, update_columns, increment_columns)
+    if stmt is None:
+        _upsert_row_by_row(session, table, rows, conflict_columns, update_columns, increment_columns)
+    else:
+        for batch in _batches(rows, batch_size):
+            session.execute(stmt, batch)
+    return len(rows)
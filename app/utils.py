@@ -1,43 +1,200 @@
 import numpy as np
-import re
-from sklearn.cluster import KMeans
+from app import fen as fen_codec
+from app import notation
 
 # 中文数字映射
 CHINESE_NUM = {0: '零', 1: '一', 2: '二', 3: '三', 4: '四', 5: '五', 6: '六', 7: '七', 8: '八', 9: '九'}
 
+def find_line_peaks(coords, weights=None, merge_gap=None):
+    """
+    将一维坐标合并为峰值（相当于一维直方图上相邻非空区间的合并）。
+
+    Hough 检测对同一条网格线通常会给出多条相距几个像素的线段（线条两侧的边缘），
+    坐标排序后间隔不超过 merge_gap 的归为同一个峰，峰位置取加权平均。
+
+    Args:
+        coords: 坐标数组
+        weights: 每个坐标的权重（例如线段长度），默认为1
+        merge_gap: 合并间隔，默认取坐标范围的2%（至少3像素）
+
+    Returns:
+        tuple: (峰位置数组, 峰权重数组)，按位置升序
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.size == 0:
+        return coords, coords
+    weights = np.ones_like(coords) if weights is None else np.maximum(np.asarray(weights, dtype=np.float64), 1e-6)
+    order = np.argsort(coords, kind='stable')
+    coords, weights = coords[order], weights[order]
+    if merge_gap is None:
+        merge_gap = max(3.0, 0.02 * (coords[-1] - coords[0]))
+
+    group = np.concatenate(([0], np.cumsum(np.diff(coords) > merge_gap)))
+    peak_weights = np.bincount(group, weights=weights)
+    peaks = np.bincount(group, weights=coords * weights) / peak_weights
+    return peaks, peak_weights
+
+
+# 打分中的次要项只用于在主项相等时区分候选，系数保证它们不会压过主项
+# （峰权重为线段长度或默认的1，即不小于1）：
+# 粗选中每个内点的偏差（不超过 tolerance）乘以 _COARSE_RESIDUAL_TIE，远小于任何一个峰的权重，
+# 内点权重相同的间距中偏差小者胜出
+_COARSE_RESIDUAL_TIE = 1e-3
+# 精选中每条缺失网格线扣除最轻峰权重的 _MISSING_LINE_TIE 倍，count 条全部缺失也不及一个峰，
+# 只在内点权重相同时惩罚覆盖范围内的缺线（避免选中真实间距的约数）
+_MISSING_LINE_TIE = 1e-3
+# 精选中相对偏差之和乘以 _WINDOW_RESIDUAL_TIE，比缺线惩罚再小三个数量级，最后才比较
+_WINDOW_RESIDUAL_TIE = 1e-6
+
+
+def _candidate_pitches(peaks, count):
+    """
+    候选间距：在中位间距 pitch0 的1/2、1倍、2倍附近（±25%）取峰间距的约数，应对缺线或多余的边框线。
+
+    Returns:
+        tuple: (区间编号数组 0/1/2, 间距数组)，按 (区间, 间距) 升序且去重，间距保留0.1像素
+    """
+    gaps = np.sort(np.diff(peaks))
+    pitch0 = float(gaps[(len(gaps) - 1) // 2] + gaps[len(gaps) // 2]) / 2           # 中位数
+    bases = pitch0 * np.array([0.5, 1.0, 2.0])
+    pair_diffs = peaks[None, :] - peaks[:, None]
+    pair_diffs = pair_diffs[pair_diffs > 0]                                          # 峰已升序且互不相同
+    candidates = np.append((pair_diffs[:, None] / np.arange(1, count)[None, :]).ravel(), bases)
+    # 三个区间互不重叠，每个候选最多属于一个区间
+    in_band = np.abs(candidates[:, None] - bases[None, :]) <= 0.25 * bases[None, :]    # (C, 3)
+    keep = in_band.any(axis=1)
+    bands = in_band[keep].argmax(axis=1)
+    tenths = np.round(candidates[keep] * 10)
+    order = np.lexsort((tenths, bands))
+    bands, tenths = bands[order], tenths[order]
+    unique = np.concatenate(([True], (bands[1:] != bands[:-1]) | (tenths[1:] != tenths[:-1])))
+    return bands[unique], tenths[unique] / 10
+
+
+def _coarse_pitches(offsets, peak_weights, bands, pitches, tolerance, per_band=2):
+    """
+    粗选：不考虑窗口，按内点权重给全部候选间距一次广播打分，每个区间保留得分最高的 per_band 个。
+
+    Args:
+        offsets: 锚点峰到各峰的距离 (1, A, N)
+        bands, pitches: _candidate_pitches 的结果
+    """
+    residual = offsets / pitches[:, None, None]                                     # (B, A, N)，原地计算
+    residual -= np.round(residual)
+    np.abs(residual, out=residual)
+    inlier = residual <= tolerance
+    gain = residual * -_COARSE_RESIDUAL_TIE
+    gain += peak_weights
+    gain *= inlier
+    coarse = (gain @ np.ones_like(peak_weights)).max(axis=1)                         # 各间距取最佳锚点
+    order = np.lexsort((-coarse, bands))                                            # 区间内得分降序，同分取小间距
+    ranked = bands[order]
+    rank = np.arange(len(order)) - np.searchsorted(ranked, ranked)
+    return pitches[order[rank < per_band]]
+
+
+def _best_window(offsets, peaks, peak_weights, pitches, count, tolerance):
+    """
+    精选：间距(P) x 锚点(A) x 窗口起点(S) x 峰(N)，只统计连续 count 格窗口内的内点，取得分最高的组合。
+
+    得分依次比较：内点权重、覆盖范围内缺失的网格线数、相对偏差（系数见 _MISSING_LINE_TIE、_WINDOW_RESIDUAL_TIE）。
+
+    Returns:
+        tuple: (间距, 窗口内的峰位置, 峰相对窗口起点的格数, 峰权重)
+    """
+    index = np.round(-offsets / pitches[:, None, None])                             # (P, A, N)
+    residual = np.abs(-offsets - index * pitches[:, None, None])
+    inlier = residual <= tolerance * pitches[:, None, None]
+    rel = index[:, :, None, :] - index[:, :, :, None]                               # 相对窗口起点的格数 (P, A, S, N)
+    # 窗口起点本身须为内点
+    in_window = (rel >= 0) & (rel < count) & inlier[:, :, None, :] & inlier[:, :, :, None]
+    window = in_window.astype(np.float64)
+    # 对峰求和用矩阵乘法完成
+    size = window.sum(axis=-1)
+    missing = np.where(in_window, rel, -1).max(axis=-1) + 1 - size
+    relative = (residual / pitches[:, None, None])[..., None]                       # (P, A, N, 1)
+    score = (window @ peak_weights
+             - _MISSING_LINE_TIE * peak_weights.min() * missing
+             - _WINDOW_RESIDUAL_TIE * (window @ relative)[..., 0])
+    score = np.where(size > 0, score, -np.inf)
+    p, a, s = np.unravel_index(np.argmax(score), score.shape)
+
+    members = in_window[p, a, s]
+    n = index[p, a][members] - index[p, a, s]
+    return pitches[p], peaks[members], n, peak_weights[members]
+
+
+def fit_lattice(coords, count, weights=None, tolerance=0.2, merge_gap=None):
+    """
+    用等间距网格（offset + pitch * i, i = 0..count-1）拟合一维坐标。
+
+    算法步骤：
+    1. 合并相邻坐标得到峰值（find_line_peaks）
+    2. 以相邻峰间距的中位数为基准，在其1/2、1倍、2倍附近由峰间距生成候选间距（_candidate_pitches），
+       三个区间一次广播打分，每个区间按内点权重粗选两个（_coarse_pitches）
+    3. 对候选间距和每个锚点峰，统计落在某个连续 count 格窗口内、偏差小于 tolerance * pitch 的峰权重，
+       取得分最高的组合（_best_window，全部以 NumPy 广播计算）
+    4. 对窗口内的峰做加权最小二乘，得到精确的 offset 和 pitch
+    5. 有检测峰的网格线取峰位置，缺失的网格线由拟合结果补齐
+
+    Args:
+        coords: 检测到的线坐标
+        count: 网格线数量（横线10条，竖线9条）
+        weights: 每个坐标的权重（例如线段长度）
+        tolerance: 峰与网格线的最大偏差，相对于间距
+        merge_gap: 峰合并间隔，见 find_line_peaks
+
+    Returns:
+        list: count 个升序的整数坐标；峰少于2个时无法拟合，返回峰位置
+    """
+    peaks, peak_weights = find_line_peaks(coords, weights, merge_gap)
+    if len(peaks) < 2:
+        return [int(round(p)) for p in peaks]
+
+    bands, candidates = _candidate_pitches(peaks, count)
+    offsets = peaks[None, :, None] - peaks[None, None, :]                          # (1, A, N)
+    pitches = _coarse_pitches(offsets, peak_weights, bands, candidates, tolerance)
+    pitch, positions, n, w = _best_window(offsets, peaks, peak_weights, pitches, count, tolerance)
+
+    if n.min() != n.max():
+        # 加权最小二乘: peaks = offset + pitch * n（两个参数，直接用闭式解）
+        n_mean, y_mean = np.average(n, weights=w), np.average(positions, weights=w)
+        pitch = np.sum(w * (n - n_mean) * (positions - y_mean)) / np.sum(w * (n - n_mean) ** 2)
+        offset = y_mean - pitch * n_mean
+    else:
+        offset = positions[0] - pitch * n[0]
+
+    lattice = offset + pitch * np.arange(count)
+    for position, i in zip(positions, n.astype(int)):
+        lattice[i] = position
+    return [int(round(x)) for x in np.sort(lattice)]
+
+
 def cluster_lines(lines, axis='y', num_clusters=10):
     """
-    使用K-Means聚类算法对检测到的线进行分组，并返回每组的中心点。
-    这比旧的`keep_middle_lines`方法更健壮。
+    将检测到的线拟合为等间距网格，并返回每条网格线的坐标。
+    缺失的网格线由拟合的间距补齐，多余的边框线不会被计入。
 
     Args:
         lines (list): Hough变换检测到的线的列表。
-        axis (str): 'y'表示水平线聚类, 'x'表示垂直线聚类。
-        num_clusters (int): 期望的簇数量 (10条水平线, 9条垂直线)。
+        axis (str): 'y'表示水平线, 'x'表示垂直线。
+        num_clusters (int): 期望的网格线数量 (10条水平线, 9条垂直线)。
 
     Returns:
-        list: 包含每个簇中心点坐标的列表。
+        list: 网格线坐标列表（升序）。
     """
-    if lines is None or len(lines) < num_clusters:
-        print(f"Warning: 检测到的线数量 ({len(lines) if lines else 0}) 少于期望的数量 ({num_clusters})。")
-        # 即使线不够，也尝试返回坐标
-        coords = [line[0][1] if axis == 'y' else line[0][0] for line in lines] if lines else []
-        return sorted(list(set(coords)))
-
-    # 提取用于聚类的坐标
-    coords = [line[0][1] if axis == 'y' else line[0][0] for line in lines]
-    coords_reshaped = np.array(coords).reshape(-1, 1)
-
-    # 使用K-Means进行聚类
-    try:
-        kmeans = KMeans(n_clusters=num_clusters, n_init=10, random_state=0).fit(coords_reshaped)
-        # 获取聚类中心并排序
-        centroids = sorted([int(center[0]) for center in kmeans.cluster_centers_])
-        return centroids
-    except Exception as e:
-        print(f"Error during K-Means clustering: {e}")
-        # 如果聚类失败，返回原始坐标的唯一值
-        return sorted(list(set(coords)))
+    if lines is None or len(lines) == 0:
+        print(f"Warning: 未检测到任何线，期望的数量为 {num_clusters}。")
+        return []
+
+    segments = np.array([line[0] for line in lines], dtype=np.float64)
+    if axis == 'y':
+        coords = (segments[:, 1] + segments[:, 3]) / 2
+        lengths = np.abs(segments[:, 2] - segments[:, 0])
+    else:
+        coords = (segments[:, 0] + segments[:, 2]) / 2
+        lengths = np.abs(segments[:, 3] - segments[:, 1])
+    return fit_lattice(coords, num_clusters, weights=lengths)
 
 # 筛选水平线
 def filter_horizontal_lines(lines, img_width):
@@ -148,37 +305,11 @@ def switch_to_fen(array, is_red):
     Returns:
         tuple: (FEN字符串, 处理后的棋盘数组)
     """
-    # 本方是黑方就反向遍历（FEN标准是红方视角）
+    # 本方是黑方就旋转棋盘（FEN标准是红方视角）
     if not is_red:
-        array = [row[::-1] for row in array[::-1]] 
-
-    rows = []  
-    for row in array:  
-        # 初始化当前行的字符串和连续短横线计数器 
-        row_str = []  
-        empty_count = 0  
-
-        # 遍历行中的每个元素  
-        for cell in row:  
-            if cell == '-':  
-                # 如果当前是空位，增加连续空位的计数器  
-                empty_count += 1 
-            else:  
-                # 如果是棋子，先处理之前的连续空位  
-                if empty_count > 0:  
-                    row_str.append(str(empty_count))  
-                    empty_count = 0  
-                # 添加非空元素  
-                row_str.append(cell)  
-  
-        # 处理行末尾的连续空位  
-        if empty_count > 0:  
-            row_str.append(str(empty_count))  
-  
-        # 将当前行的字符串列表转换为单个字符串，并添加到结果列表中  
-        rows.append(''.join(row_str))  
-
-    fen_string = "/".join(rows) + (' w' if is_red else ' b')
+        array = fen_codec.flip_board(array)
+
+    fen_string = fen_codec.board_to_fen(array) + (' w' if is_red else ' b')
     return fen_string, array
 
 def convert_move_to_chinese(move, board_array, is_red):
@@ -199,89 +330,13 @@ def convert_move_to_chinese(move, board_array, is_red):
     Returns:
         str: 中文着法描述
     """
-    # 只允许标准4位着法（如 a2b3），否则直接返回
-    if not isinstance(move, str) or not re.match(r'^[a-i][0-9][a-i][0-9]$', move):
-        return move
-
-    PIECE_CODES = {
-        'r': '车', 'n': '马', 'b': '象', 'a': '士', 'k': '将', 'p': '卒', 'c': '炮',
-        'R': '车', 'N': '马', 'B': '相', 'A': '士', 'K': '帅', 'P': '兵', 'C': '炮', '-': '空'
-    }
-
-    try:
-        # 解析着法
-        start_col_char, start_row_str, end_col_char, end_row_str = move[0], move[1], move[2], move[3]
-        start_row = int(start_row_str)
-        end_row = int(end_row_str)
-        start_col = ord(start_col_char) - ord('a')
-        end_col = ord(end_col_char) - ord('a')
-        
-        # 获取棋子类型
-        piece_type = board_array[9 - start_row][start_col]
-        piece_name = PIECE_CODES.get(piece_type, piece_type)
-
-        # 转换为中文坐标
-        # 红方视角：列从右到左1-9，行从上到下1-10
-        start_col_chinese = CHINESE_NUM[(9 - start_col)] if is_red else (start_col + 1)
-        end_col_chinese = CHINESE_NUM[(9 - end_col)] if is_red else (end_col + 1)
-        crossed_row = CHINESE_NUM[abs(end_row - start_row)] if is_red else abs(end_row - start_row)
-
-        name = piece_name
-        
-        # 处理同列同名棋子的情况
-        if piece_type in ['r', 'R', 'n', 'N', 'c', 'C', 'p', 'P']:
-            col_of_board = [row[start_col] for row in board_array]
-            if col_of_board.count(piece_type) > 1:
-                if col_of_board.index(piece_type) == 9 - start_row:
-                    name = "前" if is_red else "后"
-                else:
-                    name = "后" if is_red else "前"
-                start_col_chinese = piece_name
-
-        # 生成着法描述
-        if start_row == end_row:
-            # 平移
-            direction = "平"
-            desc = f"{name}{start_col_chinese}{direction}{end_col_chinese}"
-        else:
-            # 前进或后退
-            action1 = "进" if is_red else "退"
-            action2 = "退" if is_red else "进"
-            direction = action1 if start_row < end_row else action2
-            
-            if piece_type in ['r', 'R', 'c', 'C', 'p', 'P', 'k', 'K']:
-                # 车、炮、卒、将帅：末尾数字是跨越的行数
-                desc = f"{name}{start_col_chinese}{direction}{crossed_row}"
-            else:
-                # 马、象、士：末尾数字是终点所在列数
-                desc = f"{name}{start_col_chinese}{direction}{end_col_chinese}"
-
-        return desc
-    except Exception as e:
-        print(f"解析着法失败: {move}, 错误: {e}")
-        return move
+    return notation.move_to_chinese(move, board_array, is_red)
 
 def fen_to_board_array(fen_board):
     """
     Converts the board part of a FEN string into a 10x9 2D array.
     """
-    board = []
-    rows = fen_board.split('/')
-    for row_str in rows:
-        row = []
-        for char in row_str:
-            if char.isdigit():
-                row.extend(['-'] * int(char))
-            else:
-                row.append(char)
-        # Ensure each row has 9 columns for a valid Xiangqi board
-        if len(row) != 9:
-            raise ValueError("Invalid FEN row length")
-        board.append(row)
-    # Ensure the board has 10 rows
-    if len(board) != 10:
-        raise ValueError("Invalid FEN number of rows")
-    return board
+    return fen_codec.fen_to_board_array(fen_board)
 
 def move_to_coords(move):
     """
@@ -0,0 +1,149 @@
+"""
+启动预热与就绪状态
+
+生产环境使用 gunicorn 预加载 (preload_app) 时的生命周期：
+1. master 进程导入 app，此时不创建引擎（engine_instance 延迟初始化）
+2. master 在 fork 之前调用 preload_caches()，计算模板特征、读入棋盘坐标缓存，
+   这些内存页在 worker 中以写时复制的方式共享
+3. 每个 worker fork 之后调用 after_fork()，丢弃继承的引擎引用与数据库连接，并启动自己的 Pikafish
+4. /api/ready 在缓存与本进程引擎都就绪后返回 200，供负载均衡/编排系统做就绪探测；
+   引擎按需启动（ENGINE_START_ON_FORK=0）的 worker 在缓存就绪后即可就绪，引擎一旦启动则还要求引擎可用
+
+单进程运行 (python run.py) 时直接调用 warm_up() 完成全部步骤。
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    """预热各阶段的完成情况，fork 之后 master 中完成的缓存预热状态被 worker 继承"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.caches_ready = False
+        self.caches: Dict[str, Any] = {}
+        self.preload_ms: Optional[float] = None
+        self.engine_start_ms: Optional[float] = None
+        self.engine_pid: Optional[int] = None
+        self.lazy_engine_pid: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "caches_ready": self.caches_ready,
+                "caches": self.caches,
+                "preload_ms": self.preload_ms,
+                "engine_start_ms": self.engine_start_ms if self.engine_pid == os.getpid() else None,
+                "engine_lazy": self.lazy_engine_pid == os.getpid(),
+                "error": self.error,
+            }
+
+
+warmup_state = WarmupState()
+
+
+def preload_caches(platforms=None) -> Dict[str, Any]:
+    """在 fork 之前预热识别缓存（模板特征与棋盘坐标），不启动引擎"""
+    from app.services.recognition import ACTIVE_RECOGNIZER
+    from app.services.recognition.core import board_cache_loaded
+
+    start = time.perf_counter()
+    try:
+        templates = ACTIVE_RECOGNIZER.core.preload(platforms)
+    except Exception as e:
+        logger.error(f"识别缓存预热失败: {e}", exc_info=True)
+        with warmup_state._lock:
+            warmup_state.error = str(e)
+        return {}
+    elapsed = (time.perf_counter() - start) * 1000
+    caches = {"templates": templates, "board_calibration": board_cache_loaded()}
+    with warmup_state._lock:
+        warmup_state.caches_ready = True
+        warmup_state.caches = caches
+        warmup_state.preload_ms = round(elapsed, 3)
+    logger.info(f"识别缓存预热完成，用时 {elapsed:.0f}ms: {caches}")
+    return caches
+
+
+def start_engine():
+    """在当前进程中启动引擎（已经启动时直接返回）"""
+    from app.engine import engine_instance
+
+    start = time.perf_counter()
+    engine = engine_instance.get()
+    elapsed = (time.perf_counter() - start) * 1000
+    with warmup_state._lock:
+        if warmup_state.engine_pid != os.getpid():
+            warmup_state.engine_start_ms = round(elapsed, 3)
+            warmup_state.engine_pid = os.getpid()
+    logger.info(f"进程 {os.getpid()} 引擎启动完成，用时 {elapsed:.0f}ms，可用: {engine.engine_available}")
+    return engine
+
+
+def after_fork(start: bool = True):
+    """
+    worker 进程 fork 之后调用
+
+    Args:
+        start: 是否立即启动本进程的引擎；为 False 时引擎在第一次分析时启动
+    """
+    from app.database import dispose_after_fork
+    from app.engine import engine_instance, engine_sessions
+
+    engine_instance.reset_after_fork()
+    engine_sessions.reset_after_fork()
+    dispose_after_fork()
+    if start:
+        start_engine()
+    else:
+        _defer_engine()
+
+
+def _defer_engine():
+    # 本进程的引擎在第一次分析时才启动，就绪探测不等待引擎
+    with warmup_state._lock:
+        warmup_state.lazy_engine_pid = os.getpid()
+
+
+def warm_up(platforms=None, start: bool = True):
+    """单进程部署的完整预热"""
+    preload_caches(platforms)
+    if start:
+        start_engine()
+    else:
+        _defer_engine()
+
+
+def readiness() -> Dict[str, Any]:
+    """
+    当前进程的就绪状态：缓存已预热，且本进程的引擎已启动并可用；
+    引擎按需启动时，启动之前只看缓存，启动之后同样要求引擎可用
+    """
+    from app.engine import engine_instance
+
+    engine_started = engine_instance.started
+    engine_available = bool(engine_started and engine_instance.engine_available)
+    state = warmup_state.snapshot()
+    engine_ready = engine_available if engine_started else state["engine_lazy"]
+    return {
+        "ready": state["caches_ready"] and engine_ready,
+        "pid": os.getpid(),
+        "engine": {
+            "started": engine_started,
+            "lazy": state["engine_lazy"],
+            "available": engine_available,
+            "start_ms": state["engine_start_ms"],
+        },
+        "caches": {
+            "ready": state["caches_ready"],
+            "preload_ms": state["preload_ms"],
+            **state["caches"],
+        },
+        "error": state["error"],
+    }
@@ -0,0 +1,26 @@
+# gunicorn.conf.py
+# 启动: gunicorn -c gunicorn.conf.py run:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+worker_class = "sync"
+worker_connections = 1000
+timeout = 30
+keepalive = 2
+max_requests = 1000
+max_requests_jitter = 100
+# master 进程导入 app 并预热识别缓存，worker fork 后以写时复制方式共享
+preload_app = True
+
+
+def when_ready(server):
+    """master 就绪、首批 worker fork 之前：预热模板特征与棋盘坐标缓存（不启动引擎）"""
+    from app.warmup import preload_caches
+    preload_caches()
+
+
+def post_fork(server, worker):
+    """每个 worker 启动自己的 Pikafish，不与 master 或其他 worker 共用引擎管道"""
+    from app.warmup import after_fork
+    after_fork(start=os.environ.get('ENGINE_START_ON_FORK', '1') == '1')
@@ -1,5 +1,8 @@
 from app import app
+from app.warmup import warm_up
 # 入口是哪个文件,就导入哪个文件(文件夹名.入口文件名)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # 单进程开发服务器：启动前完成缓存预热并启动引擎；gunicorn 部署的预热见 gunicorn.conf.py
+    warm_up()
+    app.run(host='0.0.0.0', port=5000, debug=True)
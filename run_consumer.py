@@ -9,8 +9,13 @@ from logging.handlers import RotatingFileHandler
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.message_queue.redis_consumer import RedisConsumer
+from app.message_queue.redis_stream_consumer import RedisStreamConsumer
 from app.message_queue.chess_game_consumer import chess_message_processor
 from app.message_queue.config import Config
+from app.metrics import start_metrics_server
+from app.config import Config as AppConfig
+from app.logging_handlers import JsonFormatter, QueueLogging, SamplingFilter
+from app.shutdown import shutdown_manager
 
 def setup_logging():
     """配置全局日志记录"""
@@ -41,6 +46,20 @@ def setup_logging():
     file_handler = RotatingFileHandler(log_file, maxBytes=2*1024*1024, backupCount=5, encoding='utf-8')
     file_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
+
+    if AppConfig.LOG_JSON:
+        json_formatter = JsonFormatter()
+        console_handler.setFormatter(json_formatter)
+        file_handler.setFormatter(json_formatter)
+
+    if AppConfig.LOG_ASYNC:
+        # 控制台与文件写入移到后台线程，消息处理线程只做入队
+        queue_logging = QueueLogging([''], queue_size=AppConfig.LOG_QUEUE_SIZE, sample_rate=AppConfig.LOG_SAMPLE_RATE)
+        shutdown_manager.register(queue_logging.stop, priority=-90)
+    else:
+        sampling = SamplingFilter(AppConfig.LOG_SAMPLE_RATE)
+        console_handler.addFilter(sampling)
+        file_handler.addFilter(sampling)
     
     logging.info("日志系统配置完成，将同时输出到控制台和文件。")
 
@@ -52,6 +71,8 @@ def main():
 
     # 从配置中获取默认队列名
     default_queue = Config.get_queue_config().get('chess_message_queue', 'chess_message_queue')
+    consumer_config = Config.get_consumer_config()
+    stream_config = Config.get_stream_config()
     
     parser = argparse.ArgumentParser(description="运行象棋游戏消息消费者，方便调试。")
     parser.add_argument(
@@ -66,25 +87,63 @@ def main():
         default=None,
         help="要消费的消息数量，消费完后自动退出 (默认: 无限循环)"
     )
+    parser.add_argument(
+        "--backend",
+        choices=["list", "stream"],
+        default=consumer_config.get('backend', 'list'),
+        help="消费后端: list 使用brpop队列, stream 使用Redis Streams消费者组 (默认: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=consumer_config.get('metrics_port', 0),
+        help="指标 HTTP 服务端口，提供 /metrics，0 表示不启动 (默认: %(default)s)"
+    )
     
     args = parser.parse_args()
 
     print(f"--- 消费者启动配置 ---")
-    print(f"队列: {args.queue}")
+    print(f"后端: {args.backend}")
+    if args.backend == 'stream':
+        print(f"流: {stream_config['stream_name']}, 消费者组: {stream_config['group_name']}")
+    else:
+        print(f"队列: {args.queue}")
     print(f"消费数量: {'无限' if args.count is None else args.count}")
+    print(f"指标端口: {args.metrics_port or '未启动'}")
     print("----------------------")
 
     # 获取Redis连接配置
     redis_config = Config.get_redis_config()
 
+    consumer = None
+    metrics_server = None
     try:
-        consumer = RedisConsumer(
-            host=redis_config.get('host'),
-            port=redis_config.get('port'),
-            password=redis_config.get('password'),
-            db=redis_config.get('db'),
-            queue_name=args.queue
-        )
+        if args.metrics_port:
+            metrics_server = start_metrics_server(args.metrics_port)
+
+        if args.backend == 'stream':
+            consumer = RedisStreamConsumer(
+                host=redis_config.get('host'),
+                port=redis_config.get('port'),
+                password=redis_config.get('password'),
+                db=redis_config.get('db'),
+                batch_size=consumer_config.get('batch_size'),
+                retry_count=consumer_config.get('retry_count'),
+                retry_delay=consumer_config.get('retry_delay'),
+                **stream_config
+            )
+        else:
+            consumer = RedisConsumer(
+                host=redis_config.get('host'),
+                port=redis_config.get('port'),
+                password=redis_config.get('password'),
+                db=redis_config.get('db'),
+                queue_name=args.queue,
+                batch_size=consumer_config.get('batch_size'),
+                max_workers=consumer_config.get('max_workers'),
+                timeout=consumer_config.get('timeout')
+            )
 
         consumer.set_message_handler(chess_message_processor.process_message)
         
@@ -99,10 +158,13 @@ def main():
 
     except KeyboardInterrupt:
         print("\nℹ️ 检测到手动中断 (Ctrl+C)，正在停止消费者...")
-        consumer.stop_consumer()
+        if consumer:
+            consumer.stop_consumer()
     except Exception as e:
         print(f"❌ 启动消费者时发生致命错误: {e}")
     finally:
+        if metrics_server:
+            metrics_server.shutdown()
         print("✅ 消费者已安全退出。")
 
 if __name__ == "__main__":
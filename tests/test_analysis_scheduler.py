@@ -0,0 +1,100 @@
+import threading
+
+from app.message_queue.analysis_scheduler import AnalysisScheduler, AnalysisRequest
+
+
+def make_request(game_id, move_number=1, **kwargs):
+    return AnalysisRequest(game_id=game_id, fen=f"{game_id}-{move_number}", is_red_turn=True,
+                           board_array=[], move_number=move_number, **kwargs)
+
+
+def test_requests_run_in_priority_order():
+    gate, started = threading.Event(), threading.Event()
+    order = []
+
+    def analyze(fen, is_red_turn, board_array, engine=None):
+        if fen == 'blocker-1':
+            started.set()
+            gate.wait(timeout=5)
+        order.append(fen)
+        return {'move': fen}
+
+    scheduler = AnalysisScheduler(analyze=analyze)
+    first = scheduler.submit(make_request('blocker'))
+    started.wait(timeout=5)
+    futures = [
+        scheduler.submit(make_request('opponent', is_ai_move=False)),
+        scheduler.submit(make_request('plenty', remaining_time=300000)),
+        scheduler.submit(make_request('unknown')),
+        scheduler.submit(make_request('hurry', remaining_time=5000)),
+    ]
+    gate.set()
+    for future in [first] + futures:
+        future.result(timeout=5)
+    scheduler.stop()
+
+    assert order == ['blocker-1', 'hurry-1', 'plenty-1', 'unknown-1', 'opponent-1']
+
+
+def test_stale_and_superseded_requests_are_dropped():
+    gate, started = threading.Event(), threading.Event()
+    analyzed = []
+
+    def analyze(fen, is_red_turn, board_array, engine=None):
+        if fen == 'blocker-1':
+            started.set()
+            gate.wait(timeout=5)
+        analyzed.append(fen)
+        return {'move': fen}
+
+    scheduler = AnalysisScheduler(analyze=analyze, is_stale=lambda req: req.game_id == 'finished')
+    scheduler.submit(make_request('blocker'))
+    started.wait(timeout=5)
+    old = scheduler.submit(make_request('g1', move_number=3))
+    new = scheduler.submit(make_request('g1', move_number=5))
+    stale = scheduler.submit(make_request('finished'))
+    gate.set()
+
+    assert old.result(timeout=5) is None
+    assert new.result(timeout=5) == {'move': 'g1-5'}
+    assert stale.result(timeout=5) is None
+    assert scheduler._latest == {}  # 出队后不再保留对局的请求序号
+    scheduler.stop()
+
+    assert analyzed == ['blocker-1', 'g1-5']
+    assert scheduler.stats['dropped_stale'] == 2
+
+
+def test_processor_submits_without_waiting_so_requests_are_prioritised(monkeypatch):
+    from app.message_queue import chess_game_consumer
+
+    gate, started = threading.Event(), threading.Event()
+    order = []
+
+    def analyze(fen, is_red_turn, board_array, engine=None):
+        if fen == 'blocker-1':
+            started.set()
+            gate.wait(timeout=5)
+        order.append(fen)
+        return {'move': fen}
+
+    monkeypatch.setattr(chess_game_consumer, 'analyze_fen', analyze)
+    processor = chess_game_consumer.ChessGameMessageProcessor()
+
+    def publish(game_id):
+        return lambda ai_move: processor._publish_recommendation(game_id, None, '', ai_move)
+
+    # 同一个处理线程连续提交：不等待上一条结果，请求才能在队列里排序
+    futures = [processor._request_analysis(make_request('blocker'), publish('blocker'))]
+    assert started.wait(timeout=5)
+    for request in [make_request('opponent', is_ai_move=False), make_request('unknown'),
+                    make_request('hurry', remaining_time=5000)]:
+        futures.append(processor._request_analysis(request, publish(request.game_id)))
+    assert processor.scheduler.pending_count() == 3
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+    processor.scheduler.stop()
+
+    assert order == ['blocker-1', 'hurry-1', 'unknown-1', 'opponent-1']
+    assert processor.get_recommendation('hurry') == {'move': 'hurry-1'}
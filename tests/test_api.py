@@ -32,6 +32,12 @@ def test_health_check(client):
     assert response.status_code == 200
     assert response.json['status'] == 'healthy'
 
+def test_recognition_timings(client):
+    """Per-stage recognition histograms are exposed as JSON."""
+    response = client.get('/api/recognition/timings')
+    assert response.status_code == 200
+    assert isinstance(response.get_json(), dict)
+
 def test_engine_initial_state(client):
     """Check the initial state and parameters of the engine."""
     response = client.get('/api/engine/params')
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+
+from app import database
+from app.database import engine_from_profile, get_db_session, mysql_profile, session_scope, sqlite_profile
+from app.metrics import DB_POOL_CONNECTIONS
+from app.services.db_benchmark import run_benchmark
+
+
+def test_sqlite_profile_enables_wal(tmp_path):
+    url, options, pragmas = sqlite_profile(str(tmp_path / 'chess.db'))
+    assert 'pool_size' not in options and 'max_overflow' not in options
+
+    engine = engine_from_profile(url, options, pragmas)
+    checked_out = DB_POOL_CONNECTIONS.labels(state='checked_out')
+    before = checked_out.get()
+    with engine.connect() as conn:
+        assert checked_out.get() == before + 1
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+    assert checked_out.get() == before
+    engine.dispose()
+
+    assert sqlite_profile(':memory:')[1]['poolclass'] is StaticPool
+
+
+def test_mysql_profile_pings_and_recycles():
+    url, options, pragmas = mysql_profile()
+    assert url.startswith('mysql+pymysql://')
+    assert options['pool_pre_ping'] is True and options['pool_recycle'] == 1800
+    assert pragmas == {}
+
+
+def test_session_is_reused_within_a_scope():
+    if not database.DB_ENABLED:
+        pytest.skip('database disabled')
+    with session_scope():
+        with get_db_session() as first:
+            first.execute(text('SELECT 1'))
+        # 最外层退出时回滚未提交的事务，连接归还连接池
+        assert not first.in_transaction()
+        with get_db_session() as second:
+            assert second is first
+    with get_db_session() as third:
+        assert third is not first
+    database.remove_session()
+
+
+def test_commit_benchmark_runs(tmp_path):
+    result = run_benchmark(commits=20, unit=5, directory=str(tmp_path))
+    assert result['legacy'] > 0 and result['tuned'] > 0
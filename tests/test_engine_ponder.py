@@ -0,0 +1,126 @@
+from collections import deque
+from contextlib import contextmanager
+
+import pytest
+
+from app.chess.board import ChessBoard
+from app.engine.core import Engine
+from app.engine.session import EngineSession
+from app.message_queue.chess_game_consumer import ChessGameMessageProcessor
+from app.services import analysis
+
+FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w'
+PONDER_FEN = 'rnbakab1r/9/1c4nc1/p1p1p1p1p/9/9/P1P1P1P1P/1C2C4/9/RNBAKABNR w'
+OTHER_FEN = 'rnbakab1r/9/1c4nc1/p1p1p1p1p/9/9/P1P1P1P1P/1C2C1N2/9/RNBAKAB1R b'
+
+
+class FakePikafish:
+    """pikafish 进程替身：记录写入 stdin 的命令，按命令向 stdout 回放输出"""
+
+    def __init__(self):
+        self.commands = []
+        self._output = deque()
+        self.stdin = self
+        self.stdout = self
+
+    def write(self, data):
+        for command in data.splitlines():
+            self.commands.append(command)
+            if command == 'isready':
+                self._output.append('readyok')
+            elif command == 'ponderhit':
+                self._output += ['info depth 12 score cp 30 nps 1000 pv b0c2 h7e7', 'bestmove b0c2 ponder h7e7']
+            elif command == 'stop':
+                self._output.append('bestmove b0c2')
+            elif command.startswith('go') and 'ponder' not in command.split():
+                self._output += ['info depth 8 score cp 12 nps 900 pv g3g4 c6c5', 'bestmove g3g4 ponder c6c5']
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        return self._output.popleft() + '\n' if self._output else ''
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = Engine(pikafish_path=str(tmp_path / 'missing'), params_file=str(tmp_path / 'params.json'))
+    engine.pikafish = FakePikafish()
+    engine.engine_available = True
+    return engine
+
+
+def test_start_ponder_then_ponderhit(engine):
+    assert engine.start_ponder(FEN, ['h2e2', 'h9g7'], PONDER_FEN)
+    assert engine.pikafish.commands[-2:] == [f'position fen {FEN} moves h2e2 h9g7', 'go ponder depth 20']
+    assert engine.ponder_matches(PONDER_FEN)
+
+    lines, best_move = engine.go(PONDER_FEN, 'depth', '20')
+
+    assert engine.pikafish.commands[-1] == 'ponderhit'
+    assert best_move == 'bestmove b0c2 ponder h7e7'
+    assert not engine.ponder_matches(PONDER_FEN)
+
+
+def test_ponder_miss_stops_before_searching(engine):
+    engine.start_ponder(FEN, ['h2e2', 'h9g7'], PONDER_FEN)
+
+    lines, best_move = engine.go(OTHER_FEN, 'depth', '20')
+
+    commands = engine.pikafish.commands
+    assert commands[commands.index('go ponder depth 20') + 1] == 'stop'
+    assert commands[-2:] == [f'position fen {OTHER_FEN}', 'go depth 20']
+    assert best_move == 'bestmove g3g4 ponder c6c5'
+    assert engine.stop_ponder() is False
+
+
+def test_parse_ponder_move():
+    assert Engine._parse_ponder_move('bestmove h2e2 ponder h9g7', []) == 'h9g7'
+    assert Engine._parse_ponder_move('bestmove h2e2', ['info depth 3 pv h2e2 b9c7 b0c2']) == 'b9c7'
+    assert Engine._parse_ponder_move('bestmove h2e2', ['info depth 1 pv h2e2']) is None
+    assert Engine._parse_ponder_move('', None) is None
+
+
+def test_cloud_answer_stops_a_missed_ponder(engine, monkeypatch):
+    @contextmanager
+    def no_db():
+        yield None
+
+    cloud_move = dict(move='h0g2', chinese_move='马二进三', source=1, score=10, win_rate=5000)
+    monkeypatch.setattr(analysis, 'get_db', no_db)
+    monkeypatch.setattr(analysis, 'get_chessdb_analysis', lambda *args: [cloud_move])
+    engine.start_ponder(FEN, ['h2e2', 'h9g7'], PONDER_FEN)
+
+    result = analysis.analyze_fen(OTHER_FEN, False, [], engine=engine)
+
+    assert result['move'] == 'h0g2'
+    assert engine.pikafish.commands[-1] == 'stop'
+    assert engine.stop_ponder() is False
+
+
+def test_processor_ponders_on_the_predicted_reply(engine):
+    session = EngineSession(engine, 'g1', [])
+    processor = ChessGameMessageProcessor.__new__(ChessGameMessageProcessor)
+
+    processor._start_ponder(session, FEN, {'move': 'h2e2'})
+    assert not engine.pikafish.commands
+
+    processor._start_ponder(session, FEN, {'move': 'h2e2', 'ponder_move': 'h9g7'})
+
+    board = ChessBoard(FEN)
+    board.handle_ucci_move('h2e2')
+    board.handle_ucci_move('h9g7')
+    assert engine.ponder_matches(board.to_fen())
+    assert engine.pikafish.commands[-2:] == ['position startpos moves h2e2 h9g7', 'go ponder depth 20']
+
+
+def test_ponder_move_belongs_to_the_searched_position(engine):
+    engine.go(FEN, 'depth', '20')
+    assert engine.ponder_move(FEN) == 'c6c5'
+
+    # 另一线程随后搜索了别的局面：不把它的预测当作 FEN 的，也不按过时的预测后台思考
+    engine.go(OTHER_FEN, 'depth', '20')
+    assert engine.ponder_move(FEN) is None
+    engine.go(FEN, 'depth', '20')
+    assert not engine.start_ponder(FEN, ['g3g4', 'h9g7'], PONDER_FEN)
+    assert engine.start_ponder(FEN, ['g3g4', 'c6c5'], PONDER_FEN)
@@ -0,0 +1,42 @@
+from app.engine.session import EngineSessionPool
+
+
+class FakeEngine:
+    def __init__(self):
+        self.calls = []
+        self.closed = False
+
+    def get_best_move(self, fen, side, moves=None, game_id=None):
+        self.calls.append((game_id, list(moves)))
+        return 'h2e2'
+
+    def close(self):
+        self.closed = True
+
+
+def test_games_keep_their_engine_and_lru_game_is_evicted():
+    shared = FakeEngine()
+    pool = EngineSessionPool(shared_engine=shared, max_engines=2, engine_factory=FakeEngine)
+
+    assert pool.acquire('g1') is shared
+    second = pool.acquire('g2')
+    assert second is not shared
+    assert pool.acquire('g1') is shared  # g1 最近使用过，g2 成为最久未使用
+
+    assert pool.acquire('g3') is second
+    assert pool.assignments() == {'g1': 0, 'g3': 1}
+
+    pool.release('g1')
+    assert pool.acquire('g4') is shared
+
+    pool.close()
+    assert second.closed and not shared.closed
+
+
+def test_session_sends_game_moves_to_bound_engine():
+    engine = FakeEngine()
+    pool = EngineSessionPool(shared_engine=engine)
+
+    pool.session('g1', ['h2e2', 'h9g7']).get_best_move('fen', 'depth')
+
+    assert engine.calls == [('g1', ['h2e2', 'h9g7'])]
@@ -0,0 +1,42 @@
+import pytest
+
+from app import fen, utils
+from app.chess.board import ChessBoard
+from app.engine import board as engine_board
+
+FEN = "3a5/4a4/3k5/9/4P4/3C5/9/3ABA1r1/3rnpc2/4K4"
+
+
+def test_round_trip_and_cached_boards_are_not_shared():
+    array = fen.fen_to_board_array(FEN + " w")
+    assert array[2] == ['-', '-', '-', 'k', '-', '-', '-', '-', '-']
+    assert fen.board_to_fen(array) == FEN
+
+    array[0][0] = 'R'  # 调用方修改自己的副本不能污染缓存
+    assert fen.fen_to_board_array(FEN)[0][0] == '-'
+    assert fen.parse_board(FEN) is fen.parse_board(FEN + " b")
+    assert fen.fen_to_numpy(FEN).shape == (10, 9)
+    assert fen.board_to_fen(fen.fen_to_numpy(FEN)) == FEN
+
+
+@pytest.mark.parametrize("bad", ["9/9/9", "3a5/4a4/3k5/9/4P4/3C5/9/3ABA1r1/3rnpc2/4K5"])
+def test_invalid_fen_raises(bad):
+    with pytest.raises(ValueError):
+        fen.fen_to_board_array(bad)
+
+
+def test_wrappers_agree_with_codec():
+    array = fen.fen_to_board_array(FEN)
+    flipped = fen.flip_board(array)
+
+    assert utils.switch_to_fen(array, True)[0] == FEN + " w"
+    assert utils.switch_to_fen(flipped, False) == (FEN + " b", array)
+    assert engine_board.switch_to_fen(array, True) == (FEN, array)
+    assert engine_board.switch_to_fen(array[:9], True)[0] == fen.START_FEN
+    assert utils.fen_to_board_array(FEN) == engine_board.fen_to_board_array(FEN) == array
+
+    board = ChessBoard(FEN + " w")
+    assert board.pieces[(3, 7)].name == '将'
+    assert board.to_fen() == FEN + " w"
+    assert board.fen_to_board_array(FEN + " w") == array
+    assert ChessBoard().to_fen() == fen.START_FEN + " w"
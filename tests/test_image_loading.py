@@ -0,0 +1,33 @@
+import os
+
+import cv2
+import numpy as np
+
+from app.services.recognition.core import FenRecognizerCore
+
+IMAGE_PATH = os.path.join(os.path.dirname(__file__), 'resources', 'test_board_for_fen.png')
+
+
+def test_bytes_and_buffer_decode_like_file():
+    core = FenRecognizerCore()
+    with open(IMAGE_PATH, 'rb') as f:
+        data = f.read()
+
+    from_file, gray_file = core.pre_processing_image(IMAGE_PATH)
+    from_bytes, gray_bytes = core.pre_processing_image(data)
+    from_buffer, _ = core.pre_processing_image(np.frombuffer(data, dtype=np.uint8))
+
+    assert np.array_equal(from_file, from_bytes)
+    assert np.array_equal(from_file, from_buffer)
+    assert np.array_equal(gray_file, gray_bytes)
+
+
+def test_decoded_images_are_accepted_and_invalid_data_fails():
+    core = FenRecognizerCore()
+    image = cv2.imread(IMAGE_PATH)
+
+    img, _ = core.pre_processing_image(image)
+    assert img is image
+    img, _ = core.pre_processing_image(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    assert img.shape == image.shape
+    assert core.pre_processing_image(b'not an image') == (None, None)
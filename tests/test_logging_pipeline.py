@@ -0,0 +1,91 @@
+import json
+import logging
+import queue
+
+from app.logging_handlers import SAMPLED, JsonFormatter, QueueLogging, RoutedQueueHandler, SamplingFilter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+
+def make_logger(name):
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def test_queue_logging_formats_in_background_thread_and_routes_by_logger():
+    first, second = make_logger('test.pipeline.a'), make_logger('test.pipeline.b')
+    a_handler, b_handler = ListHandler(), ListHandler(logging.WARNING)
+    first.addHandler(a_handler)
+    second.addHandler(b_handler)
+
+    pipeline = QueueLogging(['test.pipeline.a', 'test.pipeline.b'])
+    try:
+        first.info("move %s", "h2e2")
+        second.info("below the handler level")
+        second.warning("engine %s", "timeout")
+    finally:
+        pipeline.stop()
+
+    assert a_handler.records == ["move h2e2"]
+    assert b_handler.records == ["engine timeout"]
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    logger = make_logger('test.pipeline.full')
+    handler = RoutedQueueHandler(queue.Queue(1), 'test.pipeline.full')
+    logger.addHandler(handler)
+
+    for i in range(5):
+        logger.info("record %d", i)
+
+    assert handler.dropped == 4
+    assert handler.queue.get_nowait().getMessage() == "record 0"
+
+
+def test_mutable_args_are_formatted_before_queueing():
+    logger = make_logger('test.pipeline.mutable')
+    handler = RoutedQueueHandler(queue.Queue(), 'test.pipeline.mutable')
+    logger.addHandler(handler)
+
+    moves = ['h2e2']
+    logger.info("moves %s", moves)
+    logger.info("move %s at %d", "h9g7", 2)
+    moves.append('h9g7')
+
+    mutable, immutable = handler.queue.get_nowait(), handler.queue.get_nowait()
+    assert (mutable.getMessage(), mutable.args) == ("moves ['h2e2']", None)
+    assert immutable.args == ("h9g7", 2)  # 不可变参数仍推迟到监听线程格式化
+
+
+def test_sampled_records_pass_once_per_rate_per_call_site():
+    logger = make_logger('test.pipeline.sampled')
+    handler = ListHandler()
+    handler.addFilter(SamplingFilter(rate=4))
+    logger.addHandler(handler)
+
+    for i in range(10):
+        logger.debug("piece %d", i, extra=SAMPLED)
+    logger.debug("not sampled")
+
+    assert handler.records == ["piece 0", "piece 4", "piece 8", "not sampled"]
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.makeLogRecord({
+        'name': 'app.engine', 'levelno': logging.INFO, 'levelname': 'INFO',
+        'msg': 'best move %s', 'args': ('h2e2',), 'game_id': 'g1',
+    })
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'best move h2e2'
+    assert entry['logger'] == 'app.engine' and entry['level'] == 'INFO'
+    assert entry['game_id'] == 'g1'
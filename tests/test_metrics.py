@@ -0,0 +1,68 @@
+import urllib.request
+
+import pytest
+
+from app import app as flask_app
+from app.metrics import MetricsRegistry, start_metrics_server
+from app.services.recognition.timing import StageTimer, span
+
+
+@pytest.fixture
+def client():
+    flask_app.config.update({"TESTING": True})
+    return flask_app.test_client()
+
+
+def test_registry_renders_text_exposition_format():
+    reg = MetricsRegistry()
+    searches = reg.counter('searches_total', 'Searches', ['mode'])
+    depth = reg.gauge('queue_length', 'Queue length', ['queue'])
+    latency = reg.histogram('search_seconds', 'Search latency', buckets=(0.1, 1))
+
+    searches.labels(mode='go').inc()
+    searches.labels(mode='go').inc(2)
+    depth.labels(queue='q"1').set_function(lambda: 7)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+
+    text = reg.render()
+    assert '# TYPE searches_total counter' in text
+    assert 'searches_total{mode="go"} 3' in text
+    assert 'queue_length{queue="q\\"1"} 7' in text
+    assert 'search_seconds_bucket{le="0.1"} 1' in text
+    assert 'search_seconds_bucket{le="1"} 2' in text
+    assert 'search_seconds_bucket{le="+Inf"} 3' in text
+    assert 'search_seconds_count 3' in text
+    assert reg.counter('searches_total', 'Searches', ['mode']) is searches
+    with pytest.raises(ValueError):
+        searches.labels(mode='go').inc(-1)
+
+
+def test_metrics_endpoint_includes_recognition_stages(client):
+    with StageTimer():
+        with span('grid'):
+            pass
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    body = response.get_data(as_text=True)
+    assert '# TYPE chess_recognition_stage_seconds histogram' in body
+    assert 'chess_recognition_stage_seconds_count{stage="grid"}' in body
+    # JSON 接口读取的是同一个直方图
+    grid = client.get('/api/recognition/timings').get_json()['grid']
+    assert f'chess_recognition_stage_seconds_count{{stage="grid"}} {grid["count"]}' in body
+    assert '# TYPE chess_engine_search_seconds histogram' in body
+
+
+def test_standalone_metrics_server():
+    server = start_metrics_server(0, host='127.0.0.1')
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            body = response.read().decode('utf-8')
+        assert '# TYPE chess_queue_length gauge' in body
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,60 @@
+import pytest
+
+from app.chess.board import ChessBoard, notation_record_to_ucci
+from app.engine.board import convert_move_to_chinese
+from app.fen import START_FEN, fen_to_board_array
+from app.notation import moves_to_chinese
+
+
+def test_opening_moves_for_both_sides():
+    board = fen_to_board_array(START_FEN)
+
+    assert moves_to_chinese(['h2e2', 'b0c2', 'a3a4', 'e0e1', 'bad'], board, True) == \
+        ['炮二平五', '马八进七', '兵九进一', '帅五进一', 'bad']
+    assert moves_to_chinese(['h7e7', 'b9c7', 'c6c5', 'a9a7'], board, False) == \
+        ['炮8平5', '马2进3', '卒3进1', '车1进2']
+    assert convert_move_to_chinese('h2e2', board, True) == '炮二平五'
+
+
+def test_pieces_sharing_a_file():
+    two_rooks = fen_to_board_array('4k4/9/9/9/9/9/9/R8/9/R3K4')
+    assert moves_to_chinese(['a2a5', 'a0b0'], two_rooks, True) == ['前车进三', '后车平八']
+
+    three_pawns = '4k4/9/9/4P4/4P4/4P4/9/9/9/4K4'
+    assert moves_to_chinese(['e6e7', 'e5d5', 'e4e5'], fen_to_board_array(three_pawns), True) == \
+        ['前兵进一', '中兵平六', '后兵进一']
+
+    # 两列都有多个兵时用列号代替棋子名
+    two_files = fen_to_board_array('4k4/9/9/4P4/4P1P2/4P1P2/9/9/9/4K4')
+    assert moves_to_chinese(['e6e7', 'g4g5'], two_files, True) == ['前五进一', '后三进一']
+
+    black_pawns = fen_to_board_array('4k4/9/9/4p4/4p4/9/9/9/9/4K4')
+    assert moves_to_chinese(['e5e4', 'e6d6'], black_pawns, False) == ['前卒进1', '后卒平4']
+
+
+def test_chess_board_notation_uses_the_same_tables():
+    board = ChessBoard('4k4/9/9/4P4/4P4/4P4/9/9/9/4K4 w')
+    assert board.get_move_notation(board.pieces[(4, 5)], (3, 5)) == '中兵平六'
+    assert ChessBoard().move_piece((7, 2), (4, 2)) == '炮二平五'
+
+
+RECORD = "1. 炮二平五 马8进7 2. 马二进三 车9平8 3. 车一平二 马2进3 4. 车二进六 炮8平9 5. 车二平三 炮9退1"
+
+
+def test_parse_notation_from_generated_moves():
+    board = ChessBoard()
+    assert len(board.notation_table()) == 44
+    assert board.parse_chinese_notation('傌二進三') == ((7, 0), (6, 2))
+
+    # 已经离开初始位置的棋子也能解析
+    board = ChessBoard('r1bakabr1/9/1cn3nc1/p1p1p3p/6p2/9/P1P1P1P1P/1C2C1N2/9/RNBAKAB1R b')
+    assert board.parse_chinese_notation('马7进6') == ((6, 7), (5, 5))
+    with pytest.raises(ValueError):
+        board.parse_chinese_notation('马7进9')
+
+
+def test_record_import():
+    assert notation_record_to_ucci(RECORD) == [
+        'h2e2', 'h9g7', 'h0g2', 'i9h9', 'i0h0', 'b9c7', 'h0h6', 'h7i7', 'h6g6', 'i7i8']
+    with pytest.raises(ValueError, match='第 3 步'):
+        notation_record_to_ucci(['炮二平五', '马8进7', '车二进一'])
@@ -0,0 +1,118 @@
+import importlib
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import app as flask_app
+from app.chess.board import ChessBoard
+from app.chess.game_manager import ChessGame, GameResult, Player
+from app.database import Base
+from app.fen import START_FEN
+from app.models.chess_models import AIChessGame, AIChessMove, AIChessPositionStat
+from app.routes import api
+from app.services import position_stats, upsert
+
+# app.chess 把同名的 game_manager 实例导出在包上
+game_manager = importlib.import_module('app.chess.game_manager')
+
+OPENING = ['炮二平五', '马8进7', '马二进三', '车9平8']
+
+
+@pytest.fixture
+def session(monkeypatch):
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        @contextmanager
+        def scoped():
+            yield db
+
+        monkeypatch.setattr(game_manager, 'get_db_session', scoped)
+        yield db
+
+
+def _play(game_id, notations, result):
+    game = ChessGame(game_id, Player(1, 'red'), Player(2, 'black'))
+    game.save_to_database()
+    game.start_game()
+    for notation in notations:
+        game.make_move(*game.board.parse_chinese_notation(notation))
+    game.end_game(result)
+    # 重复的结束消息不会重复计数
+    game.end_game(result)
+    return game
+
+
+def _snapshot(db):
+    return {(s.fen, s.side, s.move): (s.cc, s.play_count, s.win_count, s.draw_count, s.loss_count)
+            for s in db.execute(select(AIChessPositionStat)).scalars()}
+
+
+def test_incremental_statistics_match_rebuild(session):
+    _play('g1', OPENING, GameResult.RED_WIN)
+    _play('g2', OPENING[:2] + ['兵七进一'], GameResult.DRAW)
+
+    moves = position_stats.position_stats(session, START_FEN)
+    assert moves == [dict(side='w', move='h2e2', cc='炮二平五', count=2, wins=1, draws=1, losses=0,
+                          avg_score=0.75)]
+    board = ChessBoard()
+    board.move_piece(*board.parse_chinese_notation('炮二平五'))
+    replies = position_stats.position_stats(session, board.to_fen())
+    assert [(m['move'], m['count'], m['losses'], m['avg_score']) for m in replies] == \
+        [('h9g7', 2, 1, 0.25)]
+
+    incremental = _snapshot(session)
+    assert len(incremental) == 5
+    assert position_stats.rebuild(session) == 5
+    assert _snapshot(session) == incremental
+
+    popular = position_stats.popular_positions(session, limit=3)
+    assert {p['count'] for p in popular} == {2}
+    assert dict(fen=f'{START_FEN} w', count=2, moves=1) in popular
+
+
+def test_statistics_failure_does_not_lose_moves_or_results(session):
+    # 部署后统计表还没建好：着法与对局结果照常提交，统计之后由 rebuild 补齐
+    AIChessPositionStat.__table__.drop(session.get_bind())
+
+    _play('g1', OPENING, GameResult.RED_WIN)
+
+    assert session.scalar(select(func.count()).select_from(AIChessMove)) == len(OPENING)
+    assert session.scalar(select(AIChessGame.result).where(AIChessGame.chess_id == 'g1')) == '红胜'
+
+    AIChessPositionStat.__table__.create(session.get_bind())
+    assert position_stats.rebuild(session) == len(OPENING)
+
+
+def test_counters_add_up_on_conflict(session):
+    for _ in range(3):
+        position_stats.record_move(session, START_FEN, 'red', 'h2e2', '炮二平五')
+    position_stats.record_result(session, [(START_FEN, 'w', 'h2e2', '')] * 2, '黑胜')
+    assert position_stats.record_result(session, [(START_FEN, 'w', 'h2e2', '')], '未知') == 0
+
+    assert _snapshot(session) == {(START_FEN.split()[0], 'w', 'h2e2'): ('炮二平五', 3, 0, 0, 2)}
+
+    stmt = upsert.upsert_statement('postgresql', AIChessPositionStat.__table__, position_stats.STATS_KEY,
+                                   ('fen', 'updated_at'), position_stats.COUNT_COLUMNS)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert 'play_count = (ai_chess_position_stat.play_count + excluded.play_count)' in sql
+
+
+def test_position_stats_route(session, monkeypatch):
+    position_stats.record_move(session, START_FEN, 'red', 'h2e2', '炮二平五')
+
+    @contextmanager
+    def get_db():
+        yield session
+
+    monkeypatch.setattr(api, 'get_db', get_db)
+    client = flask_app.test_client()
+
+    response = client.get('/api/position_stats', query_string={'fen': START_FEN})
+    assert response.status_code == 200
+    assert response.get_json()['moves'][0]['count'] == 1
+    assert client.get('/api/position_stats').get_json()['positions'][0]['fen'] == f'{START_FEN} w'
@@ -0,0 +1,77 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from app import app as flask_app
+from app.services.recognition.batch import iter_archive_images, recognize_batch
+
+RESOURCES = os.path.join(os.path.dirname(__file__), 'resources')
+EXPECTED = {
+    'image.png': '4k4/9/9/2R6/9/4C4/9/9/4p4/1p1K1p3 w',
+    'test_board_for_fen.png': '3a5/4a4/3k5/9/4P4/3C5/9/3ABA1r1/3rnpc2/4K4 w',
+}
+
+
+def read(name):
+    with open(os.path.join(RESOURCES, name), 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def client():
+    flask_app.config.update({"TESTING": True})
+    return flask_app.test_client()
+
+
+def test_batch_results_keep_input_order_and_report_failures():
+    images = [('a.png', read('test_board_for_fen.png')), ('broken.png', b'not an image'),
+              ('b.png', read('image.png')), ('c.png', read('test_board_for_fen.png'))]
+
+    results = list(recognize_batch(iter(images), {'platform': 'JJ'}, max_workers=2))
+
+    assert [r['name'] for r in results] == ['a.png', 'broken.png', 'b.png', 'c.png']
+    assert [r['success'] for r in results] == [True, False, True, True]
+    assert results[0]['fen'] == results[3]['fen'] == EXPECTED['test_board_for_fen.png']
+    assert results[2]['fen'] == EXPECTED['image.png']
+
+
+def test_archives_are_read_in_order():
+    names = ['image.png', 'test_board_for_fen.png']
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w') as archive:
+        archive.writestr('notes.txt', 'skip me')
+        for name in names:
+            archive.writestr(f'boards/{name}', read(name))
+    zip_buffer.seek(0)
+    assert [name for name, _ in iter_archive_images(zip_buffer, 'boards.zip')] == [f'boards/{n}' for n in names]
+
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode='w:gz') as archive:
+        for name in names:
+            data = read(name)
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    tar_buffer.seek(0)
+    assert [name for name, _ in iter_archive_images(tar_buffer, 'boards.tar.gz')] == names
+
+
+def test_batch_endpoint_streams_ndjson(client):
+    data = {
+        'images': [(io.BytesIO(read('image.png')), 'first.png'),
+                   (io.BytesIO(read('test_board_for_fen.png')), 'second.png')],
+        'param': json.dumps({'platform': 'JJ'}),
+    }
+    response = client.post('/api/recognize/batch', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(r['index'], r['name'], r['fen']) for r in lines] == [
+        (0, 'first.png', EXPECTED['image.png']), (1, 'second.png', EXPECTED['test_board_for_fen.png'])]
+
+    assert client.post('/api/recognize/batch').status_code == 400
@@ -0,0 +1,45 @@
+"""
+识别基准：语料准确率回归 + pytest-benchmark 耗时
+
+单独运行耗时基准：pytest tests/test_recognition_benchmark.py --benchmark-only
+"""
+import os
+
+import pytest
+
+from app.services.recognition.benchmark import load_corpus, recognize_with_timings, run_benchmark, STAGES
+from app.services.recognition.core import FenRecognizerCore
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'resources', 'recognition_corpus.json')
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return load_corpus(CORPUS)
+
+
+def test_corpus_is_recognized_without_square_errors(corpus):
+    report = run_benchmark(corpus, repeats=1)
+
+    assert report['accuracy']['squares'] == 1.0, [r['errors'] for r in report['results']]
+    assert set(report['stages']) == set(STAGES) | {'total'}
+    assert all(stats['p50'] >= 0 for stats in report['stages'].values())
+
+
+@pytest.fixture
+def bench(request):
+    """pytest-benchmark 未安装时跳过耗时基准"""
+    pytest.importorskip('pytest_benchmark')
+    return request.getfixturevalue('benchmark')
+
+
+@pytest.mark.parametrize('index', [0, 1])
+def test_recognition_latency(bench, corpus, index):
+    entry = corpus[index]
+    with open(entry['image'], 'rb') as f:
+        data = f.read()
+    core = FenRecognizerCore()
+
+    fen, _ = bench.pedantic(recognize_with_timings, args=(core, data, {'platform': entry['platform']}),
+                            rounds=3, iterations=1)
+    assert fen == entry['fen']
@@ -0,0 +1,127 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app import utils
+from app.services.recognition import core as recognition_core
+from app.services.recognition.core import FenRecognizerCore
+
+RESOURCES = os.path.join(os.path.dirname(__file__), 'resources')
+
+
+@pytest.fixture
+def core():
+    return FenRecognizerCore()
+
+
+def detect_circles(gray):
+    width = gray.shape[1]
+    max_radius = int(width / 9 / 2)
+    circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, 1, int(0.7 * width / 9), param1=50, param2=18,
+                               minRadius=int(0.5 * max_radius), maxRadius=max_radius)
+    return np.round(circles[0, :]).astype(int)
+
+
+@pytest.mark.parametrize('name', ['image.png', 'test_board_for_fen.png'])
+def test_board_level_colors_match_per_piece_detection(core, name):
+    img, gray = core.pre_processing_image(os.path.join(RESOURCES, name))
+    circles = detect_circles(gray)
+
+    expected = []
+    for x, y, r in circles:
+        piece = img[max(0, y - r):min(img.shape[0] - 1, y + r) + 1, max(0, x - r):min(img.shape[1] - 1, x + r) + 1]
+        expected.append(core.check_chess_piece_color_improved_v2(piece)
+                        or core.check_chess_piece_color_alternative(piece))
+
+    assert core.classify_piece_colors(img, circles, gray) == expected
+    assert core.classify_piece_colors(img, []) == []
+
+
+def test_deduplicate_keeps_highest_confidence_detection(core):
+    circles = np.array([[100, 100, 20], [105, 102, 22], [300, 100, 20], [180, 100, 20]])
+    scores = np.array([12.5, 24.5, 18.5, 12.1])
+
+    kept = core.deduplicate_circles(circles, scores)
+    assert kept.tolist() == [[105, 102, 22], [300, 100, 20], [180, 100, 20]]
+
+    # 同一交叉点上的两个检测即使圆心距离较远也只保留一个
+    kept = core.deduplicate_circles(circles, scores, x_array=[100, 200, 300], y_array=[100, 200])
+    assert kept.tolist() == [[105, 102, 22], [300, 100, 20], [180, 100, 20]]
+    kept = core.deduplicate_circles(circles, scores, x_array=[100, 300], y_array=[100, 200])
+    assert kept.tolist() == [[105, 102, 22], [300, 100, 20]]
+
+
+def test_occupied_intersections_match_board(core):
+    _, gray = core.pre_processing_image(os.path.join(RESOURCES, 'image.png'))
+    x_array = [21, 72, 120, 169, 217, 266, 314, 362, 420]
+    y_array = [23, 80, 127, 174, 221, 267, 313, 361, 408, 464]
+
+    occupied, radius = core.detect_occupied_intersections(gray, x_array, y_array)
+
+    expected = {(0, 4), (3, 2), (5, 4), (8, 4), (9, 1), (9, 3), (9, 5)}
+    assert set(zip(*np.nonzero(occupied))) == expected
+    assert 0 < radius < 25
+
+
+def test_positions_are_assigned_with_confidence_and_conflicts_flagged(core):
+    x_array = [0, 100, 200, 300, 400, 500, 600, 700, 800]
+    y_array = [0, 100, 200, 300, 400, 500, 600, 700, 800, 900]
+    pieces = [(400, 0, 40, 'k'), (402, 10, 40, 'a'), (740, 250, 40, 'R'), (400, 900, 40, 'K')]
+
+    board, is_red, details = core.calculate_pieces_position(x_array, y_array, pieces, return_details=True)
+
+    assert is_red is True
+    assert board[0][4] == 'k'  # 'a' 映射到同一位置但置信度更低
+    assert board[2][7] == 'R' and board[9][4] == 'K'
+    assert [d['flag'] for d in details] == [None, 'conflict', 'low_confidence', None]
+    assert details[2]['confidence'] == 0.0
+    assert core.calculate_pieces_position(x_array, y_array, pieces) == (board, is_red)
+
+
+def test_board_calibration_is_reused_only_for_images_of_its_size(core, tmp_path, monkeypatch):
+    path = tmp_path / 'board.json'
+    monkeypatch.setattr(recognition_core, 'BOARD_JSON_PATH', str(path))
+    monkeypatch.setattr(recognition_core, '_BOARD_DATA_CACHE', None)
+    detected = []
+
+    def detect_grid(img, gray):
+        detected.append(img.shape)
+        return list(range(9)), list(range(img.shape[0], img.shape[0] + 10))
+
+    monkeypatch.setattr(core, 'detect_grid', detect_grid)
+    small, large = np.zeros((500, 450, 3), np.uint8), np.zeros((600, 450, 3), np.uint8)
+
+    # 未标定时只为本次识别检测，不写缓存文件
+    assert core.board_recognition(small, None)[1][0] == 500
+    assert not path.exists()
+
+    core.calibrate_board(small, None)
+    assert core.get_board_data() == (list(range(9)), list(range(500, 510)), '')
+    assert recognition_core.board_cache_loaded()  # fork 前预热的内存副本
+    assert core.board_recognition(small, None)[1][0] == 500
+    assert core.board_recognition(large, None)[1][0] == 600
+    assert detected == [small.shape, small.shape, large.shape]
+
+
+def test_nearest_line_indices_handles_unsorted_lines(core):
+    indices, distances = core.nearest_line_indices([-5, 49, 51, 260], [200, 0, 100])
+    assert indices.tolist() == [1, 1, 2, 0]
+    assert distances.tolist() == [5, 49, 49, 60]
+    assert core.find_nearest_index(140, [0, 100, 200]) == 1
+
+
+def test_lattice_fit_ignores_frame_lines_and_fills_missing_lines():
+    # 多余的边框线 (4, 437)，且每条网格线被检测成两条相邻的边缘
+    coords = [4, 21, 24, 73, 76, 122, 124, 167, 170, 219, 222, 267, 270, 315, 318, 364, 366, 415, 418, 437]
+    assert utils.fit_lattice(coords, 9) == [22, 74, 123, 168, 220, 268, 316, 365, 416]
+
+    # 缺少中间一条线时由拟合的间距补齐
+    assert utils.fit_lattice([100, 150, 200, 300, 350, 400, 450, 500, 550], 10) == \
+        [100, 150, 200, 250, 300, 350, 400, 450, 500, 550]
+    # 间距的约数同样能解释所有峰，但会留下空缺的网格线，不应被选中
+    assert utils.fit_lattice([100, 200, 300, 400, 500, 600, 700, 800, 900], 9) == \
+        [100, 200, 300, 400, 500, 600, 700, 800, 900]
+    # 间距与坐标的大小没有上限
+    assert utils.fit_lattice([i * 2000000 for i in range(9)], 9) == [i * 2000000 for i in range(9)]
@@ -0,0 +1,79 @@
+import os
+
+import cv2
+import numpy as np
+
+from app.chess.board import ChessBoard
+from app.services.recognition.stream import StreamRecognizer, diff_boards, recognize_stream
+
+RESOURCES = os.path.join(os.path.dirname(__file__), 'resources')
+START = '4k4/9/9/9/9/9/9/9/4R4/4K4 w'
+AFTER_MOVE = '4k4/9/9/9/9/4R4/9/9/9/4K4 b'
+
+
+def board_array(fen):
+    return ChessBoard().fen_to_board_array(fen)
+
+
+class FakeCore:
+    def pre_processing_image(self, frame):
+        return frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def detect_grid(self, image, gray):
+        return [20 + 40 * i for i in range(9)], [20 + 40 * i for i in range(10)]
+
+
+class FakeRecognizer:
+    """棋子画在 (e1) 时识别为 START，画在 (e4) 时识别为 AFTER_MOVE"""
+
+    def __init__(self):
+        self.core = FakeCore()
+        self.calls = 0
+
+    def recognize_pieces(self, image, gray, x_array, y_array, param):
+        self.calls += 1
+        fen = START if gray[y_array[8], x_array[4]] < 100 else AFTER_MOVE
+        return {"fen": fen.split()[0] + ' w', "board_array": board_array(fen)}
+
+
+def frame(rook_row):
+    img = np.full((420, 380, 3), 200, np.uint8)
+    cv2.circle(img, (180, 20 + 40 * rook_row), 16, (0, 0, 0), -1)
+    return img
+
+
+def test_only_stable_changed_frames_are_recognized():
+    recognizer = FakeRecognizer()
+    rows = [8, 8, 8, 8, 8, 7, 6, 5, 5, 5, 5, 5]  # 走子动画经过第7、6行
+    stream = StreamRecognizer(stable_frames=3, recognizer=recognizer)
+
+    events = list(stream.run(enumerate(frame(row) for row in rows)))
+
+    assert recognizer.calls == 2
+    assert [e.kind for e in events] == ['position', 'move']
+    move = events[1]
+    assert move.frame_index == 9
+    assert (move.from_pos, move.to_pos, move.ucci) == ((4, 1), (4, 4), 'e1e4')
+    assert (move.fen_before, move.fen_after) == ('4k4/9/9/9/9/9/9/9/4R4/4K4 w', AFTER_MOVE)
+    assert stream.stats.unchanged == 4 and stream.stats.unstable == 6
+
+
+def test_move_events_apply_to_chess_board():
+    fen_before = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w'
+    fen_after = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C2C4/9/RNBAKABNR b'
+    from_pos, to_pos, piece, captured = diff_boards(board_array(fen_before), board_array(fen_after))
+
+    board = ChessBoard(fen_before)
+    assert board.pieces[from_pos].name == '炮'
+    board.move_piece(from_pos, to_pos)
+    assert board.to_fen().split()[0] == fen_after.split()[0]
+    assert (piece, captured) == ('C', None)
+
+
+def test_unexplained_changes_resynchronise_position():
+    assert diff_boards(board_array(START), board_array('9/9/9/9/9/9/9/9/9/9 w')) is None
+
+    frames = [cv2.imread(os.path.join(RESOURCES, 'test_board_for_fen.png'))] * 3
+    events = list(recognize_stream(enumerate(frames), {'platform': 'JJ'}))
+    assert [(e.kind, e.fen_after) for e in events] == [
+        ('position', '3a5/4a4/3k5/9/4P4/3C5/9/3ABA1r1/3rnpc2/4K4 w')]
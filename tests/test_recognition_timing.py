@@ -0,0 +1,43 @@
+import pytest
+
+from app.metrics import Histogram
+from app.services.recognition.timing import StageTimer, span, stage_snapshot, timed
+
+
+@timed('work')
+def work(value):
+    return value * 2
+
+
+def test_spans_and_decorated_calls_are_recorded():
+    histograms = Histogram('stage_seconds', '', ['stage'], buckets=(0.01,))
+    with StageTimer(histograms=histograms) as timer:
+        with span('grid'):
+            pass
+        assert work(2) == 4
+        assert work(3) == 6
+
+    assert set(timer.timings) == {'grid', 'work', 'total'}
+    snapshot = stage_snapshot(histograms)
+    assert snapshot['work']['count'] == 1  # 同一阶段在一次识别内累加
+    assert snapshot['total']['buckets'] == {'10': 1, '+Inf': 1}
+
+
+def test_disabled_timer_records_nothing():
+    histograms = Histogram('stage_seconds', '', ['stage'])
+    with StageTimer(enabled=False, histograms=histograms) as timer:
+        with span('grid'):
+            pass
+        assert work(1) == 2
+
+    assert timer.timings == {}
+    assert stage_snapshot(histograms) == {}
+
+
+def test_failed_recognition_is_not_aggregated():
+    histograms = Histogram('stage_seconds', '', ['stage'])
+    with pytest.raises(ValueError):
+        with StageTimer(histograms=histograms):
+            raise ValueError('boom')
+    assert stage_snapshot(histograms) == {}
+
@@ -0,0 +1,64 @@
+import pytest
+import json
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.message_queue.redis_consumer import RedisConsumer
+
+
+def move_message(game_id, step):
+    return {
+        "message_type": "chessmove_ack_msg",
+        "data": {"game": {"gameid": game_id}, "data": {"step": step}},
+        "source": "test",
+        "priority": 1
+    }
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+def test_batch_fetch_coalesces_consecutive_moves_per_game(redis_client):
+    consumer = RedisConsumer(queue_name='q', batch_size=10, max_workers=2, redis_client=redis_client)
+    handled = []
+
+    def handler(msg, coalesced=False):
+        handled.append((msg, coalesced))
+        return {"success": True, "message_type": msg["message_type"]}
+
+    consumer.set_message_handler(handler)
+    for game_id, step in [('g1', 1), ('g2', 1), ('g1', 2), ('g1', 3)]:
+        redis_client.lpush('q', json.dumps(move_message(game_id, step)))
+    assert len(consumer._fetch_messages(consumer.batch_size)) == 4
+    assert redis_client.llen('q') == 0
+
+    for game_id, step in [('g1', 1), ('g2', 1), ('g1', 2), ('g1', 3)]:
+        redis_client.lpush('q', json.dumps(move_message(game_id, step)))
+    consumer.start_consumer(max_messages=4)
+    consumer.consumer_thread.join(timeout=5)
+
+    g1 = [(m, c) for m, c in handled if m["data"]["game"]["gameid"] == 'g1']
+    g2 = [(m, c) for m, c in handled if m["data"]["game"]["gameid"] == 'g2']
+    # 同一对局按入队顺序处理，只有最后一步触发AI分析
+    assert [m["data"]["data"]["step"] for m, _ in g1] == [1, 2, 3]
+    assert [c for _, c in g1] == [True, True, False]
+    assert g2[0][1] is False
+    # 合并标记不写进消息本身（失败时原样进入错误队列）
+    assert all("coalesced" not in m for m, _ in handled)
+
+
+def test_failed_messages_in_batch_go_to_error_queue(redis_client):
+    consumer = RedisConsumer(queue_name='q', batch_size=5, redis_client=redis_client)
+    consumer.set_message_handler(lambda msg: {"success": msg["data"]["game"]["gameid"] != 'bad'})
+    redis_client.lpush('q', json.dumps(move_message('ok', 1)))
+    redis_client.lpush('q', json.dumps(move_message('bad', 1)))
+    redis_client.lpush('q', 'not json')
+
+    consumer.start_consumer(max_messages=3)
+    consumer.consumer_thread.join(timeout=5)
+
+    errors = redis_client.lrange('chess_message_error_queue', 0, -1)
+    assert len(errors) == 2
+    assert 'not json' in errors
@@ -0,0 +1,81 @@
+import pytest
+import json
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.message_queue.redis_stream_consumer import RedisStreamConsumer
+
+MESSAGE = {"message_type": "chessmove_ack_msg", "data": {"game": {"gameid": "g1"}}, "source": "test", "priority": 1}
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+def make_consumer(redis_client, name, **kwargs):
+    params = dict(consumer_name=name, retry_count=2, retry_delay=0, claim_min_idle_ms=0, redis_client=redis_client)
+    params.update(kwargs)
+    return RedisStreamConsumer(**params)
+
+
+def test_successful_message_is_acked(redis_client):
+    consumer = make_consumer(redis_client, 'c1')
+    handled = []
+    consumer.set_message_handler(lambda msg: handled.append(msg) or {"success": True})
+    consumer.publish(MESSAGE)
+
+    consumer.start_consumer(max_messages=1)
+    consumer.consumer_thread.join(timeout=5)
+
+    assert handled == [MESSAGE]
+    assert consumer.get_pending_count() == 0
+    assert redis_client.xlen(consumer.dead_letter_stream) == 0
+
+
+def test_failed_message_is_retried_then_dead_lettered(redis_client):
+    consumer = make_consumer(redis_client, 'c1')
+    attempts = []
+    consumer.set_message_handler(lambda msg: attempts.append(msg) or {"success": False, "error": "boom"})
+    consumer.publish(MESSAGE)
+
+    consumer.start_consumer(max_messages=1)
+    consumer.consumer_thread.join(timeout=5)
+
+    assert len(attempts) == 3  # 首次处理 + 2次重试
+    assert consumer.get_pending_count() == 0
+    dead = redis_client.xrange(consumer.dead_letter_stream)
+    assert len(dead) == 1
+    assert json.loads(dead[0][1]['payload']) == MESSAGE
+    assert dead[0][1]['error'] == 'boom'
+
+
+def test_pending_message_of_crashed_consumer_is_reclaimed(redis_client):
+    crashed = make_consumer(redis_client, 'crashed')
+    crashed.publish(MESSAGE)
+    # 读取但不确认，模拟处理途中进程退出
+    redis_client.xreadgroup(crashed.group_name, 'crashed', {crashed.stream_name: '>'}, count=1)
+    assert crashed.get_pending_count() == 1
+
+    survivor = make_consumer(redis_client, 'survivor')
+    handled = []
+    survivor.set_message_handler(lambda msg: handled.append(msg) or {"success": True})
+    assert survivor._reclaim_pending() == 1
+
+    assert handled == [MESSAGE]
+    assert survivor.get_pending_count() == 0
+
+
+def test_poison_message_exceeding_deliveries_goes_to_dead_letter(redis_client):
+    consumer = make_consumer(redis_client, 'c1', retry_count=0)
+    consumer.publish(MESSAGE)
+    # 第一次投递后未确认，XAUTOCLAIM再次认领时投递次数已超过上限
+    redis_client.xreadgroup(consumer.group_name, 'other', {consumer.stream_name: '>'}, count=1)
+    handled = []
+    consumer.set_message_handler(lambda msg: handled.append(msg) or {"success": True})
+
+    consumer._reclaim_pending()
+
+    assert handled == []
+    assert redis_client.xlen(consumer.dead_letter_stream) == 1
+    assert consumer.get_pending_count() == 0
@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+
+from app.engine.lazy import LazyEngine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 冷启动导入 app 的时间上限（秒），CI 机器较慢时可通过环境变量放宽
+IMPORT_BUDGET = float(os.environ.get('STARTUP_IMPORT_BUDGET', '3.0'))
+
+PROFILE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "elapsed": elapsed,
+    "engine_started": app.engine_instance.started,
+    "heavy_modules": [m for m in ('sklearn', 'scipy') if m in sys.modules],
+}))
+"""
+
+
+def test_import_app_is_fast_and_does_not_start_engine():
+    result = subprocess.run([sys.executable, '-c', PROFILE_SCRIPT], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    profile = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert profile["engine_started"] is False
+    assert profile["heavy_modules"] == []
+    assert profile["elapsed"] < IMPORT_BUDGET, profile
+
+
+def test_lazy_engine_creates_engine_once_on_first_use():
+    created = []
+
+    class FakeEngine:
+        params = {"depth": "20"}
+
+        def __init__(self):
+            created.append(self)
+
+        def close(self):
+            created.remove(self)
+
+    engine = LazyEngine(FakeEngine)
+    engine.close()
+    assert not engine.started and created == []
+
+    assert engine.params == {"depth": "20"}
+    assert engine.get() is engine.get() is created[0]
+    engine.close()
+    assert created == []
@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.chess_models import AiChess
+from app.services import upsert
+from app.services.db_service import ANALYSIS_KEY, ANALYSIS_UPDATE_COLUMNS, add_analysis_to_db
+
+FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR'
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        yield db
+
+
+def _row(move, score, **extra):
+    return dict(fen=FEN, is_move='w', move=move, chinese_move='炮二平五', source=1, score=score, **extra)
+
+
+def _scores(db):
+    return {row.move: (row.score, row.rank) for row in db.query(AiChess).all()}
+
+
+def test_upsert_updates_existing_rows_in_batches(session):
+    add_analysis_to_db(session, [_row('h2e2', 1, rank=2), _row('b0c2', 2, rank=1)])
+    # 同一批里重复的键只保留最后一条；缺少 rank 的行用列默认值
+    add_analysis_to_db(session, [_row('h2e2', 5), _row('h2e2', 7), _row('h0g2', 3, rank=4)])
+
+    assert _scores(session) == {'h2e2': (7, 0), 'b0c2': (2, 1), 'h0g2': (3, 4)}
+
+
+def test_row_by_row_fallback_for_dialects_without_upsert(session, monkeypatch):
+    monkeypatch.setattr(upsert, '_BUILDERS', {})
+    upsert.upsert_statement.cache_clear()
+    try:
+        for score in (1, 9):
+            upsert.bulk_upsert(session, AiChess, [_row('h2e2', score)], ANALYSIS_KEY, ANALYSIS_UPDATE_COLUMNS)
+        session.commit()
+    finally:
+        upsert.upsert_statement.cache_clear()
+
+    assert _scores(session) == {'h2e2': (9, 0)}
+
+
+def test_postgresql_statement_is_built_once():
+    args = ('postgresql', AiChess.__table__, ANALYSIS_KEY, ANALYSIS_UPDATE_COLUMNS)
+    stmt = upsert.upsert_statement(*args)
+
+    assert upsert.upsert_statement(*args) is stmt
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (fen, is_move, move) DO UPDATE SET' in sql
+    assert 'win_rate = excluded.win_rate' in sql
@@ -0,0 +1,82 @@
+import pytest
+
+import app.engine
+from app import app as flask_app
+from app.engine.lazy import LazyEngine
+from app.engine.session import EngineSessionPool
+from app.warmup import WarmupState, after_fork, readiness, warm_up, warmup_state
+
+
+@pytest.fixture
+def client():
+    flask_app.config.update({"TESTING": True})
+    return flask_app.test_client()
+
+
+class FakeEngine:
+    engine_available = True
+
+    def close(self):
+        raise AssertionError("engines inherited across fork must not be closed")
+
+
+def test_engine_inherited_from_parent_process_is_replaced():
+    engine = LazyEngine(FakeEngine)
+    parent_engine = engine.get()
+    engine._pid = -1  # 模拟 fork 之后的子进程
+
+    assert not engine.started
+    engine.close()  # 不属于本进程的引擎不能关闭
+    assert engine.get() is not parent_engine and engine.started
+
+    engine._pid = -1
+    engine.reset_after_fork()
+    assert engine._engine is None
+
+
+def test_session_pool_drops_inherited_engines_after_fork():
+    shared = LazyEngine(FakeEngine)
+    pool = EngineSessionPool(shared_engine=shared, max_engines=2, engine_factory=FakeEngine)
+    pool.acquire('g1')
+    pool.acquire('g2')
+
+    pool.reset_after_fork()
+
+    assert pool.assignments() == {}
+    assert pool.acquire('g3') is shared
+
+
+def test_ready_probe_reports_warm_up(client, monkeypatch):
+    if not warmup_state.caches_ready:
+        response = client.get('/api/ready')
+        assert response.status_code == 503
+        assert response.get_json()["ready"] is False
+
+    warm_up(platforms=['JJ'])
+    # 测试环境没有 pikafish，引擎启动了但不可用时不能就绪
+    if not app.engine.engine_instance.engine_available:
+        assert client.get('/api/ready').status_code == 503
+        monkeypatch.setattr(app.engine.engine_instance.get(), 'engine_available', True)
+
+    response = client.get('/api/ready')
+    assert response.status_code == 200
+    health = client.get('/api/health').get_json()
+    assert health["status"] == "healthy" and health["ready"] is True
+    assert health["engine"]["started"] is True
+    assert any(counts.get('red') for counts in health["caches"]["templates"].values())
+
+
+def test_lazy_engine_worker_is_ready_once_caches_are(monkeypatch):
+    state = WarmupState()
+    state.caches_ready = True
+    engine = LazyEngine(FakeEngine)
+    monkeypatch.setattr('app.warmup.warmup_state', state)
+    monkeypatch.setattr(app.engine, 'engine_instance', engine)
+    assert readiness()["ready"] is False
+
+    after_fork(start=False)
+    assert readiness()["ready"] is True and readiness()["engine"]["lazy"] is True
+
+    # 首次分析启动引擎之后，就绪要求引擎可用
+    monkeypatch.setattr(engine.get(), 'engine_available', False)
+    assert readiness()["ready"] is False